@@ -1,20 +1,53 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
+import time
+import hashlib
+import secrets
 from jose import JWTError, jwt
 import bcrypt
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from database import get_db
+import coordination
 import models
 
 # CHANGE THIS IN PRODUCTION
 SECRET_KEY = "supersecretkey_dev_only"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 3000 # Long expiry for prototype
+# Access tokens carry the user's role and scope, so requests are authorized
+# without a DB lookup; they are short-lived and renewed with a refresh token
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+# Long enough for officers who are offline for days
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# A rotated refresh token presented again within this window (the response
+# was lost on a bad connection) is honoured once more instead of being
+# treated as stolen
+REFRESH_REUSE_GRACE_SECONDS = int(os.environ.get("REFRESH_REUSE_GRACE_SECONDS", "60"))
+# How often each process reloads token revocations from the DB
+REVOCATION_SYNC_SECONDS = float(os.environ.get("AUTH_REVOCATION_SYNC_SECONDS", "5"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Principals of tokens issued before claims-based access tokens are looked up
+# and cached for this long (seconds); update_user/delete_user invalidate immediately
+PRINCIPAL_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL_SECONDS", "60"))
+
+# bcrypt cost factor for new hashes; existing hashes at another cost are rehashed on login
+BCRYPT_ROUNDS = int(os.environ.get("AUTH_BCRYPT_ROUNDS", "12"))
+
+# bcrypt costs 100+ ms of CPU per call, so it runs in a small thread pool
+# (bcrypt releases the GIL) instead of on the event loop; beyond
+# HASH_QUEUE_LIMIT pending checks callers get PasswordHashBusy
+HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", str(max(1, min(4, (os.cpu_count() or 1) // 2)))))
+HASH_QUEUE_LIMIT = int(os.environ.get("AUTH_HASH_QUEUE_LIMIT", str(HASH_WORKERS * 16)))
+
 def verify_password(plain_password, hashed_password):
     # Ensure bytes
     if isinstance(hashed_password, str):
@@ -22,7 +55,148 @@ def verify_password(plain_password, hashed_password):
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password)
 
 def get_password_hash(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+def needs_rehash(hashed_password) -> bool:
+    """Whether a stored hash ($2b$<cost>$...) was made with a cost other than BCRYPT_ROUNDS."""
+    try:
+        return int(str(hashed_password).split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+class PasswordHashBusy(Exception):
+    """Raised when more than HASH_QUEUE_LIMIT password checks are already pending."""
+
+
+_hash_pool = None
+_hash_pending = 0
+_hash_lock = threading.Lock()
+
+
+def _reserve() -> ThreadPoolExecutor:
+    """Count one pending hash against HASH_QUEUE_LIMIT; pair with _release."""
+    global _hash_pool, _hash_pending
+    with _hash_lock:
+        if _hash_pending >= HASH_QUEUE_LIMIT:
+            raise PasswordHashBusy("Too many password checks in progress, please retry shortly")
+        _hash_pending += 1
+        if _hash_pool is None:
+            _hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+        return _hash_pool
+
+def _release():
+    global _hash_pending
+    with _hash_lock:
+        _hash_pending -= 1
+
+async def _run_hash(fn, *args):
+    pool = _reserve()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    finally:
+        _release()
+
+def _run_hash_blocking(fn, *args):
+    pool = _reserve()
+    try:
+        return pool.submit(fn, *args).result()
+    finally:
+        _release()
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    """verify_password off the event loop. Raises PasswordHashBusy if the pool is saturated."""
+    return await _run_hash(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    """get_password_hash off the event loop. Raises PasswordHashBusy if the pool is saturated."""
+    return await _run_hash(get_password_hash, password)
+
+def verify_password_pooled(plain_password, hashed_password) -> bool:
+    """verify_password in the hash pool, for sync (threadpool) handlers. Raises PasswordHashBusy if the pool is saturated."""
+    return _run_hash_blocking(verify_password, plain_password, hashed_password)
+
+def get_password_hash_pooled(password) -> str:
+    """get_password_hash in the hash pool, for sync (threadpool) handlers. Raises PasswordHashBusy if the pool is saturated."""
+    return _run_hash_blocking(get_password_hash, password)
+
+
+# --- Login attempt limiting ---
+# Checked before any bcrypt work, so rejected attempts cost no CPU. Failures
+# are counted per username (password guessing) and per client IP (spraying
+# many usernames); plain attempts per IP bound login storms from one source.
+LOGIN_WINDOW_SECONDS = int(os.environ.get("LOGIN_WINDOW_SECONDS", "300"))
+LOGIN_MAX_FAILURES_PER_USER = int(os.environ.get("LOGIN_MAX_FAILURES_PER_USER", "5"))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get("LOGIN_MAX_FAILURES_PER_IP", "30"))
+LOGIN_MAX_ATTEMPTS_PER_IP = int(os.environ.get("LOGIN_MAX_ATTEMPTS_PER_IP", "300"))
+
+
+class _SlidingWindow:
+    """Event timestamps per key over the last `window` seconds."""
+
+    def __init__(self, limit: int, window: int):
+        self.limit = limit
+        self.window = window
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def _trimmed(self, key, now):
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    def retry_after(self, key) -> int:
+        """Seconds until `key` is under its limit again (0 if it is now)."""
+        now = time.monotonic()
+        with self._lock:
+            events = self._trimmed(key, now)
+            if events is None or len(events) < self.limit:
+                return 0
+            return max(1, int(events[len(events) - self.limit] + self.window - now) + 1)
+
+    def add(self, key):
+        now = time.monotonic()
+        with self._lock:
+            events = self._trimmed(key, now)
+            if events is None:
+                events = self._events[key] = deque()
+            events.append(now)
+            if len(self._events) > 10000:
+                # Drop keys that have gone quiet so random usernames can't grow this unbounded
+                for stale in [k for k, v in self._events.items() if v[-1] <= now - self.window]:
+                    del self._events[stale]
+
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+
+_user_failures = _SlidingWindow(LOGIN_MAX_FAILURES_PER_USER, LOGIN_WINDOW_SECONDS)
+_ip_failures = _SlidingWindow(LOGIN_MAX_FAILURES_PER_IP, LOGIN_WINDOW_SECONDS)
+_ip_attempts = _SlidingWindow(LOGIN_MAX_ATTEMPTS_PER_IP, 60)
+
+
+def login_retry_after(username: str, ip: str) -> int:
+    """0 if a login attempt may proceed, else the seconds to wait; counts the attempt against the IP."""
+    username = (username or "").strip().lower()
+    wait = max(_user_failures.retry_after(username), _ip_failures.retry_after(ip), _ip_attempts.retry_after(ip))
+    if not wait:
+        _ip_attempts.add(ip)
+    return wait
+
+def record_login_result(username: str, ip: str, success: bool):
+    username = (username or "").strip().lower()
+    if success:
+        _user_failures.reset(username)
+    else:
+        _user_failures.add(username)
+        _ip_failures.add(ip)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -34,7 +208,262 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def _scope_set(value) -> frozenset:
+    """Comma-separated scope column -> normalized set (lower case, \u00a0 -> ' '), as build_works_query matches."""
+    return frozenset(v.strip().lower().replace('\u00a0', ' ') for v in (value or "").split(",") if v.strip())
+
+
+class Principal:
+    """
+    The authenticated user as handlers see it: the User columns they read plus
+    the scope strings parsed once. Built from the access token's claims (or,
+    for older tokens, the User row). Detached from any session - never modify
+    it or add it to one; load the User row for that (e.g. for its password hash).
+    """
+
+    def __init__(self, id: int, username: str, role: str, department=None, is_active=True,
+                 allowed_blocks=None, allowed_panchayats=None, allowed_agencies=None):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.department = department
+        self.is_active = is_active
+        self.allowed_blocks = allowed_blocks
+        self.allowed_panchayats = allowed_panchayats
+        self.allowed_agencies = allowed_agencies
+        self.scope_agencies = _scope_set(allowed_agencies)
+        self.scope_blocks = _scope_set(allowed_blocks)
+        self.scope_panchayats = _scope_set(allowed_panchayats)
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(user.id, user.username, user.role, user.department, user.is_active,
+                   user.allowed_blocks, user.allowed_panchayats, user.allowed_agencies)
+
+    @classmethod
+    def from_claims(cls, payload: dict) -> "Principal":
+        return cls(payload["uid"], payload["sub"], payload.get("role"), payload.get("dept"), True,
+                   payload.get("blk"), payload.get("gp"), payload.get("agy"))
+
+
+def scope_sets(user) -> tuple:
+    """(agencies, blocks, panchayats) normalized scope sets of a Principal or User."""
+    if isinstance(user, Principal):
+        return user.scope_agencies, user.scope_blocks, user.scope_panchayats
+    return _scope_set(user.allowed_agencies), _scope_set(user.allowed_blocks), _scope_set(user.allowed_panchayats)
+
+
+def create_user_access_token(user: models.User) -> str:
+    """Short-lived access token whose claims are enough to authorize requests (see Principal.from_claims)."""
+    claims = {
+        "sub": user.username,
+        "uid": user.id,
+        "role": user.role,
+        "dept": user.department,
+        "blk": user.allowed_blocks,
+        "gp": user.allowed_panchayats,
+        "agy": user.allowed_agencies,
+        "iat": round(time.time(), 3),  # sub-second, compared against revocation times
+        "typ": "access",
+    }
+    return create_access_token(claims, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+
+# --- Refresh tokens ---
+
+def _token_hash(token: str) -> str:
+    # Random 256-bit tokens: a plain SHA-256 is enough (no bcrypt cost on every refresh)
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def issue_refresh_token(db: Session, user_id: int) -> tuple:
+    """(plain token for the client, RefreshToken row added to the session)."""
+    token = secrets.token_urlsafe(32)
+    row = models.RefreshToken(
+        user_id=user_id, token_hash=_token_hash(token),
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    db.add(row)
+    return token, row
+
+
+class InvalidRefreshToken(Exception):
+    """Unknown, expired or revoked refresh token."""
+
+
+def rotate_refresh_token(db: Session, token: str) -> tuple:
+    """
+    Exchange a refresh token for a new one (the old one is revoked).
+
+    Returns:
+        (User, new plain refresh token); the caller commits.
+    Raises:
+        InvalidRefreshToken. Presenting an already rotated token after the
+        grace window revokes every refresh token of its user - it was copied.
+    """
+    now = datetime.utcnow()
+    row = db.query(models.RefreshToken).filter(models.RefreshToken.token_hash == _token_hash(token)).first()
+    if row is None or row.expires_at < now:
+        raise InvalidRefreshToken("Invalid or expired refresh token")
+    # Claim the token with a conditional update, so two concurrent refreshes can't both rotate it
+    claimed = db.query(models.RefreshToken).filter(
+        models.RefreshToken.id == row.id, models.RefreshToken.revoked_at == None
+    ).update({"revoked_at": now}, synchronize_session=False) == 1
+    db.refresh(row)
+    if not claimed:
+        grace = row.replaced_by_id is not None and (now - row.revoked_at).total_seconds() <= REFRESH_REUSE_GRACE_SECONDS
+        if not grace:
+            revoke_refresh_tokens(db, row.user_id)
+            db.commit()
+            raise InvalidRefreshToken("Refresh token was already used")
+        # The client never received the replacement: retire it and issue another
+        db.query(models.RefreshToken).filter(
+            models.RefreshToken.id == row.replaced_by_id, models.RefreshToken.revoked_at == None
+        ).update({"revoked_at": now}, synchronize_session=False)
+
+    user = db.query(models.User).filter(models.User.id == row.user_id).first()
+    if user is None or not user.is_active:
+        db.rollback()
+        raise InvalidRefreshToken("Account is deactivated")
+    new_token, new_row = issue_refresh_token(db, user.id)
+    db.flush()
+    row.replaced_by_id = new_row.id
+    return user, new_token
+
+
+def revoke_refresh_token(db: Session, token: str):
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == _token_hash(token), models.RefreshToken.revoked_at == None
+    ).update({"revoked_at": datetime.utcnow()})
+
+
+def revoke_refresh_tokens(db: Session, user_id: int):
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.user_id == user_id, models.RefreshToken.revoked_at == None
+    ).update({"revoked_at": datetime.utcnow()})
+
+
+# --- Access token revocation ---
+# Access tokens are never looked up, so cutting one off early means rejecting
+# tokens of that user issued before a point in time. Those cutoffs live in
+# token_revocations and are mirrored in memory; each process reloads them at
+# most every REVOCATION_SYNC_SECONDS. Only cutoffs younger than the access
+# token lifetime can matter, so the set stays small.
+
+_revoked = {}          # user id -> cutoff (epoch seconds)
+_revoked_synced_at = None
+_revoked_lock = threading.Lock()
+
+
+def revoke_access_tokens(db: Session, user_id: int):
+    """Reject the user's current access tokens (their claims are stale); the caller commits."""
+    now = datetime.utcnow()
+    row = db.query(models.TokenRevocation).filter(models.TokenRevocation.user_id == user_id).first()
+    if row is None:
+        db.add(models.TokenRevocation(user_id=user_id, revoked_at=now))
+    else:
+        row.revoked_at = now
+    with _revoked_lock:
+        _revoked[user_id] = time.time()
+
+
+def _sync_revocations(db: Session):
+    global _revoked, _revoked_synced_at
+    now = time.monotonic()
+    if _revoked_synced_at is not None and now - _revoked_synced_at < REVOCATION_SYNC_SECONDS:
+        return
+    _revoked_synced_at = now
+    since = datetime.utcnow() - timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    rows = db.query(models.TokenRevocation.user_id, models.TokenRevocation.revoked_at).filter(
+        models.TokenRevocation.revoked_at >= since
+    ).all()
+    epoch = datetime(1970, 1, 1)
+    loaded = {user_id: (revoked_at - epoch).total_seconds() for user_id, revoked_at in rows}
+    with _revoked_lock:
+        # Keep local revocations newer than what the DB returned (not committed yet / just written)
+        for user_id, cutoff in _revoked.items():
+            if cutoff > loaded.get(user_id, 0) and cutoff >= time.time() - ACCESS_TOKEN_EXPIRE_MINUTES * 60:
+                loaded[user_id] = cutoff
+        _revoked = loaded
+
+
+def _is_revoked(user_id: int, issued_at) -> bool:
+    cutoff = _revoked.get(user_id)
+    return cutoff is not None and (issued_at is None or issued_at < cutoff)
+
+
+def gc(db: Session) -> int:
+    """Delete expired refresh tokens and revocations older than any live access token."""
+    removed = db.query(models.RefreshToken).filter(models.RefreshToken.expires_at < datetime.utcnow()).delete()
+    db.query(models.TokenRevocation).filter(
+        models.TokenRevocation.revoked_at < datetime.utcnow() - timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    ).delete()
+    db.commit()
+    return removed
+
+
+# --- Principals of older tokens (no claims): cached User lookups ---
+# Any write to users marks the cache stale in the other worker processes too
+# (coordination cache versions); those drop all their cached principals.
+
+PRINCIPAL_CACHE_NAME = "principals"
+
+_principals = {}     # username -> (Principal, expiry on the monotonic clock)
+_user_versions = {}  # username -> invalidation count; a load racing an invalidation isn't cached
+_principals_generation = 0  # same, for dropping them all
+_principals_lock = threading.Lock()
+
+
+def invalidate_user(username: str):
+    """Drop the cached principal after the user's row changed (call after committing)."""
+    with _principals_lock:
+        _principals.pop(username, None)
+        _user_versions[username] = _user_versions.get(username, 0) + 1
+
+
+def _drop_principals():
+    global _principals_generation
+    with _principals_lock:
+        _principals.clear()
+        _principals_generation += 1
+
+
+coordination.register_cache(PRINCIPAL_CACHE_NAME, _drop_principals)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    if any(isinstance(obj, models.User) for objects in (session.new, session.dirty, session.deleted) for obj in objects):
+        coordination.bump_cache(session, PRINCIPAL_CACHE_NAME)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_orm_execute(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is models.User:
+            coordination.bump_cache(orm_execute_state.session, PRINCIPAL_CACHE_NAME)
+
+
+def _load_principal(db: Session, username: str):
+    coordination.sync_caches(db)
+    now = time.monotonic()
+    with _principals_lock:
+        cached = _principals.get(username)
+        if cached and cached[1] > now:
+            return cached[0]
+        version = (_principals_generation, _user_versions.get(username, 0))
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if user is None:
+        return None
+    principal = Principal.from_user(user)
+    with _principals_lock:
+        if (_principals_generation, _user_versions.get(username, 0)) == version:
+            _principals[username] = (principal, now + PRINCIPAL_CACHE_TTL)
+    return principal
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -47,11 +476,18 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if user is None:
+
+    _sync_revocations(db)
+    if "uid" in payload:
+        if _is_revoked(payload["uid"], payload.get("iat")):
+            raise credentials_exception  # the client refreshes and gets current claims (or is refused)
+        return Principal.from_claims(payload)
+
+    user = _load_principal(db, username)
+    if user is None or _is_revoked(user.id, payload.get("iat")):
         raise credentials_exception
     # Reject inactive users
-    if hasattr(user, 'is_active') and not user.is_active:
+    if not user.is_active:
         raise HTTPException(status_code=403, detail="Account is deactivated")
     return user
 
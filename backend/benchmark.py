@@ -0,0 +1,563 @@
+"""
+Performance benchmarks for backend hot paths.
+
+Usage:
+    python benchmark.py                 # run all benchmarks
+    python benchmark.py route_planner   # run one benchmark
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+BLOCKS = ["DANTEWADA", "GEEDAM", "KUWAKONDA", "KATEKALYAN", "BARSOOR"]
+STATUSES = ["Completed", "In Progress", "Not Started", "CC Not Come in DMF", "Cancelled"]
+AGENCIES = [
+    "CEO JANPAND PANCHAYAT DANTEWADA",
+    "CEO JANPAND PANCHAYAT GEEDAM",
+    "RES Dantewada",
+    "PWD S.B. Div. Dantewada",
+]
+
+
+def timed(label, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<45} {elapsed * 1000:9.1f} ms")
+    return result
+
+
+def peak_memory(label, fn, *args, **kwargs):
+    """Run `fn` under tracemalloc and report the peak Python allocation."""
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        result = fn(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    print(f"{label:<45} {peak / 1024 / 1024:9.1f} MB peak")
+    return result
+
+
+def synthetic_session(n_works, n_inspections=0, path=None):
+    """Session on a throwaway SQLite file (or `path`) seeded with `n_works` random works."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from ingester import BLOCK_CENTERS
+    import models
+
+    path = path or os.path.join(tempfile.mkdtemp(prefix="dantewada_bench_"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    rng = random.Random(7)
+    coords = []
+    batch = []
+    for i in range(n_works):
+        block = rng.choice(BLOCKS)
+        lat, lng = BLOCK_CENTERS[block]
+        batch.append({
+            "work_code": f"BENCH{i}",
+            "department": rng.choice(["Education", "Health", "PWD", "Panchayat"]),
+            "financial_year": rng.choice(["2022-23", "2023-24", "2024-25"]),
+            "block": block,
+            "panchayat": f"GP{rng.randint(1, 40)}",
+            "work_name": f"Construction of building no. {i}",
+            "sanctioned_amount": round(rng.uniform(1, 50), 2),
+            "sanctioned_date": datetime(2022, 4, 1) + timedelta(days=rng.randint(0, 1000)),
+            "current_status": rng.choice(STATUSES),
+            "agency_name": rng.choice(AGENCIES),
+            "latitude": lat + rng.uniform(-0.15, 0.15),
+            "longitude": lng + rng.uniform(-0.15, 0.15),
+        })
+        coords.append((batch[-1]["latitude"], batch[-1]["longitude"]))
+        if len(batch) == 10000:
+            db.bulk_insert_mappings(models.Work, batch)
+            batch = []
+    if batch:
+        db.bulk_insert_mappings(models.Work, batch)
+
+    batch = []
+    for i in range(n_inspections):
+        # Mostly on-site fixes with a few percent of stray ones
+        work_id = rng.randint(1, n_works)
+        lat, lng = coords[work_id - 1]
+        spread = 0.5 if rng.random() < 0.03 else 0.004
+        batch.append({
+            "work_id": work_id,
+            "inspector_name": "bench",
+            "status_at_time": "In Progress",
+            "latitude": lat + rng.uniform(-spread, spread),
+            "longitude": lng + rng.uniform(-spread, spread),
+            "inspection_date": datetime(2025, 1, 1) + timedelta(minutes=i),
+        })
+        if len(batch) == 10000:
+            db.bulk_insert_mappings(models.Inspection, batch)
+            batch = []
+    if batch:
+        db.bulk_insert_mappings(models.Inspection, batch)
+    db.commit()
+    return db
+
+
+def bench_route_planner():
+    """Route planning over 50/200/500 random stops spread across the district."""
+    import route_planner
+
+    rng = random.Random(42)
+    start = (18.8956, 81.3503)
+    for n in (50, 200, 500):
+        stops = [
+            {"work_id": i, "latitude": 18.70 + rng.random() * 0.45, "longitude": 81.25 + rng.random() * 0.35}
+            for i in range(n)
+        ]
+        plan = timed(f"route_planner.plan_route ({n} stops)", route_planner.plan_route, start, stops)
+        print(f"    total {plan['total_distance_km']} km over {len(plan['days'])} days")
+
+
+def bench_gps_check():
+    """Inline GPS check latency and a batch scan over 100k inspections."""
+    import gps_check
+    import models
+
+    db = synthetic_session(20000, n_inspections=100000)
+    work = db.query(models.Work).first()
+    start = time.perf_counter()
+    for _ in range(10000):
+        gps_check.check_inspection(work, 18.91, 81.34)
+    per_call = (time.perf_counter() - start) / 10000
+    print(f"{'gps_check.check_inspection (per call)':<45} {per_call * 1e6:9.1f} us")
+
+    result = timed("gps_check.scan_inspections (100k)", gps_check.scan_inspections, db)
+    print(f"    flagged {result['flagged']} of {result['scanned']}")
+    db.close()
+
+
+def bench_village_summary():
+    """Village summary: grouped SQL over works vs. rollup read at 10k/100k/500k works."""
+    import rollups
+
+    for n in (10000, 100000, 500000):
+        db = synthetic_session(n)
+        timed(f"rollups.village_summary_live ({n})", rollups.village_summary_live, db)
+        timed(f"rollups.village_summary_live panchayat view", rollups.village_summary_live, db, None, None, True)
+        timed(f"rollups.rebuild ({n})", rollups.rebuild, db)
+        timed(f"rollups.village_summary ({n})", rollups.village_summary, db)
+        timed(f"rollups.work_stats ({n})", rollups.work_stats, db)
+        db.close()
+
+
+def bench_export_xlsx():
+    """Write-only XLSX export of 20k and 200k works: time and peak memory."""
+    import exporters
+    import models
+
+    for n in (20000, 200000):
+        db = synthetic_session(n)
+        path = exporters.temp_path(".xlsx")
+        timed(f"exporters.write_works_xlsx ({n})", exporters.write_works_xlsx, db.query(models.Work), path)
+        print(f"    {os.path.getsize(path) / 1024 / 1024:.1f} MB file")
+        peak_memory(f"exporters.write_works_xlsx ({n})", exporters.write_works_xlsx, db.query(models.Work), path)
+        os.remove(path)
+        db.close()
+
+
+def bench_export_formats():
+    """CSV / NDJSON / Parquet export of 200k works: time, output size and peak memory."""
+    from sqlalchemy.orm import sessionmaker
+    import exporters
+    import models
+
+    n = 200000
+    db = synthetic_session(n)
+    factory = sessionmaker(bind=db.get_bind())
+
+    def drain(stream):
+        return sum(len(chunk) for chunk in stream)
+
+    for name, stream in (("csv", exporters.stream_works_csv), ("ndjson", exporters.stream_works_ndjson)):
+        size = timed(f"exporters.stream_works_{name} ({n})", drain, stream(db.query(models.Work), session_factory=factory))
+        print(f"    {size / 1024 / 1024:.1f} MB streamed")
+        peak_memory(f"exporters.stream_works_{name} ({n})", drain, stream(db.query(models.Work), session_factory=factory))
+
+    path = exporters.temp_path(".parquet")
+    timed(f"exporters.write_works_parquet ({n})", exporters.write_works_parquet, db.query(models.Work), path)
+    print(f"    {os.path.getsize(path) / 1024 / 1024:.1f} MB file")
+    peak_memory(f"exporters.write_works_parquet ({n})", exporters.write_works_parquet, db.query(models.Work), path)
+    os.remove(path)
+    db.close()
+
+
+def synthetic_photos(db, photos_per_work=3):
+    """A distinct thumbnail-sized JPEG on disk for each of `photos_per_work` photos of every work in `db`."""
+    from PIL import Image
+    import models
+
+    photo_dir = tempfile.mkdtemp(prefix="dantewada_bench_photos_")
+    mappings = []
+    for (work_id,) in db.query(models.Work.id):
+        for k in range(photos_per_work):
+            path = os.path.join(photo_dir, f"thumb_{work_id}_{k}.jpg")
+            Image.effect_noise((100, 75), 30 + (work_id + k) % 60).convert("RGB").resize((400, 300)).save(path, "JPEG", quality=80)
+            mappings.append({
+                "work_id": work_id, "image_path": path, "thumbnail_path": path, "category": "During",
+                "uploaded_by": "bench", "uploaded_at": datetime(2025, 1, 1) + timedelta(minutes=k)
+            })
+    db.bulk_insert_mappings(models.WorkPhoto, mappings)
+    db.commit()
+    return photo_dir
+
+
+def bench_pdf_report():
+    """Illustrated PDF for 5,000 works: photo pre-scaling (cold/warm cache) and serial vs pooled rendering."""
+    import shutil
+    import exporters
+    import models
+    import pdf_generator
+    from disk_cache import DiskCache
+
+    n = 5000
+    db = synthetic_session(n)
+    photo_dir = synthetic_photos(db)
+    pdf_generator.print_cache = DiskCache(tempfile.mkdtemp(prefix="dantewada_bench_pdfcache_"), pdf_generator.PRINT_CACHE_MAX_BYTES)
+    data = timed(f"exporters.works_pdf_data ({n})", exporters.works_pdf_data, db, db.query(models.Work), n)
+
+    # The shared pool is sized from PDF_WORKERS when first used: at least 2 for the pooled runs
+    pdf_generator.PDF_WORKERS = workers = max(pdf_generator.PDF_WORKERS, 2)
+    timed(f"prepare_photos cold ({workers} workers)", pdf_generator.prepare_photos, data, workers)
+    timed("prepare_photos warm", pdf_generator.prepare_photos, data, workers)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="dantewada_bench_pdf_"), "report.pdf")
+    timed(f"build_visual_pdf_file ({n}, serial)", pdf_generator.build_visual_pdf_file, data, path, 1)
+    print(f"    {os.path.getsize(path) / 1024 / 1024:.1f} MB file")
+    timed(f"build_visual_pdf_file ({n}, {workers} workers)", pdf_generator.build_visual_pdf_file, data, path, workers)
+    print(f"    {os.path.getsize(path) / 1024 / 1024:.1f} MB file")
+    shutil.rmtree(pdf_generator.print_cache.directory)
+    shutil.rmtree(photo_dir)
+    db.close()
+
+
+def bench_inspection_status():
+    """Inspection status report over 200k works (half assigned): SQL aggregation and the full workbook."""
+    import exporters
+    import models
+
+    n = 200000
+    db = synthetic_session(n, n_inspections=200000)
+    rng = random.Random(5)
+    db.add(models.User(username="bench_officer", hashed_password="x", role="officer"))
+    db.flush()
+    db.query(models.Work).filter(models.Work.id % 2 == 0).update({"assigned_officer_id": 1}, synchronize_session=False)
+    db.bulk_insert_mappings(models.WorkPhoto, [
+        {"work_id": rng.randint(1, n), "image_path": "x.jpg", "thumbnail_path": "x_thumb.jpg"} for _ in range(150000)
+    ])
+    db.commit()
+
+    summary, detail = exporters.inspection_status_queries(db, db.query(models.Work))
+    rows = timed(f"inspection status summary query ({n})", lambda: summary.all())
+    print(f"    {len(rows)} agencies")
+    count = timed(f"inspection status detail rows ({n})", lambda: sum(1 for _ in detail.execution_options(stream_results=True).yield_per(exporters.BATCH_SIZE)))
+    print(f"    {count} assigned works")
+
+    path = exporters.temp_path(".xlsx")
+    timed(f"exporters.write_inspection_status_xlsx ({n})", exporters.write_inspection_status_xlsx, db, path)
+    peak_memory(f"exporters.write_inspection_status_xlsx ({n})", exporters.write_inspection_status_xlsx, db, path)
+    os.remove(path)
+    db.close()
+
+
+def synthetic_phone_photo(width=4000, height=3000, seed=0) -> bytes:
+    """A 12 MP JPEG with camera-like entropy (smooth detail plus sensor noise)."""
+    from io import BytesIO
+    from PIL import Image, ImageChops
+
+    base = Image.effect_noise((width // 8, height // 8), 60 + seed % 30).convert("RGB").resize((width, height), Image.BICUBIC)
+    grain = Image.effect_noise((width, height), 6).convert("RGB")
+    buf = BytesIO()
+    ImageChops.add(base, grain, scale=1.0, offset=-128).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def bench_upload_concurrency():
+    """Event-loop stall (latency every other request sees) while 4 uploads x 4 12 MP photos are processed: inline vs pool."""
+    import asyncio
+    import image_utils
+
+    photo = synthetic_phone_photo()
+    os.chdir(tempfile.mkdtemp(prefix="dantewada_bench_uploads_"))  # process_upload writes under ./uploads
+    requests, per_request = 4, 4
+    image_utils.IMAGE_QUEUE_LIMIT = max(image_utils.IMAGE_QUEUE_LIMIT, requests * per_request)
+
+    async def measure(label, work):
+        lags, done = [], asyncio.Event()
+
+        async def heartbeat():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append((time.perf_counter() - start - 0.01) * 1000)
+
+        beat = asyncio.create_task(heartbeat())
+        start = time.perf_counter()
+        await work()
+        elapsed = time.perf_counter() - start
+        done.set()
+        await beat
+        lags.sort()
+        print(f"{label:<45} {elapsed * 1000:9.1f} ms  loop lag p50 {lags[len(lags) // 2]:.1f} ms, "
+              f"p99 {lags[int(len(lags) * 0.99)]:.1f} ms, max {lags[-1]:.1f} ms")
+
+    async def inline_request():
+        for _ in range(per_request):
+            image_utils.process_upload(photo, "photo.jpg")  # old behaviour: inline in the async handler
+
+    async def pooled_request():
+        # As a sync upload handler does: wait on the pool from a worker thread
+        await asyncio.to_thread(image_utils.process_uploads, [(photo, "photo.jpg")] * per_request)
+
+    async def run():
+        await asyncio.to_thread(image_utils.process_uploads, [(photo, "warmup.jpg")])  # start the worker processes
+        await measure(f"inline ({requests}x{per_request} photos)", lambda: asyncio.gather(*[inline_request() for _ in range(requests)]))
+        await measure(f"process pool ({requests}x{per_request} photos, {image_utils.IMAGE_WORKERS} workers)", lambda: asyncio.gather(*[pooled_request() for _ in range(requests)]))
+
+    asyncio.run(run())
+
+
+def _legacy_photo_pipeline(file_bytes):
+    """The pre-draft upload pipeline: full-resolution decode, copy, two LANCZOS resizes from full size."""
+    from io import BytesIO
+    from PIL import Image
+    import image_utils
+
+    img = Image.open(BytesIO(file_bytes)).convert("RGB")
+    img = image_utils.fix_orientation(img, image_utils.exif_orientation(Image.open(BytesIO(file_bytes))))
+    w, h = img.size
+    full = img.resize((image_utils.MAX_WIDTH, int(h * image_utils.MAX_WIDTH / w)), Image.LANCZOS) if w > image_utils.MAX_WIDTH else img.copy()
+    full.save(BytesIO(), "JPEG", quality=image_utils.JPEG_QUALITY, optimize=True)
+    thumb = img.resize((image_utils.THUMB_WIDTH, int(h * image_utils.THUMB_WIDTH / w)), Image.LANCZOS)
+    thumb.save(BytesIO(), "JPEG", quality=80, optimize=True)
+
+
+def _current_photo_pipeline(file_bytes):
+    from io import BytesIO
+    from PIL import Image
+    import image_utils
+
+    full = image_utils.decode_scaled(file_bytes, image_utils.MAX_WIDTH)
+    full.save(BytesIO(), "JPEG", quality=image_utils.JPEG_QUALITY, optimize=True)
+    thumb = full.resize((image_utils.THUMB_WIDTH, int(full.size[1] * image_utils.THUMB_WIDTH / full.size[0])), Image.LANCZOS, reducing_gap=3.0)
+    thumb.save(BytesIO(), "JPEG", quality=80, optimize=True)
+
+
+def _rss_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _photo_pipeline_stats(pipeline, paths):
+    """
+    Child process: CPU seconds per photo and the largest per-photo RSS peak
+    above the resident baseline (MB) of `pipeline` over the files in `paths`.
+    Linux only for the memory figure: the high-water mark is reset per photo via clear_refs.
+    """
+    cpu, peak = 0.0, 0.0
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+        baseline = _rss_mb("VmRSS")
+        start = time.process_time()
+        pipeline(data)
+        cpu += time.process_time() - start
+        peak = max(peak, _rss_mb("VmHWM") - baseline)
+    return cpu / len(paths), peak
+
+
+def bench_photo_decode():
+    """
+    Per-photo CPU time and peak memory of the upload pipeline, legacy vs draft/reduce.
+    Uses the JPEGs in $BENCH_PHOTO_DIR (e.g. real phone photos) if set, else synthetic 12 MP photos.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    import shutil
+
+    photo_dir = os.environ.get("BENCH_PHOTO_DIR")
+    own_dir = not photo_dir
+    if photo_dir:
+        paths = sorted(os.path.join(photo_dir, n) for n in os.listdir(photo_dir) if n.lower().endswith((".jpg", ".jpeg")))
+    else:
+        photo_dir = tempfile.mkdtemp(prefix="bench_photos_")
+        paths = []
+        for i in range(6):
+            paths.append(os.path.join(photo_dir, f"{i}.jpg"))
+            with open(paths[-1], "wb") as f:
+                f.write(synthetic_phone_photo(seed=i))
+    print(f"    {len(paths)} photos, {sum(os.path.getsize(p) for p in paths) / len(paths) / 1024 / 1024:.1f} MB average")
+
+    for label, pipeline in (("legacy pipeline", _legacy_photo_pipeline), ("draft/reduce pipeline", _current_photo_pipeline)):
+        # Fresh process per pipeline so peak RSS is not shared
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            cpu, peak = pool.submit(_photo_pipeline_stats, pipeline, paths).result()
+        print(f"{label:<45} {cpu * 1000:9.1f} ms CPU/photo  {peak:7.1f} MB peak RSS per photo")
+
+    if own_dir:
+        shutil.rmtree(photo_dir, ignore_errors=True)
+
+
+def _load(port, path, headers, clients, seconds):
+    """`clients` threads requesting `path` back to back for `seconds`: (requests/s, sorted latencies in ms)."""
+    import http.client
+    import threading
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status != 200:
+                errors.append(response.status)
+        conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        print(f"    {len(errors)} failed requests (e.g. HTTP {errors[0]})")
+    return len(latencies) / (time.perf_counter() - start), sorted(latencies)
+
+
+def _percentiles(latencies):
+    if not latencies:
+        return "no requests"
+    return f"p50 {latencies[len(latencies) // 2]:7.1f} ms, p99 {latencies[int(len(latencies) * 0.99)]:7.1f} ms"
+
+
+def _server(data_dir, workers=1):
+    """Start uvicorn on `data_dir` with `workers` processes: (process, port, admin auth headers)."""
+    import http.client
+    import json
+    import socket
+    import subprocess
+    from urllib.parse import urlencode
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env={**os.environ, "DATA_DIR": data_dir},
+    )
+    for _ in range(600):
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                break
+        except OSError:
+            time.sleep(0.1)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.request("POST", "/api/token", body=urlencode({"username": "admin", "password": "admin123"}),
+                 headers={"Content-Type": "application/x-www-form-urlencoded"})
+    return server, port, {"Authorization": "Bearer " + json.loads(conn.getresponse().read())["access_token"]}
+
+
+def bench_request_concurrency():
+    """
+    A real server (uvicorn subprocess on a synthetic 50k-work database) under
+    1-16 concurrent clients: requests/s of a DB-bound work search, then the
+    latency of a DB-free request (/users/me) while 8 clients keep searching.
+    """
+    import threading
+
+    data_dir = tempfile.mkdtemp(prefix="dantewada_bench_server_")
+    synthetic_session(50000, path=os.path.join(data_dir, "dantewada_works.db")).close()
+    server, port, headers = _server(data_dir)
+    try:
+        search = "/api/works?search=building%20no.%201&limit=100"
+        _load(port, search, headers, 1, 1)  # warm up
+        for clients in (1, 2, 4, 8, 16):
+            rate, latencies = _load(port, search, headers, clients, 5)
+            print(f"{f'GET /works search, {clients} clients':<45} {rate:9.1f} req/s  {_percentiles(latencies)}")
+
+        background = {}
+        loader = threading.Thread(target=lambda: background.update(result=_load(port, search, headers, 8, 6)))
+        loader.start()
+        time.sleep(0.5)
+        rate, latencies = _load(port, "/api/users/me", headers, 1, 5)
+        loader.join()
+        print(f"{'GET /users/me, during 8-client search load':<45} {rate:9.1f} req/s  {_percentiles(latencies)}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def bench_worker_scaling():
+    """
+    Requests/s of the DB-bound work search with 16 clients against 1, 2 and 4
+    uvicorn worker processes (bounded by the machine's cores), and which
+    workers held the scheduler lease.
+    """
+    import sqlite3
+
+    data_dir = tempfile.mkdtemp(prefix="dantewada_bench_workers_")
+    synthetic_session(50000, path=os.path.join(data_dir, "dantewada_works.db")).close()
+    print(f"    {os.cpu_count()} CPU(s)")
+    search = "/api/works?search=building%20no.%201&limit=100"
+    for workers in (1, 2, 4):
+        server, port, headers = _server(data_dir, workers)
+        try:
+            _load(port, search, headers, workers, 2)  # warm up every worker
+            rate, latencies = _load(port, search, headers, 16, 8)
+            print(f"{f'GET /works search, {workers} worker(s)':<45} {rate:9.1f} req/s  {_percentiles(latencies)}")
+        finally:
+            server.terminate()
+            server.wait()
+        with sqlite3.connect(os.path.join(data_dir, "dantewada_works.db")) as conn:
+            holders = conn.execute("SELECT holder FROM worker_leases WHERE name = 'scheduler'").fetchall()
+        print(f"    scheduler lease: {holders[0][0] if holders else None}")
+
+
+BENCHMARKS = {
+    "route_planner": bench_route_planner,
+    "gps_check": bench_gps_check,
+    "village_summary": bench_village_summary,
+    "export_xlsx": bench_export_xlsx,
+    "export_formats": bench_export_formats,
+    "pdf_report": bench_pdf_report,
+    "inspection_status": bench_inspection_status,
+    "upload_concurrency": bench_upload_concurrency,
+    "photo_decode": bench_photo_decode,
+    "request_concurrency": bench_request_concurrency,
+    "worker_scaling": bench_worker_scaling,
+}
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        print(f"== {name}")
+        BENCHMARKS[name]()
@@ -7,6 +7,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database import SessionLocal
 import models
+import data_version  # registers the version-bump session events
+import delta_sync  # registers the change-log session events
 
 def bulk_auto_assign():
     db = SessionLocal()
@@ -0,0 +1,163 @@
+"""
+Coordination between server worker processes.
+
+The app may run as several processes (uvicorn --workers N, or more than one
+container on the same DATA_DIR and database). Each has its own scheduler,
+in-process caches and threads, so three things are shared through the
+database or the data directory:
+
+- Leader lease: scheduled jobs run only in the worker holding the
+  "scheduler" lease. The holder renews it every LEASE_SECONDS / 3; if it
+  dies, another worker takes over once the lease expires.
+- Cache versions: an in-process cache registers a name and a callback that
+  drops it. bump_cache() increments the name's version row in
+  system_metadata inside the writer's transaction; every process compares
+  the versions with the ones it last saw (at most every CACHE_SYNC_SECONDS,
+  when a cache is used) and drops the caches whose version moved.
+- File locks: work on shared files (startup schema creation, offline bundle
+  builds, resumable upload chunks) is serialized across processes with flock.
+"""
+
+import fcntl
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, String, case, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# --- Leader lease ---
+
+LEASE_SECONDS = int(os.environ.get("SCHEDULER_LEASE_SECONDS", "60"))
+RENEW_SECONDS = LEASE_SECONDS / 3
+SCHEDULER_LEASE = "scheduler"
+
+_lease_table = models.WorkerLease.__table__
+_held = {}  # lease name -> monotonic time until which this worker may act as holder
+_held_lock = threading.Lock()
+
+
+def acquire_lease(db: Session, name: str) -> bool:
+    """
+    Take or renew lease `name` for this worker, unless another worker holds
+    an unexpired one. Commits. Returns whether this worker holds it now.
+    """
+    started = time.monotonic()
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=LEASE_SECONDS)
+    stmt = insert(_lease_table).values(name=name, holder=WORKER_ID, acquired_at=now, expires_at=expires_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[_lease_table.c.name],
+        set_={
+            "holder": WORKER_ID,
+            "expires_at": expires_at,
+            "acquired_at": case((_lease_table.c.holder == WORKER_ID, _lease_table.c.acquired_at), else_=now),
+        },
+        where=(_lease_table.c.holder == WORKER_ID) | (_lease_table.c.expires_at < now),
+    )
+    db.execute(stmt)
+    held = db.execute(select(_lease_table.c.holder).where(_lease_table.c.name == name)).scalar() == WORKER_ID
+    db.commit()
+    with _held_lock:
+        if held:
+            # Act as holder for only half the lease, measured from before the write on
+            # the local clock: the rest is margin for clock skew between machines
+            _held[name] = started + LEASE_SECONDS / 2
+        else:
+            _held.pop(name, None)
+    return held
+
+
+def holds_lease(name: str) -> bool:
+    return _held.get(name, 0) > time.monotonic()
+
+
+def release_lease(db: Session, name: str):
+    """Give the lease up (on shutdown) so another worker can take it right away. Commits."""
+    with _held_lock:
+        _held.pop(name, None)
+    db.execute(update(_lease_table).where(
+        _lease_table.c.name == name, _lease_table.c.holder == WORKER_ID
+    ).values(expires_at=datetime.utcnow()))
+    db.commit()
+
+
+# --- Cache versions ---
+
+CACHE_SYNC_SECONDS = float(os.environ.get("CACHE_SYNC_SECONDS", "2"))
+CACHE_KEY_PREFIX = "cache_version:"
+
+_meta_table = models.SystemMetadata.__table__
+_caches = {}  # cache name -> callback dropping this process's copy
+_seen = {}    # cache name -> version this process last saw (absent: never bumped)
+_synced_at = None
+_sync_lock = threading.Lock()
+
+
+def register_cache(name: str, drop):
+    _caches[name] = drop
+
+
+def bump_cache(db: Session, name: str):
+    """Mark cache `name` stale in every process, in the session's current transaction (the caller commits)."""
+    stmt = insert(_meta_table).values(key=CACHE_KEY_PREFIX + name, value="1", updated_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[_meta_table.c.key],
+        set_={"value": (_meta_table.c.value.cast(Integer) + 1).cast(String), "updated_at": datetime.utcnow()}
+    )
+    db.connection().execute(stmt)
+
+
+def sync_caches(db: Session):
+    """
+    Drop this process's caches whose version changed since the last check
+    (throttled to CACHE_SYNC_SECONDS). Call it before reading a registered cache.
+    """
+    global _synced_at
+    now = time.monotonic()
+    if _synced_at is not None and now - _synced_at < CACHE_SYNC_SECONDS:
+        return
+    with _sync_lock:
+        if _synced_at is not None and now - _synced_at < CACHE_SYNC_SECONDS:
+            return
+        first = _synced_at is None
+        _synced_at = now
+        rows = db.execute(select(_meta_table.c.key, _meta_table.c.value).where(
+            _meta_table.c.key.like(CACHE_KEY_PREFIX + "%")
+        )).all()
+        versions = {key[len(CACHE_KEY_PREFIX):]: value for key, value in rows}
+        for name, drop in _caches.items():
+            # The first check only records the versions: caches sync before they load
+            if not first and versions.get(name) != _seen.get(name):
+                drop()
+        _seen.clear()
+        _seen.update(versions)
+
+
+# --- File locks ---
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True):
+    """
+    Exclusive lock on `path` (created if missing), held by one process at a
+    time. With blocking=False, yields False at once if another process holds it.
+    """
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
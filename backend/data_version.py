@@ -0,0 +1,69 @@
+"""
+Monotonic data version for cache keys.
+
+A counter kept in system_metadata ("data_version") is bumped inside the same
+transaction as any write to works, inspections, photos, assignments or users,
+so anything derived from the data (cached export artifacts) can include it in
+its key and is never served after the data it was built from has changed.
+
+ORM writes (add / modify / delete and query-level update/delete) are picked up
+automatically through session events; `bump()` is for bulk_*_mappings writers
+such as the ingester.
+"""
+
+from datetime import datetime
+from sqlalchemy import Integer, String, event, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models
+
+VERSION_KEY = "data_version"
+
+TRACKED_MODELS = (
+    models.Work,
+    models.Inspection,
+    models.InspectionPhoto,
+    models.WorkPhoto,
+    models.WorkAssignment,
+    models.User,
+)
+
+_table = models.SystemMetadata.__table__
+
+
+def current(db: Session) -> int:
+    value = db.execute(select(_table.c.value).where(_table.c.key == VERSION_KEY)).scalar()
+    try:
+        return int(value or 0)
+    except ValueError:
+        return 0
+
+
+def bump(db: Session):
+    """Increment the version in the session's current transaction."""
+    stmt = insert(_table).values(key=VERSION_KEY, value="1", updated_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[_table.c.key],
+        set_={"value": (_table.c.value.cast(Integer) + 1).cast(String), "updated_at": datetime.utcnow()}
+    )
+    db.connection().execute(stmt)
+
+
+def _touches_tracked(objects) -> bool:
+    return any(isinstance(obj, TRACKED_MODELS) for obj in objects)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    if _touches_tracked(session.new) or _touches_tracked(session.dirty) or _touches_tracked(session.deleted):
+        bump(session)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_orm_execute(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, TRACKED_MODELS):
+        bump(orm_execute_state.session)
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -6,13 +6,35 @@ import os
 DATA_DIR = os.environ.get("DATA_DIR", ".")
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(DATA_DIR, 'dantewada_works.db')}"
 
+# Seconds a connection waits for another one's write lock before "database is locked"
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT_SECONDS", "15"))
+
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT}
 )
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # Requests run concurrently in the threadpool: with WAL, readers and the
+    # one writer don't block each other (the setting is kept in the file)
+    dbapi_connection.execute("PRAGMA journal_mode=WAL")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def begin_transaction(db, immediate: bool = False):
+    """
+    Start the session's SQLite transaction now. pysqlite only issues BEGIN
+    before the first INSERT/UPDATE, so a SAVEPOINT (Session.begin_nested)
+    before that would run outside any transaction and commit on release.
+    Call this before using savepoints to isolate parts of one transaction.
+    With `immediate`, the write lock is taken right away, so reads made
+    before the first write cannot be invalidated by another writer.
+    """
+    conn = db.connection()
+    if not conn.connection.dbapi_connection.in_transaction:
+        conn.exec_driver_sql("BEGIN IMMEDIATE" if immediate else "BEGIN")
+
 def get_db():
     db = SessionLocal()
     try:
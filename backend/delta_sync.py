@@ -0,0 +1,133 @@
+"""
+Change log for delta sync.
+
+Every write to works, assignments, work photos, inspections and users appends
+(entity, id, work id, op) to sync_changes in the same transaction, so a device
+can ask "what changed since token N" (N = the last sync_changes id it has seen)
+instead of re-downloading its whole list. Deleted rows leave op="delete"
+entries - tombstones - so devices can drop them too.
+
+ORM writes (add / modify / delete and query-level update/delete) are logged
+through session events; bulk_*_mappings writers (the ingester) call record().
+Entries older than SYNC_LOG_RETENTION_DAYS are pruned; a token from before the
+pruned range gets a full resync.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, insert, null, select
+from sqlalchemy.orm import Session
+
+import models
+
+OP_UPSERT = "upsert"
+OP_DELETE = "delete"
+
+ENTITIES = {
+    models.Work: "work",
+    models.WorkAssignment: "assignment",
+    models.WorkPhoto: "photo",
+    models.Inspection: "inspection",
+    models.User: "user",
+}
+
+RETENTION = timedelta(days=int(os.environ.get("SYNC_LOG_RETENTION_DAYS", "30")))
+PRUNED_KEY = "sync_log_pruned_through"
+
+_table = models.SyncChange.__table__
+
+
+def _work_id(obj):
+    if isinstance(obj, models.Work):
+        return obj.id
+    return getattr(obj, "work_id", None)
+
+
+def record(db: Session, entity: str, entries):
+    """Log (entity_id, work_id, op) entries for `entity` in the session's current transaction."""
+    rows = [{"entity": entity, "entity_id": entity_id, "work_id": work_id, "op": op, "changed_at": datetime.utcnow()}
+            for entity_id, work_id, op in entries]
+    if rows:
+        db.connection().execute(insert(_table), rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    # session.dirty also holds objects whose only change was to a relationship collection
+    modified = [obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    by_entity = {}
+    for objects, op in ((session.new, OP_UPSERT), (modified, OP_UPSERT), (session.deleted, OP_DELETE)):
+        for obj in objects:
+            entity = ENTITIES.get(type(obj))
+            if entity is not None:
+                by_entity.setdefault(entity, []).append((obj.id, _work_id(obj), op))
+    for entity, entries in by_entity.items():
+        record(session, entity, entries)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_orm_execute(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ not in ENTITIES:
+        return
+    cls = mapper.class_
+    work_column = cls.id if cls is models.Work else getattr(cls, "work_id", null())
+    query = select(cls.id, work_column)
+    # Capture the affected rows before they change (or disappear)
+    whereclause = orm_execute_state.statement.whereclause
+    if whereclause is not None:
+        query = query.where(whereclause)
+    elif isinstance(orm_execute_state.parameters, list):
+        # ORM bulk UPDATE by primary key: the ids are in the parameter sets
+        query = query.where(cls.id.in_([params["id"] for params in orm_execute_state.parameters if "id" in params]))
+    op = OP_DELETE if orm_execute_state.is_delete else OP_UPSERT
+    rows = orm_execute_state.session.execute(query).all()
+    record(orm_execute_state.session, ENTITIES[cls], [(entity_id, work_id, op) for entity_id, work_id in rows])
+
+
+# --- Reading ---
+
+def head(db: Session) -> int:
+    """Token of the latest change (0 if none)."""
+    return db.execute(select(func.max(_table.c.id))).scalar() or 0
+
+
+def pruned_through(db: Session) -> int:
+    value = db.execute(select(models.SystemMetadata.value).where(models.SystemMetadata.key == PRUNED_KEY)).scalar()
+    return int(value or 0)
+
+
+def changes(db: Session, since: int, limit: int) -> tuple[list, int, bool]:
+    """
+    Up to `limit` entries after token `since`, oldest first.
+
+    Returns:
+        (entries, token to resume from, whether more entries follow)
+    """
+    rows = db.execute(
+        select(_table.c.id, _table.c.entity, _table.c.entity_id, _table.c.work_id, _table.c.op)
+        .where(_table.c.id > since).order_by(_table.c.id).limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1].id if rows else since), has_more
+
+
+def prune(db: Session) -> int:
+    """Drop entries older than RETENTION; tokens at or below the newest dropped id then need a full resync."""
+    cutoff = datetime.utcnow() - RETENTION
+    last = db.execute(select(func.max(_table.c.id)).where(_table.c.changed_at < cutoff)).scalar()
+    if not last:
+        return 0
+    removed = db.execute(_table.delete().where(_table.c.id <= last)).rowcount
+    meta = db.query(models.SystemMetadata).filter(models.SystemMetadata.key == PRUNED_KEY).first()
+    if meta is None:
+        meta = models.SystemMetadata(key=PRUNED_KEY)
+        db.add(meta)
+    meta.value = str(last)
+    meta.updated_at = datetime.utcnow()
+    db.commit()
+    return removed
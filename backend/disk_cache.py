@@ -0,0 +1,87 @@
+"""
+Size-bounded disk cache of files derived from source files.
+
+Shared by the on-demand photo variants (variant_cache) and the print-size
+photos of PDF reports (pdf_generator). Entries are keyed on the source file's
+path, mtime and size plus whatever else shapes the output, so a changed source
+never hits a stale entry. A hit touches the entry's mtime; once the running
+total exceeds the limit, entries are evicted least recently used first, down
+to EVICT_TO of the limit so eviction doesn't rescan on every addition.
+"""
+
+import hashlib
+import os
+import threading
+
+EVICT_TO = 0.9
+
+
+class DiskCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None  # running size of directory, computed on first use
+
+    def path_for(self, src: str, *parts, extension: str) -> str:
+        """Entry for `src` and `parts` (e.g. size, format); changes whenever the source file changes."""
+        stat = os.stat(src)
+        key = "|".join(str(p) for p in (os.path.abspath(src), stat.st_mtime_ns, stat.st_size) + parts)
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.{extension}")
+
+    def hit(self, path: str) -> bool:
+        """Whether `path` is cached; a hit counts as a use for LRU eviction."""
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def added(self, size: int, keep: str = None):
+        """
+        Account for `size` bytes just written and evict if over the limit;
+        `keep` (the entry just written) stays. Walks the directory on first use
+        and when evicting, so don't call it on the event loop.
+        """
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict_locked(keep)
+
+    def evict(self, keep: str = None):
+        """Trim the cache to its size limit now (also happens automatically as entries are added)."""
+        with self._lock:
+            if os.path.isdir(self.directory):
+                self._evict_locked(keep)
+
+    def _scan(self) -> list:
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _evict_locked(self, keep: str = None):
+        files = sorted(self._scan())
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * EVICT_TO
+        for _, size, path in files:
+            if total <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._total_bytes = total
@@ -0,0 +1,169 @@
+"""
+Export jobs with a shared artifact cache.
+
+Large exports are submitted as jobs on the durable queue (job_queue), built by
+its workers and then polled / downloaded, instead of running inside the
+request (where proxies time out). Each artifact is stored under a key derived
+from the export kind, its filters, the requesting user's scope and the current
+data version, so an identical request - from the same or another user with the
+same scope - is answered from the cached file without rebuilding. While one
+job builds an artifact (in any worker process), jobs wanting the same one wait
+for it. Artifacts are evicted by age and by total cache size (least recently
+used first).
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import coordination
+import data_version
+import job_queue
+import models
+from database import DATA_DIR
+
+EXPORT_DIR = os.path.join(DATA_DIR, "exports")
+MAX_CACHE_BYTES = int(os.environ.get("EXPORT_CACHE_MAX_MB", "1024")) * 1024 * 1024
+MAX_AGE_SECONDS = int(os.environ.get("EXPORT_CACHE_MAX_AGE_HOURS", "24")) * 3600
+JOB_KIND = "export"
+BUILD_WAIT_SECONDS = 2  # recheck interval while another job builds the same artifact
+
+_builders = {}  # export kind -> fn(db, params, user_id, path) -> row count
+
+
+def builder(kind: str):
+    """Register fn(db, params, user_id, path) -> row count as the builder for exports of `kind`."""
+    def register(fn):
+        _builders[kind] = fn
+        return fn
+    return register
+
+
+def scope_for(user) -> str:
+    """Admins share one scope; everyone else sees a per-user set of works (restrictions + assignments)."""
+    if user.role == "admin":
+        return "all"
+    return f"user:{user.id}"
+
+
+def cache_key(kind: str, params: dict, scope: str, version: int) -> str:
+    payload = json.dumps({"kind": kind, "params": params, "scope": scope, "version": version}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _artifact_path(key: str, extension: str) -> str:
+    return os.path.join(EXPORT_DIR, f"{key}.{extension}")
+
+
+def public(job: models.Job) -> dict:
+    """Job fields returned to clients."""
+    payload, result = job_queue.payload_of(job), job_queue.result_of(job) or {}
+    return {
+        "id": job.id,
+        "kind": payload.get("export"),
+        "status": job.status,
+        "cached": result.get("cached", False),
+        "filename": payload.get("filename"),
+        "rows": result.get("rows"),
+        "size_bytes": result.get("size_bytes"),
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "download_url": f"/api/exports/jobs/{job.id}/download" if job.status == job_queue.STATUS_DONE else None,
+    }
+
+
+def submit(db, kind: str, params: dict, scope: str, user_id: int, extension: str, media_type: str, filename: str) -> models.Job:
+    """
+    Queue an export of `kind` (built by its registered builder) unless the
+    identical artifact is cached, in which case the job is done at once.
+    """
+    key = cache_key(kind, params, scope, data_version.current(db))
+    path = _artifact_path(key, extension)
+    payload = {
+        "export": kind, "params": params, "user_id": user_id, "key": key,
+        "extension": extension, "media_type": media_type, "filename": filename,
+    }
+    if os.path.exists(path):
+        os.utime(path)  # cache hit counts as a use for LRU eviction
+        result = {"cached": True, "rows": None, "size_bytes": os.path.getsize(path)}
+        return job_queue.add_finished(db, JOB_KIND, payload, result, user_id=user_id)
+    return job_queue.enqueue(db, JOB_KIND, payload, user_id=user_id)
+
+
+@job_queue.handler(JOB_KIND, max_attempts=2, priority=job_queue.PRIORITY_HIGH)
+def _run(db, payload: dict) -> dict:
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    key, path = payload["key"], _artifact_path(payload["key"], payload["extension"])
+    with coordination.file_lock(os.path.join(EXPORT_DIR, f".{key}.lock"), blocking=False) as locked:
+        if not locked:
+            raise job_queue.Defer(BUILD_WAIT_SECONDS, "identical export is being built")
+        if os.path.exists(path):
+            # Built by the job we waited for
+            os.utime(path)
+            return {"cached": True, "rows": None, "size_bytes": os.path.getsize(path)}
+
+        # Hidden temp name in the same directory: the artifact appears atomically
+        part = os.path.join(EXPORT_DIR, f".{key}.{uuid.uuid4().hex}.{payload['extension']}")
+        try:
+            rows = _builders[payload["export"]](db, payload["params"], payload["user_id"], part)
+            os.replace(part, path)
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+    evict(keep=path)
+    return {"cached": False, "rows": rows, "size_bytes": os.path.getsize(path)}
+
+
+def get_job(db, job_id: int, user):
+    """The export job if `user` submitted it or is an admin, else None."""
+    job = db.get(models.Job, job_id)
+    if job is None or job.kind != JOB_KIND:
+        return None
+    if user.role == "admin" or job.user_id == user.id:
+        return job
+    return None
+
+
+def artifact_for_download(job: models.Job):
+    """Path of a finished job's artifact (touched for LRU), or None if it was evicted."""
+    payload = job_queue.payload_of(job)
+    path = _artifact_path(payload["key"], payload["extension"])
+    if job.status != job_queue.STATUS_DONE or not os.path.exists(path):
+        return None
+    os.utime(path)
+    return path
+
+
+def evict(keep: str = None):
+    """
+    Drop artifacts older than MAX_AGE_SECONDS, then least recently used ones
+    until under MAX_CACHE_BYTES. `keep` (a just-built artifact) is never evicted
+    by size. Leftover temp files from interrupted builds are removed by age.
+    """
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    now = time.time()
+    files = []
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            stat = os.stat(path)
+            if now - stat.st_mtime > MAX_AGE_SECONDS:
+                os.remove(path)
+            elif not name.startswith(".") and path != keep:
+                files.append((stat.st_mtime, stat.st_size, path))
+        except OSError:
+            continue  # removed meanwhile by another worker
+
+    total = sum(size for _, size, _ in files) + (os.path.getsize(keep) if keep and os.path.exists(keep) else 0)
+    for _, size, path in sorted(files):
+        if total <= MAX_CACHE_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
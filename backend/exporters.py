@@ -0,0 +1,384 @@
+"""
+Streaming exporters for works data.
+
+Rows are read from the database in batches (never as a full ORM list).
+CSV and NDJSON are encoded and streamed straight from the cursor; XLSX and
+Parquet are written to a temporary file (both need a trailing index/footer),
+which is then streamed to the client in chunks and deleted. Memory stays
+flat regardless of the row count.
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import datetime
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+
+from sqlalchemy import case, func
+
+import models
+import pdf_generator
+from database import SessionLocal
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "xlsx": (XLSX_MEDIA_TYPE, "xlsx"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+PARQUET_ROW_GROUP = 50000  # rows per Arrow batch / Parquet row group
+PDF_WORK_LIMIT = int(os.environ.get("PDF_MAX_WORKS", "10000"))  # safety cap for the illustrated report
+
+BATCH_SIZE = 2000          # rows fetched per round-trip
+CHUNK_SIZE = 64 * 1024     # bytes per streamed chunk
+
+# (header, column, width, wrap) - widths are fixed up front (write-only sheets cannot be measured)
+WORK_EXPORT_COLUMNS = [
+    ("Work Code", models.Work.work_code, 16, False),
+    ("Work Name", models.Work.work_name, 50, True),
+    ("Department", models.Work.department, 22, True),
+    ("Type", models.Work.financial_year, 12, False),  # Column 2 is Financial Year mostly
+    ("Location", models.Work.panchayat, 22, False),
+    ("Block", models.Work.block, 16, False),
+    ("Sanctioned Amount", models.Work.sanctioned_amount, 18, False),
+    ("Sanctioned Date", models.Work.sanctioned_date, 18, False),
+    ("Status", models.Work.current_status, 20, False),
+    ("Agency", models.Work.agency_name, 35, True),
+    ("Released", models.Work.total_released_amount, 12, False),
+    ("Pending", models.Work.amount_pending, 12, False),
+    ("Est End Date", models.Work.probable_completion_date, 18, False),
+    ("Remark", models.Work.remark, 50, True),
+]
+ASSIGNED_TO_HEADER = ("Assigned To", 18)
+
+WRAP = Alignment(wrap_text=True, vertical='top')
+BOLD = Font(bold=True)
+
+
+def works_export_rows(query):
+    """
+    Narrow a build_works_query() result to the export columns (+ assigned
+    officer username via an outer join) and yield plain tuples in batches.
+    """
+    query = query.outerjoin(
+        models.User, models.User.id == models.Work.assigned_officer_id
+    ).with_entities(
+        *[col for _, col, _, _ in WORK_EXPORT_COLUMNS],
+        models.User.username
+    )
+    for row in query.execution_options(stream_results=True).yield_per(BATCH_SIZE):
+        yield tuple(row[:-1]) + (row[-1] or "Unassigned",)
+
+
+def works_export_headers() -> list:
+    return [h for h, _, _, _ in WORK_EXPORT_COLUMNS] + [ASSIGNED_TO_HEADER[0]]
+
+
+def works_export_fields() -> list:
+    """Machine-friendly field names (the Work column names) for CSV/NDJSON/Parquet."""
+    return [col.key for _, col, _, _ in WORK_EXPORT_COLUMNS] + ["assigned_to"]
+
+
+def _rows_in_own_session(query, session_factory=SessionLocal):
+    """
+    Iterate export rows on a dedicated session so a streamed body does not
+    depend on the request's session still being open.
+    """
+    db = session_factory()
+    try:
+        yield from works_export_rows(query.with_session(db))
+    finally:
+        db.close()
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _encode_csv(rows, rows_per_chunk: int = 1000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(works_export_fields())
+    pending = 0
+    for row in rows:
+        writer.writerow([_plain(v) for v in row])
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _encode_ndjson(rows, rows_per_chunk: int = 1000):
+    fields = works_export_fields()
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(fields, (_plain(v) for v in row))), ensure_ascii=False))
+        if len(lines) >= rows_per_chunk:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def stream_works_csv(query, rows_per_chunk: int = 1000, session_factory=SessionLocal):
+    """Yield the export as UTF-8 CSV chunks straight from the cursor."""
+    return _encode_csv(_rows_in_own_session(query, session_factory), rows_per_chunk)
+
+
+def stream_works_ndjson(query, rows_per_chunk: int = 1000, session_factory=SessionLocal):
+    """Yield the export as newline-delimited JSON objects, one per work."""
+    return _encode_ndjson(_rows_in_own_session(query, session_factory), rows_per_chunk)
+
+
+def write_works_text(query, path: str, export_format: str) -> int:
+    """Write the CSV / NDJSON export to `path` (used by export jobs). Returns the row count."""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for row in works_export_rows(query):
+            count += 1
+            yield row
+
+    encode = _encode_csv if export_format == "csv" else _encode_ndjson
+    with open(path, "wb") as f:
+        for chunk in encode(counted()):
+            f.write(chunk)
+    return count
+
+
+def write_works_parquet(query, path: str) -> int:
+    """
+    Write the export to a Parquet file at `path`, one row group per
+    PARQUET_ROW_GROUP rows built as an Arrow record batch. Returns the row count.
+    Requires pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = works_export_fields()
+    arrow_types = {
+        "sanctioned_amount": pa.float64(),
+        "total_released_amount": pa.float64(),
+        "amount_pending": pa.float64(),
+        "sanctioned_date": pa.timestamp("us"),
+        "probable_completion_date": pa.timestamp("us"),
+    }
+    schema = pa.schema([(f, arrow_types.get(f, pa.string())) for f in fields])
+
+    def to_batch(columns):
+        return pa.RecordBatch.from_arrays(
+            [pa.array(col, type=schema.field(i).type) for i, col in enumerate(columns)], schema=schema
+        )
+
+    count = 0
+    string_fields = {i for i, f in enumerate(fields) if f not in arrow_types}
+    with pq.ParquetWriter(path, schema, compression="snappy") as writer:
+        columns = [[] for _ in fields]
+        for row in works_export_rows(query):
+            for i, v in enumerate(row):
+                columns[i].append(str(v) if i in string_fields and v is not None else v)
+            count += 1
+            if len(columns[0]) >= PARQUET_ROW_GROUP:
+                writer.write_batch(to_batch(columns))
+                columns = [[] for _ in fields]
+        if columns[0] or count == 0:
+            writer.write_batch(to_batch(columns))
+    return count
+
+
+def _append_sheet(wb, sheet_name: str, headers: list, widths: list, wrap: list, rows) -> int:
+    """Add a write-only sheet to `wb` and stream `rows` into it. Returns the number of data rows."""
+    ws = wb.create_sheet(sheet_name)
+    for i, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+
+    header_cells = []
+    for h in headers:
+        cell = WriteOnlyCell(ws, value=h)
+        cell.font = BOLD
+        cell.alignment = WRAP
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    # One styled cell per wrapped column, reused for every row: write-only rows are
+    # serialized on append, so only the value changes and the style is resolved once.
+    wrap_cells = {}
+    for i, w in enumerate(wrap):
+        if w:
+            wrap_cells[i] = WriteOnlyCell(ws)
+            wrap_cells[i].alignment = WRAP
+
+    count = 0
+    for row in rows:
+        if wrap_cells:
+            row = list(row)
+            for i, cell in wrap_cells.items():
+                cell.value = row[i]
+                row[i] = cell
+        ws.append(row)
+        count += 1
+    return count
+
+
+def write_xlsx(path: str, sheet_name: str, headers: list, widths: list, wrap: list, rows) -> int:
+    """
+    Write `rows` to an .xlsx at `path` with openpyxl's write-only mode.
+    Styles and column widths are set once up front. Returns the number of
+    data rows written.
+    """
+    wb = Workbook(write_only=True)
+    count = _append_sheet(wb, sheet_name, headers, widths, wrap, rows)
+    wb.save(path)
+    return count
+
+
+def write_works_xlsx(query, path: str) -> int:
+    """Export the works selected by `query` to `path`. Returns the row count."""
+    widths = [w for _, _, w, _ in WORK_EXPORT_COLUMNS] + [ASSIGNED_TO_HEADER[1]]
+    wrap = [w for _, _, _, w in WORK_EXPORT_COLUMNS] + [False]
+    return write_xlsx(path, "Works", works_export_headers(), widths, wrap, works_export_rows(query))
+
+
+def works_pdf_data(db, query, limit: int = PDF_WORK_LIMIT) -> list:
+    """Works (plus their photos, newest first) in the format pdf_generator expects."""
+    works = query.with_entities(
+        models.Work.id, models.Work.work_code, models.Work.work_name, models.Work.agency_name,
+        models.Work.block, models.Work.panchayat, models.Work.sanctioned_amount,
+        models.Work.current_status, models.Work.admin_remarks
+    ).limit(limit).all()
+
+    work_photos_map = {}
+    work_ids = [w.id for w in works]
+    for start in range(0, len(work_ids), 900):  # stay under SQLite's bound-parameter limit
+        photos = db.query(
+            models.WorkPhoto.work_id, models.WorkPhoto.image_path, models.WorkPhoto.thumbnail_path,
+            models.WorkPhoto.category, models.WorkPhoto.uploaded_at
+        ).filter(models.WorkPhoto.work_id.in_(work_ids[start:start + 900])).order_by(models.WorkPhoto.uploaded_at.desc())
+        for p in photos:
+            work_photos_map.setdefault(p.work_id, []).append({
+                "image_path": p.image_path,
+                "thumbnail_path": p.thumbnail_path,
+                "category": p.category,
+                "uploaded_at": p.uploaded_at.isoformat() if p.uploaded_at else None
+            })
+
+    return [{
+        "work_code": w.work_code,
+        "work_name": w.work_name,
+        "agency_name": w.agency_name,
+        "block": f"{w.block} - {w.panchayat}",
+        "sanctioned_amount": w.sanctioned_amount,
+        "current_status": w.current_status,
+        "admin_remarks": w.admin_remarks,
+        "photos": work_photos_map.get(w.id, [])
+    } for w in works]
+
+
+def write_works_pdf(db, query, path: str) -> int:
+    """Render the illustrated PDF report for `query` to `path`. Returns the number of works."""
+    return pdf_generator.build_visual_pdf_file(works_pdf_data(db, query), path)
+
+
+def inspection_status_queries(db, query):
+    """
+    (summary, detail) queries for the inspection status report over the
+    assigned works in `query`: photo counts and latest inspection dates come
+    from grouped subqueries joined on work id, so nothing is loaded per work.
+    """
+    photo_counts = db.query(
+        models.WorkPhoto.work_id.label("work_id"),
+        func.count(models.WorkPhoto.id).label("photo_count")
+    ).group_by(models.WorkPhoto.work_id).subquery()
+    latest_inspections = db.query(
+        models.Inspection.work_id.label("work_id"),
+        func.max(models.Inspection.inspection_date).label("latest_date")
+    ).group_by(models.Inspection.work_id).subquery()
+
+    agency = func.coalesce(func.nullif(models.Work.agency_name, ""), "Unknown")
+    photo_count = func.coalesce(photo_counts.c.photo_count, 0)
+    assigned = query.filter(models.Work.assigned_officer_id.isnot(None)).outerjoin(
+        photo_counts, photo_counts.c.work_id == models.Work.id
+    )
+
+    summary = assigned.with_entities(
+        agency,
+        func.count(models.Work.id),
+        func.sum(case((photo_count > 0, 1), else_=0))
+    ).group_by(agency).order_by(agency)
+
+    detail = assigned.outerjoin(
+        latest_inspections, latest_inspections.c.work_id == models.Work.id
+    ).outerjoin(
+        models.User, models.User.id == models.Work.assigned_officer_id
+    ).with_entities(
+        agency,
+        models.Work.work_code,
+        func.coalesce(models.User.username, "Unknown"),
+        photo_count,
+        latest_inspections.c.latest_date
+    ).order_by(models.Work.id)
+
+    return summary, detail
+
+
+INSPECTION_SUMMARY_COLUMNS = [("Agency", 40, True), ("Total Assigned", 16, False), ("With Photos", 14, False), ("Pending Photos", 16, False)]
+INSPECTION_DETAIL_COLUMNS = [
+    ("Agency", 40, True), ("Work Code", 16, False), ("Assigned User", 20, False),
+    ("Has Photo", 11, False), ("Photo Count", 13, False), ("Latest Inspection Date", 28, False)
+]
+
+
+def write_inspection_status_xlsx(db, path: str, query=None) -> int:
+    """
+    Photo / inspection coverage of the assigned works in `query` (all works by
+    default): an agency summary sheet and a detailed sheet streamed from the
+    database. Returns the number of detailed rows.
+    """
+    summary_query, detail_query = inspection_status_queries(db, query if query is not None else db.query(models.Work))
+
+    summary = [(a, total, with_photos, total - (with_photos or 0)) for a, total, with_photos in summary_query]
+
+    def detail_rows():
+        for agency, code, username, count, latest in detail_query.execution_options(stream_results=True).yield_per(BATCH_SIZE):
+            yield agency, code, username, "Yes" if count > 0 else "No", count, latest.isoformat() if latest else None
+
+    wb = Workbook(write_only=True)
+    _append_sheet(wb, 'Agency Summary', *zip(*INSPECTION_SUMMARY_COLUMNS), summary)
+    count = 0
+    if summary:
+        count = _append_sheet(wb, 'Detailed Works', *zip(*INSPECTION_DETAIL_COLUMNS), detail_rows())
+    wb.save(path)
+    return count
+
+
+def temp_path(suffix: str) -> str:
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def iter_file(path: str, delete: bool = True):
+    """Yield a file in CHUNK_SIZE pieces, removing it afterwards."""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if delete and os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,202 @@
+"""
+In-process cache of the filter dimensions shown on the dashboards.
+
+The distinct (block, panchayat, department, agency, status, year) combinations
+are loaded once with a single GROUP BY and kept in memory until ingest marks
+them stale with `changed()` (in every worker process, see coordination).
+
+At load time every combination gets a bit, and each dimension value (raw, for
+the option lists, and normalized, for selections and officer scopes) the
+bitmask of the combinations it appears in. A request ANDs/ORs a few masks and
+tests each option's mask against the result, so option lists, officer-scoped
+lists and cascading options (e.g. panchayats within the selected blocks) cost
+one integer AND per option value rather than a pass over every combination.
+"""
+
+import threading
+from datetime import datetime
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+import auth
+import coordination
+import models
+
+DIMENSIONS = ["blocks", "panchayats", "departments", "agencies", "statuses", "years"]
+_COLUMNS = [
+    models.Work.block,
+    models.Work.panchayat,
+    models.Work.department,
+    models.Work.agency_name,
+    models.Work.current_status,
+    models.Work.financial_year,
+]
+
+# Same special flag build_works_query understands in the block filter
+SPECIAL_BLOCK_FLAG = "District/Block Level Works"
+
+CACHE_NAME = "filter_dimensions"
+
+_lock = threading.Lock()
+_state = None
+
+
+def _norm(value) -> str:
+    return str(value).strip().lower().replace('\u00a0', ' ') if value else ""
+
+
+def _build_combo(row) -> tuple:
+    """(raw values, normalized values, earliest sanctioned date) for one distinct combination."""
+    raw = tuple(row[:6])
+    return raw, tuple(_norm(v) for v in raw), row[6]
+
+
+def _load(db: Session) -> dict:
+    rows = db.query(*_COLUMNS, func.min(models.Work.sanctioned_date)).group_by(*_COLUMNS).all()
+    # Oldest first (undated last): the lowest dated bit of a mask is its earliest date
+    combos = sorted((_build_combo(r) for r in rows), key=lambda c: (c[2] is None, c[2] or datetime.min))
+
+    by_value = [{} for _ in DIMENSIONS]  # per dimension: displayed value -> mask (option lists)
+    by_norm = [{} for _ in DIMENSIONS]   # per dimension: normalized value -> mask (selections, scopes)
+    special = dated = 0
+    for k, (raw, norm, date) in enumerate(combos):
+        bit = 1 << k
+        for i in range(len(DIMENSIONS)):
+            if raw[i]:
+                value = str(raw[i]).strip()
+                by_value[i][value] = by_value[i].get(value, 0) | bit
+            by_norm[i][norm[i]] = by_norm[i].get(norm[i], 0) | bit
+        if norm[1].startswith("block level") or norm[1].startswith("district level"):
+            special |= bit
+        if date:
+            dated |= bit
+
+    state = {
+        "combos": combos,
+        "ids": {raw: k for k, (raw, _, _) in enumerate(combos)},
+        "by_value": by_value,
+        "by_norm": by_norm,
+        "special": special,  # District/Block level works (SPECIAL_BLOCK_FLAG)
+        "dated": dated,
+        "full": (1 << len(combos)) - 1,
+        "scopes": {},        # officer scope sets -> mask of the combinations they allow
+    }
+    state["all"] = _options(state, {}, state["full"])
+    return state
+
+
+def _state_for(db: Session) -> dict:
+    global _state
+    coordination.sync_caches(db)
+    state = _state
+    if state is None:
+        with _lock:
+            state = _state
+            if state is None:
+                state = _state = _load(db)
+    return state
+
+
+def invalidate():
+    """Drop this process's cached dimensions; the next request reloads them."""
+    global _state
+    with _lock:
+        _state = None
+
+
+def changed(db: Session):
+    """Mark the dimensions stale in every worker process, in the session's transaction (the caller commits)."""
+    coordination.bump_cache(db, CACHE_NAME)
+
+
+coordination.register_cache(CACHE_NAME, invalidate)
+
+
+def _selection_mask(state: dict, dim_index: int, selected: set) -> int:
+    """Combinations matching the normalized values `selected` on one dimension (as build_works_query filters)."""
+    by_norm = state["by_norm"][dim_index]
+    mask = 0
+    for value in selected:
+        mask |= by_norm.get(value, 0)
+    if dim_index == 0 and SPECIAL_BLOCK_FLAG.lower() in selected:
+        mask |= state["special"]
+    return mask
+
+
+def _options(state: dict, selected: dict, scope: int) -> dict:
+    """
+    Option lists per dimension among the combinations in `scope`. Each
+    dimension is narrowed by the selections on every *other* dimension, so a
+    dimension's own selection never hides its alternatives.
+    """
+    masks = {j: _selection_mask(state, j, values) for j, values in selected.items()}
+    result = {}
+    for i, dim in enumerate(DIMENSIONS):
+        mask = scope
+        for j, m in masks.items():
+            if j != i:
+                mask &= m
+        result[dim] = sorted(value for value, m in state["by_value"][i].items() if m & mask) if mask else []
+
+    mask = scope
+    for m in masks.values():
+        mask &= m
+    mask &= state["dated"]
+    earliest = state["combos"][(mask & -mask).bit_length() - 1][2] if mask else None
+    result["earliest_date"] = earliest.strftime('%Y-%m-%d') if earliest else None
+    return result
+
+
+def _selection(block=None, panchayat=None, department=None, agency=None, status=None, year=None) -> dict:
+    selected = {}
+    for i, values in enumerate([block, panchayat, department, agency, status, year]):
+        clean = {_norm(v) for v in (values or []) if v}
+        if clean:
+            selected[i] = clean
+    return selected
+
+
+def _scope_mask(db: Session, state: dict, user) -> int:
+    """Combinations visible to `user`, mirroring the privacy filter in build_works_query."""
+    agencies, blocks, panchayats = auth.scope_sets(user)
+    restrictions = {i: values for i, values in ((3, agencies), (0, blocks), (1, panchayats)) if values}
+    if not restrictions:
+        return state["full"]
+
+    key = tuple(frozenset(restrictions.get(i, ())) for i in (3, 0, 1))
+    mask = state["scopes"].get(key)
+    if mask is None:
+        mask = state["full"]
+        for i, values in restrictions.items():
+            allowed = 0
+            for value in values:
+                allowed |= state["by_norm"][i].get(value, 0)
+            mask &= allowed
+        state["scopes"][key] = mask
+
+    # Explicitly assigned works are visible regardless of the restrictions
+    assigned_ids = db.query(models.WorkAssignment.work_id).filter(models.WorkAssignment.user_id == user.id)
+    assigned = db.query(*_COLUMNS).filter(
+        or_(models.Work.assigned_officer_id == user.id, models.Work.id.in_(assigned_ids))
+    ).distinct().all()
+    ids = state["ids"]
+    for row in assigned:
+        k = ids.get(tuple(row))
+        if k is not None:  # else added since the cache loaded; it shows after the next reload
+            mask |= 1 << k
+    return mask
+
+
+def get_filters(db: Session, user=None, block=None, panchayat=None, department=None,
+                agency=None, status=None, year=None) -> dict:
+    """
+    Filter options, optionally scoped to what `user` may see and narrowed by
+    the given selections (cascading options).
+    """
+    state = _state_for(db)
+    selected = _selection(block, panchayat, department, agency, status, year)
+    scoped = user is not None and user.role != "admin"
+    if not selected and not scoped:
+        return state["all"]
+    scope = _scope_mask(db, state, user) if scoped else state["full"]
+    return _options(state, selected, scope)
@@ -0,0 +1,233 @@
+"""
+GPS anomaly detection for inspections.
+Compares the position an inspector submitted against the work's reference
+coordinates, the GP centroid and the block center, and flags outliers in
+the gps_anomalies table.
+
+Run as a script to re-scan the full inspection history:
+    python gps_check.py
+"""
+
+import json
+import math
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from sqlalchemy.orm import Session
+
+import models
+from ingester import BLOCK_CENTERS
+
+EARTH_RADIUS_KM = 6371.0
+
+# Thresholds
+WORK_RADIUS_KM = 1.0     # Fix must be this close to the work to count as on site ...
+GP_RADIUS_KM = 8.0       # ... inside its gram panchayat it is only a low-severity flag
+BLOCK_RADIUS_KM = 40.0   # Anything further from the block center is off-site
+
+REASON_INVALID = "invalid_coordinates"
+REASON_OUTSIDE_BLOCK = "outside_block"
+REASON_FAR_FROM_SITE = "far_from_site"
+REASON_NEAR_GP_ONLY = "near_gp_only"
+
+SEVERITY_HIGH = "high"
+SEVERITY_LOW = "low"
+SEVERITY = {
+    REASON_INVALID: SEVERITY_HIGH,
+    REASON_OUTSIDE_BLOCK: SEVERITY_HIGH,
+    REASON_FAR_FROM_SITE: SEVERITY_HIGH,
+    REASON_NEAR_GP_ONLY: SEVERITY_LOW,
+}
+
+_gp_centroids = None
+
+
+def gp_centroids() -> dict:
+    """GP centroids keyed 'PANCHAYAT_BLOCK' (upper case), loaded once from gp_coordinates.json."""
+    global _gp_centroids
+    if _gp_centroids is None:
+        json_path = os.path.join(os.path.dirname(__file__), 'gp_coordinates.json')
+        try:
+            with open(json_path, 'r') as f:
+                _gp_centroids = {k: tuple(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            print(f"Failed to load gp_coordinates.json: {e}")
+            _gp_centroids = {}
+    return _gp_centroids
+
+
+def gp_key(panchayat, block) -> str:
+    return f"{str(panchayat or '').strip().upper()}_{str(block or '').strip().upper()}"
+
+
+def _haversine(lat1, lng1, lat2, lng2) -> float:
+    """Great-circle distance in km between two points (scalar version for the request path)."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Element-wise great-circle distance in km; NaN wherever an input is missing."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _valid_fix(lat, lng) -> bool:
+    if lat is None or lng is None or math.isnan(lat) or math.isnan(lng):
+        return False
+    if abs(lat) < 1e-6 and abs(lng) < 1e-6:
+        return False
+    return -90 <= lat <= 90 and -180 <= lng <= 180
+
+
+def classify(dist_work, dist_gp, dist_block):
+    """
+    Return the anomaly reason for one set of distances (None = looks on site).
+    A fix away from the work but inside its GP is plausible (a wrong reference
+    point, an inspection from the village) but not precise enough to move the
+    work, so it is flagged with low severity.
+    """
+    if dist_block is not None and dist_block > BLOCK_RADIUS_KM:
+        return REASON_OUTSIDE_BLOCK
+    if dist_work is not None and dist_work > WORK_RADIUS_KM:
+        if dist_gp is None or dist_gp > GP_RADIUS_KM:
+            return REASON_FAR_FROM_SITE
+        return REASON_NEAR_GP_ONLY
+    return None
+
+
+def check_inspection(work, latitude, longitude):
+    """
+    Inline check for a single submitted fix against `work` (a models.Work).
+    Pure float math and two dict lookups, so it adds microseconds to the request.
+
+    Returns:
+        dict of anomaly fields if the fix looks wrong, otherwise None.
+    """
+    if not _valid_fix(latitude, longitude):
+        return {"reason": REASON_INVALID, "distance_work_km": None, "distance_gp_km": None, "distance_block_km": None}
+
+    dist_work = None
+    if work.latitude is not None and work.longitude is not None:
+        dist_work = _haversine(latitude, longitude, work.latitude, work.longitude)
+
+    dist_gp = None
+    gp = gp_centroids().get(gp_key(work.panchayat, work.block))
+    if gp:
+        dist_gp = _haversine(latitude, longitude, gp[0], gp[1])
+
+    dist_block = None
+    center = BLOCK_CENTERS.get(str(work.block or '').strip().upper())
+    if center:
+        dist_block = _haversine(latitude, longitude, center[0], center[1])
+
+    reason = classify(dist_work, dist_gp, dist_block)
+    if reason is None:
+        return None
+    return {
+        "reason": reason,
+        "distance_work_km": round(dist_work, 3) if dist_work is not None else None,
+        "distance_gp_km": round(dist_gp, 3) if dist_gp is not None else None,
+        "distance_block_km": round(dist_block, 3) if dist_block is not None else None,
+    }
+
+
+def scan_inspections(db: Session) -> dict:
+    """
+    Batch job: recompute distances for the full inspection history in one
+    vectorized pass and rebuild the gps_anomalies table.
+    Review flags on anomalies that are still present are preserved.
+    """
+    rows = db.query(
+        models.Inspection.id,
+        models.Inspection.work_id,
+        models.Inspection.latitude,
+        models.Inspection.longitude,
+        models.Work.latitude,
+        models.Work.longitude,
+        models.Work.panchayat,
+        models.Work.block
+    ).join(models.Work, models.Work.id == models.Inspection.work_id).all()
+
+    columns = ["inspection_id", "work_id", "lat", "lng", "work_lat", "work_lng", "panchayat", "block"]
+    df = pd.DataFrame(rows, columns=columns)
+    if df.empty:
+        db.query(models.GpsAnomaly).delete()
+        db.commit()
+        return {"scanned": 0, "flagged": 0}
+
+    for col in ["lat", "lng", "work_lat", "work_lng"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    # Reference points (NaN where unknown), resolved once per distinct GP/block pair
+    centroids = gp_centroids()
+    refs = df[["panchayat", "block"]].drop_duplicates()
+    gp_points = [centroids.get(gp_key(p, b)) for p, b in zip(refs["panchayat"], refs["block"])]
+    block_points = [BLOCK_CENTERS.get(str(b or '').strip().upper()) for b in refs["block"]]
+    refs = refs.assign(
+        gp_lat=[p[0] if p else np.nan for p in gp_points],
+        gp_lng=[p[1] if p else np.nan for p in gp_points],
+        block_lat=[p[0] if p else np.nan for p in block_points],
+        block_lng=[p[1] if p else np.nan for p in block_points],
+    )
+    df = df.merge(refs, on=["panchayat", "block"], how="left")
+
+    df["distance_work_km"] = haversine_km(df["lat"], df["lng"], df["work_lat"], df["work_lng"])
+    df["distance_gp_km"] = haversine_km(df["lat"], df["lng"], df["gp_lat"], df["gp_lng"])
+    df["distance_block_km"] = haversine_km(df["lat"], df["lng"], df["block_lat"], df["block_lng"])
+
+    invalid = (
+        df["lat"].isna() | df["lng"].isna()
+        | ((df["lat"].abs() < 1e-6) & (df["lng"].abs() < 1e-6))
+        | (df["lat"].abs() > 90) | (df["lng"].abs() > 180)
+    )
+    df.loc[invalid, ["distance_work_km", "distance_gp_km", "distance_block_km"]] = np.nan
+    outside_block = df["distance_block_km"] > BLOCK_RADIUS_KM
+    away_from_work = df["distance_work_km"] > WORK_RADIUS_KM
+    far_from_site = away_from_work & ~(df["distance_gp_km"] <= GP_RADIUS_KM)
+
+    df["reason"] = np.select(
+        [invalid, outside_block, far_from_site, away_from_work],
+        [REASON_INVALID, REASON_OUTSIDE_BLOCK, REASON_FAR_FROM_SITE, REASON_NEAR_GP_ONLY],
+        default=""
+    )
+    flagged = df[df["reason"] != ""]
+
+    reviewed = {
+        r.inspection_id for r in db.query(models.GpsAnomaly.inspection_id).filter(models.GpsAnomaly.reviewed == True)
+    }
+    now = datetime.utcnow()
+    records = []
+    for r in flagged.itertuples(index=False):
+        records.append({
+            "inspection_id": int(r.inspection_id),
+            "work_id": int(r.work_id),
+            "reason": r.reason,
+            "latitude": None if pd.isna(r.lat) else float(r.lat),
+            "longitude": None if pd.isna(r.lng) else float(r.lng),
+            "distance_work_km": None if pd.isna(r.distance_work_km) else round(float(r.distance_work_km), 3),
+            "distance_gp_km": None if pd.isna(r.distance_gp_km) else round(float(r.distance_gp_km), 3),
+            "distance_block_km": None if pd.isna(r.distance_block_km) else round(float(r.distance_block_km), 3),
+            "flagged_at": now,
+            "reviewed": int(r.inspection_id) in reviewed,
+        })
+
+    db.query(models.GpsAnomaly).delete()
+    if records:
+        db.bulk_insert_mappings(models.GpsAnomaly, records)
+    db.commit()
+
+    return {"scanned": len(df), "flagged": len(records)}
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine, Base
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print(scan_inspections(db))
+    finally:
+        db.close()
@@ -5,113 +5,363 @@ Compresses and creates thumbnails using Pillow.
 
 import os
 import uuid
+import hashlib
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from PIL import Image, ExifTags
+from PIL import Image
 import io
 
 UPLOAD_DIR = "uploads"
 FULL_DIR = os.path.join(UPLOAD_DIR, "photos")
 THUMB_DIR = os.path.join(UPLOAD_DIR, "thumbnails")
+VARIANT_DIR = os.path.join(UPLOAD_DIR, "variants")
 
 # Compression settings
 MAX_WIDTH = 1920       # Max pixel width for full-size
 THUMB_WIDTH = 400      # Thumbnail width
 JPEG_QUALITY = 85      # Good quality, reasonable size
+THUMB_QUALITY = 80
+
+# Responsive variants: every width in the ladder below the full image's width,
+# in every format, so clients can pick the smallest adequate size (srcset).
+VARIANT_WIDTHS = sorted({int(w) for w in os.environ.get("IMAGE_VARIANT_WIDTHS", "160,400,800,1600").split(",") if w.strip()})
+VARIANT_FORMATS = [f.strip().lower() for f in os.environ.get("IMAGE_VARIANT_FORMATS", "webp,jpeg").split(",") if f.strip()]
+VARIANT_QUALITY = {"webp": 80, "jpeg": 82}
+VARIANT_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+WEBP_METHOD = 2  # encoder effort 0-6: 4 (Pillow's default) costs ~2.5x the CPU for ~5% smaller files
+
+# Process pool for uploads (decode/resize/encode never runs on the event loop)
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+IMAGE_QUEUE_LIMIT = int(os.environ.get("IMAGE_QUEUE_LIMIT", str(IMAGE_WORKERS * 8)))  # photos queued or in progress
 
 
 def ensure_dirs():
     """Create upload directories if they don't exist."""
     os.makedirs(FULL_DIR, exist_ok=True)
     os.makedirs(THUMB_DIR, exist_ok=True)
+    os.makedirs(VARIANT_DIR, exist_ok=True)
+
 
+# EXIF orientation value -> the single transpose that makes the image upright
+EXIF_ORIENTATION_TAG = 0x0112
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
 
-def fix_orientation(img: Image.Image) -> Image.Image:
-    """Auto-rotate image based on EXIF orientation tag (from phone cameras)."""
+
+def exif_orientation(img: Image.Image) -> int:
+    """EXIF orientation tag (1 = upright) read from the header, before any pixels are decoded."""
     try:
-        exif = img._getexif()
-        if exif is None:
-            return img
-        
-        orientation_key = None
-        for key, val in ExifTags.TAGS.items():
-            if val == 'Orientation':
-                orientation_key = key
-                break
-        
-        if orientation_key and orientation_key in exif:
-            orientation = exif[orientation_key]
-            if orientation == 3:
-                img = img.rotate(180, expand=True)
-            elif orientation == 6:
-                img = img.rotate(270, expand=True)
-            elif orientation == 8:
-                img = img.rotate(90, expand=True)
-    except (AttributeError, KeyError, IndexError):
-        pass
+        return int(img.getexif().get(EXIF_ORIENTATION_TAG, 1))
+    except Exception:
+        return 1
+
+
+def fix_orientation(img: Image.Image, orientation: int = None) -> Image.Image:
+    """Auto-rotate image based on EXIF orientation tag (from phone cameras), in one transpose."""
+    if orientation is None:
+        orientation = exif_orientation(img)
+    method = ORIENTATION_TRANSPOSE.get(orientation)
+    return img.transpose(method) if method is not None else img
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    """Convert to RGB if needed (handles PNG with alpha, etc.)"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if 'A' in img.mode else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
     return img
 
 
-def process_upload(file_bytes: bytes, original_filename: str) -> tuple[str, str]:
+def decode_scaled(file_bytes: bytes, max_width: int) -> Image.Image:
+    """
+    Decode an upload as an upright RGB image at most `max_width` wide, doing
+    as little full-resolution work as possible:
+    1. JPEG draft mode decodes straight at 1/2, 1/4 or 1/8 scale (never below the target)
+    2. reduce() takes other formats down by an integer factor cheaply
+    3. one LANCZOS resize to the exact size, then one transpose for EXIF orientation
+    """
+    img = Image.open(io.BytesIO(file_bytes))
+    orientation = exif_orientation(img)
+    w, h = img.size
+    rotated = orientation in (5, 6, 7, 8)  # stored sideways: upright width is the stored height
+    upright_w = h if rotated else w
+
+    if upright_w > max_width:
+        ratio = max_width / upright_w
+        # Target in stored orientation; the transpose happens last, on the small image
+        target = (int(w * ratio), max_width) if rotated else (max_width, int(h * ratio))
+        target = (max(1, target[0]), max(1, target[1]))
+        img.draft('RGB', target)
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        factor = min(img.size[0] // target[0], img.size[1] // target[1])
+        if factor >= 2:
+            img = img.reduce(factor)
+        img = _to_rgb(img)
+        if img.size != target:
+            img = img.resize(target, Image.LANCZOS)
+    else:
+        img = _to_rgb(img)
+
+    return fix_orientation(img, orientation)
+
+
+def _save_variant(img: Image.Image, path: str, fmt: str):
+    if fmt == "webp":
+        img.save(path, "WEBP", quality=VARIANT_QUALITY["webp"], method=WEBP_METHOD)
+    else:
+        img.save(path, "JPEG", quality=VARIANT_QUALITY["jpeg"], optimize=True, progressive=True)
+
+
+def perceptual_hash(img: Image.Image) -> str:
+    """
+    64-bit difference hash (dHash) as 16 hex digits: each bit says whether a
+    pixel of the 9x8 grayscale image is brighter than its right neighbour.
+    Survives re-encoding, resizing and small exposure changes; compare with hamming().
+    """
+    small = img.convert("L").resize((9, 8), Image.BOX)
+    px = small.tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return f"{value:016x}"
+
+
+def hamming(hash_a: str, hash_b: str) -> int:
+    """Number of differing bits between two perceptual_hash values."""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+def _content_dir(base_dir: str, content_hash: str) -> str:
+    # Two-character fan-out keeps directories small
+    return os.path.join(base_dir, content_hash[:2]) if content_hash else base_dir
+
+
+def build_variants(img_full: Image.Image, base_name: str, widths=None, formats=None, content_hash: str = None) -> tuple[list[dict], dict]:
+    """
+    Write the responsive variant ladder for an upright RGB image.
+
+    Widths are produced largest first, each resized from the previous one, so
+    no step downsamples by much more than 2x and the full image is only read once.
+    Widths at or above the image's own width are skipped (the full image covers them).
+
+    Returns:
+        ([{"width", "height", "format", "path", "size_bytes"}, ...], {width: resized Image})
+    """
+    widths = VARIANT_WIDTHS if widths is None else widths
+    formats = VARIANT_FORMATS if formats is None else formats
+    variants, images = [], {}
+    os.makedirs(_content_dir(VARIANT_DIR, content_hash), exist_ok=True)
+    source = img_full
+    for width in sorted((w for w in widths if w < img_full.size[0]), reverse=True):
+        height = max(1, int(img_full.size[1] * width / img_full.size[0]))
+        source = source.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        images[width] = source
+        for fmt in formats:
+            path = os.path.join(_content_dir(VARIANT_DIR, content_hash), f"{base_name}_{width}.{VARIANT_EXTENSIONS[fmt]}")
+            _save_variant(source, path, fmt)
+            variants.append({"width": width, "height": height, "format": fmt, "path": path, "size_bytes": os.path.getsize(path)})
+    return variants, images
+
+
+def content_hash(file_bytes: bytes) -> str:
+    """SHA-256 of the uploaded bytes; names content-addressed files."""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def process_upload(file_bytes: bytes, original_filename: str, file_hash: str = None) -> tuple[str, str, list[dict], str]:
     """
     Process an uploaded image:
-    1. Fix orientation from EXIF
-    2. Resize to max 1920px width (maintain aspect ratio)
+    1. Decode at reduced scale and resize to max 1920px width (maintain aspect ratio)
+    2. Fix orientation from EXIF
     3. Save as JPEG at 85% quality
-    4. Generate 400px thumbnail
+    4. Write the responsive variant ladder (VARIANT_WIDTHS x VARIANT_FORMATS)
+    5. Save the 400px thumbnail (reusing the 400px variant when the ladder has one)
+    6. Perceptual hash of the thumbnail
+
+    With `file_hash` (content_hash of the bytes) files are stored under
+    content-addressed paths (<dir>/<hash[:2]>/<hash>...), so the same upload
+    always maps to the same files; otherwise they get a timestamped unique name.
     
     Returns:
-        (full_image_relative_path, thumbnail_relative_path)
+        (full_image_relative_path, thumbnail_relative_path, variants, perceptual_hash) - variants: see build_variants
     """
     ensure_dirs()
     
-    # Generate unique filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    unique_id = uuid.uuid4().hex[:8]
+    if file_hash:
+        base_name = file_hash
+    else:
+        # Generate unique filename
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        unique_id = uuid.uuid4().hex[:8]
+        base_name = f"{timestamp}_{unique_id}"
     ext = "jpg"  # Always save as JPEG
-    base_name = f"{timestamp}_{unique_id}"
     
     full_filename = f"{base_name}.{ext}"
     thumb_filename = f"{base_name}_thumb.{ext}"
     
-    full_path = os.path.join(FULL_DIR, full_filename)
-    thumb_path = os.path.join(THUMB_DIR, thumb_filename)
+    full_dir = _content_dir(FULL_DIR, file_hash)
+    thumb_dir = _content_dir(THUMB_DIR, file_hash)
+    os.makedirs(full_dir, exist_ok=True)
+    os.makedirs(thumb_dir, exist_ok=True)
+    full_path = os.path.join(full_dir, full_filename)
+    thumb_path = os.path.join(thumb_dir, thumb_filename)
     
-    # Open and process
-    img = Image.open(io.BytesIO(file_bytes))
-    
-    # Convert to RGB if needed (handles PNG with alpha, etc.)
-    if img.mode in ('RGBA', 'LA', 'P'):
-        background = Image.new('RGB', img.size, (255, 255, 255))
-        if img.mode == 'P':
-            img = img.convert('RGBA')
-        background.paste(img, mask=img.split()[-1] if 'A' in img.mode else None)
-        img = background
-    elif img.mode != 'RGB':
-        img = img.convert('RGB')
-    
-    # Fix phone camera orientation
-    img = fix_orientation(img)
-    
-    # Resize full-size (only if larger than MAX_WIDTH)
-    w, h = img.size
-    if w > MAX_WIDTH:
-        ratio = MAX_WIDTH / w
-        new_h = int(h * ratio)
-        img_full = img.resize((MAX_WIDTH, new_h), Image.LANCZOS)
-    else:
-        img_full = img.copy()
+    img_full = decode_scaled(file_bytes, MAX_WIDTH)
     
     # Save full-size
     img_full.save(full_path, "JPEG", quality=JPEG_QUALITY, optimize=True)
+
+    variants, resized = build_variants(img_full, base_name, content_hash=file_hash)
     
-    # Generate thumbnail
-    ratio = THUMB_WIDTH / img.size[0]
-    thumb_h = int(img.size[1] * ratio)
-    img_thumb = img.resize((THUMB_WIDTH, thumb_h), Image.LANCZOS)
-    img_thumb.save(thumb_path, "JPEG", quality=80, optimize=True)
+    # Generate thumbnail (reducing_gap: integer reduce first, LANCZOS for the last step)
+    img_thumb = resized.get(THUMB_WIDTH)
+    if img_thumb is None:
+        ratio = THUMB_WIDTH / img_full.size[0]
+        thumb_h = max(1, int(img_full.size[1] * ratio))
+        img_thumb = img_full.resize((THUMB_WIDTH, thumb_h), Image.LANCZOS, reducing_gap=3.0)
+    img_thumb.save(thumb_path, "JPEG", quality=THUMB_QUALITY, optimize=True)
     
     # Return relative paths (for serving via static mount)
-    return full_path, thumb_path
+    return full_path, thumb_path, variants, perceptual_hash(img_thumb)
+
+
+class ImagePoolBusy(Exception):
+    """Raised when accepting more photos would exceed IMAGE_QUEUE_LIMIT."""
+
+
+_pool = None
+_pending = 0  # photos queued or in progress in the pool
+_pending_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: never fork the (threaded) server process
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _reset_pool(broken):
+    global _pool
+    if _pool is broken:
+        _pool = None
+        broken.shutdown(wait=False)
+
+
+def _reserve(count: int):
+    global _pending
+    with _pending_lock:
+        if _pending + count > IMAGE_QUEUE_LIMIT:
+            raise ImagePoolBusy(f"Image processing queue is full ({_pending} of {IMAGE_QUEUE_LIMIT} photos pending), please retry shortly")
+        _pending += count
+
+
+def _release(count: int):
+    global _pending
+    with _pending_lock:
+        _pending -= count
+
+
+def _map_in_pool(fn, calls: list) -> list:
+    """fn(*args) for each args tuple in the process pool, in parallel; blocks for the results (or Exceptions), in order."""
+    _reserve(len(calls))
+    try:
+        pool = _get_pool()
+        futures = [pool.submit(fn, *args) for args in calls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        if any(isinstance(r, BrokenProcessPool) for r in results):
+            _reset_pool(pool)  # a worker died (e.g. OOM on a huge image); start fresh next time
+        return results
+    finally:
+        _release(len(calls))
+
+
+def process_uploads(files: list) -> list:
+    """
+    Run process_upload for each (file_bytes, original_filename[, file_hash])
+    in the process pool, all photos of the request in parallel, and wait for
+    them. Blocks: call it from a worker thread (sync route handlers run in
+    one), not from the event loop.
+
+    Returns:
+        one process_upload result tuple - or the raised Exception - per file, in order.
+    Raises:
+        ImagePoolBusy if the queue is full (nothing is processed).
+    """
+    return _map_in_pool(process_upload, files)
+
+
+def build_file_variants(src: str, base_name: str) -> list[dict]:
+    """Worker: the variant ladder (see build_variants) for an already processed photo on disk."""
+    with open(src, "rb") as f:
+        img = decode_scaled(f.read(), MAX_WIDTH)
+    return build_variants(img, base_name)[0]
+
+
+def build_files_variants(sources: list) -> list:
+    """
+    build_file_variants for each (src, base_name) in the process pool. Blocks
+    like process_uploads. Returns the variant lists (or raised Exceptions), in order.
+    Raises:
+        ImagePoolBusy if the queue is full.
+    """
+    return _map_in_pool(build_file_variants, sources)
+
+
+def render_variant(src: str, dst: str, width: int, fmt: str) -> int:
+    """
+    Worker: write `src` (an already processed, upright photo) at most `width`
+    wide in `fmt` to `dst`, atomically. Never upscales. Returns the file size.
+    """
+    with open(src, "rb") as f:
+        img = decode_scaled(f.read(), width)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = f"{dst}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        _save_variant(img, tmp, fmt)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return os.path.getsize(dst)
+
+
+async def render_variant_async(src: str, dst: str, width: int, fmt: str) -> int:
+    """render_variant in the image process pool. Raises ImagePoolBusy if the queue is full."""
+    _reserve(1)
+    try:
+        pool = _get_pool()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, render_variant, src, dst, width, fmt)
+        except BrokenProcessPool:
+            _reset_pool(pool)
+            raise
+    finally:
+        _release(1)
 
 
 def get_file_size_kb(path: str) -> float:
@@ -1,6 +1,11 @@
 
 import pandas as pd
 import models
+import rollups
+import filter_cache
+import data_version
+import delta_sync
+import math
 from datetime import datetime
 from sqlalchemy.orm import Session
 import requests
@@ -11,6 +16,15 @@ DEFAULT_SHEET_URL = "https://docs.google.com/spreadsheets/d/10zFqsggEyiJ94sV0Doj
 SHEET_TAB_NAME = "Work progress (Approved AS works)"
 import time
 
+# Block Centers (Approximated)
+BLOCK_CENTERS = {
+    'DANTEWADA': (18.8956, 81.3503),
+    'GEEDAM': (18.9691, 81.3994),
+    'KUWAKONDA': (18.7303, 81.2585),
+    'KATEKALYAN': (18.8021, 81.5647),
+    'BARSOOR': (19.1033, 81.3789)
+}
+
 # --- Helpers ---
 def fetch_osm_coords(query):
     try:
@@ -40,6 +54,21 @@ def parse_float(row, col_name):
     except:
         return 0.0
 
+def _same_value(old, new):
+    """Whether a parsed sheet value equals what the DB holds (NaN/None alike, floats within rounding)."""
+    if new is None or (isinstance(new, float) and math.isnan(new)):
+        return old is None
+    if old is None:
+        return False
+    if isinstance(old, float) or isinstance(new, float):
+        try:
+            return math.isclose(float(old), float(new), rel_tol=1e-9, abs_tol=1e-9)
+        except (TypeError, ValueError):
+            return False
+    if old == new:
+        return True
+    return str(old) == str(new)
+
 def process_dataframe(df: pd.DataFrame, db: Session):
     """
     Process a DataFrame (from Excel or GSheet) and upsert into the DB.
@@ -87,15 +116,6 @@ def process_dataframe(df: pd.DataFrame, db: Session):
     
     errors = 0
     
-    # Block Centers (Approximated)
-    BLOCK_CENTERS = {
-        'DANTEWADA': (18.8956, 81.3503),
-        'GEEDAM': (18.9691, 81.3994),
-        'KUWAKONDA': (18.7303, 81.2585),
-        'KATEKALYAN': (18.8021, 81.5647),
-        'BARSOOR': (19.1033, 81.3789)
-    }
-
     for idx, row in df.iterrows():
         try:
             # --- 1. Identify Work Code ---
@@ -260,12 +280,20 @@ def process_dataframe(df: pd.DataFrame, db: Session):
             continue
 
     # --- Database Operations ---
+    # Rollup deltas: +1 for the new version of each row, -1 for the old one
+    rollup_deltas = {}
+
     if to_insert:
         db.bulk_insert_mappings(models.Work, to_insert)
+        for item in to_insert:
+            rollups.add(rollup_deltas, item)
         
+    changed = []
     if to_update:
-        # Fetch ID mapping for updates
-        code_to_id = {w.work_code: w.id for w in db.query(models.Work.id, models.Work.work_code).all()}
+        # Fetch ID mapping and current values (rollup dimensions included) for updates
+        columns = sorted(set().union(*(item.keys() for item in to_update)) | {'id', 'agency_name', 'sanctioned_amount'})
+        current_rows = {w.work_code: w for w in db.query(*[getattr(models.Work, c) for c in columns]).all()}
+        code_to_id = {code: w.id for code, w in current_rows.items()}
         
         # Split into batches based on keys to ensure bulk_update works (SQLAlchemy needs uniform keys)
         updates_with_coords = []
@@ -273,7 +301,14 @@ def process_dataframe(df: pd.DataFrame, db: Session):
         
         for item in to_update:
             if item['work_code'] in code_to_id:
+                current = current_rows[item['work_code']]
+                # Rows identical to the sheet are left alone, so they don't show up as delta-sync changes
+                if all(_same_value(getattr(current, key), value) for key, value in item.items()):
+                    continue
                 item['id'] = code_to_id[item['work_code']]
+                changed.append(item['id'])
+                rollups.add(rollup_deltas, current_rows[item['work_code']], -1)
+                rollups.add(rollup_deltas, item)
                 if 'latitude' in item:
                     updates_with_coords.append(item)
                 else:
@@ -284,6 +319,15 @@ def process_dataframe(df: pd.DataFrame, db: Session):
         if updates_without_coords:
             db.bulk_update_mappings(models.Work, updates_without_coords)
 
+    rollups.apply(db, rollup_deltas)
+    if to_insert or changed:
+        # bulk mappings bypass the session events
+        data_version.bump(db)
+        filter_cache.changed(db)
+        inserted_codes = [item['work_code'] for item in to_insert]
+        inserted = [work_id for (work_id,) in db.query(models.Work.id).filter(models.Work.work_code.in_(inserted_codes))] if inserted_codes else []
+        delta_sync.record(db, "work", [(work_id, work_id, delta_sync.OP_UPSERT) for work_id in inserted + changed])
+
     # --- Update Last Sync Time ---
     sync_meta = db.query(models.SystemMetadata).filter(models.SystemMetadata.key == "last_sync_time").first()
     # Use UTC with 'Z' suffix to ensure frontend parses as UTC
@@ -298,11 +342,13 @@ def process_dataframe(df: pd.DataFrame, db: Session):
 
 
     db.commit()
+    filter_cache.invalidate()
     
     return {
         "total_processed": len(df),
         "inserted": len(to_insert),
-        "updated": len(to_update),
+        "updated": len(changed),
+        "unchanged": len(to_update) - len(changed),
         "errors": errors
     }
     return {
@@ -312,14 +358,47 @@ def process_dataframe(df: pd.DataFrame, db: Session):
         "errors": errors
     }
 
+# Works placed at no specific GP by process_dataframe
+UNLOCATED_GP_NAMES = {"BLOCK LEVEL WORK", "DISTRICT LEVEL WORK", "UNKNOWN", "NAN", ""}
+
+def geocode_missing(db: Session, limit: int = None) -> dict:
+    """
+    Look up (Nominatim) the gram panchayats of works the sheet and the GP caches
+    left without coordinates, and place those works at the GP. One query per
+    distinct GP/block pair, at most `limit` pairs; commits after each so a long
+    run keeps its progress if interrupted.
+    """
+    pairs = db.query(models.Work.panchayat, models.Work.block).filter(
+        models.Work.latitude.is_(None), models.Work.panchayat.isnot(None), models.Work.block.isnot(None)
+    ).distinct().all()
+    pairs = [(gp, blk) for gp, blk in pairs if str(gp).strip().upper() not in UNLOCATED_GP_NAMES]
+    if limit is not None:
+        pairs = pairs[:limit]
+
+    located = works = 0
+    for gp, blk in pairs:
+        lat, lng = fetch_osm_coords(f"{gp}, {blk}, Dantewada, Chhattisgarh, India")
+        if lat is None or lng is None:
+            continue
+        rows = db.query(models.Work).filter(
+            models.Work.panchayat == gp, models.Work.block == blk, models.Work.latitude.is_(None)
+        ).all()
+        for work in rows:
+            work.latitude, work.longitude = lat, lng
+        db.commit()
+        located += 1
+        works += len(rows)
+    return {"panchayats": len(pairs), "located": located, "works": works}
+
+def sheet_id_from_url(sheet_url: str):
+    match = re.search(r'/d/([a-zA-Z0-9-_]+)', sheet_url or "")
+    return match.group(1) if match else None
+
 def sync_from_google_sheet(db: Session, sheet_url: str = DEFAULT_SHEET_URL) -> dict:
     """
     Fetches the Google Sheet as CSV and processes it.
     """
-    # Extract ID
-    match = re.search(r'/d/([a-zA-Z0-9-_]+)', sheet_url)
-    sheet_id = match.group(1) if match else None
-    
+    sheet_id = sheet_id_from_url(sheet_url)
     if not sheet_id:
         raise ValueError("Invalid Google Sheet URL")
 
@@ -0,0 +1,320 @@
+"""
+Durable background job queue.
+
+Work that should not run inside a request and must survive a restart (sheet
+sync, exports, geocoding, photo backfills, maintenance scans) is stored as a
+row in the jobs table and picked up by JOB_WORKERS threads in every server
+worker process:
+
+- Claiming is a conditional UPDATE, so each job runs in one thread of one
+  process. Due jobs run highest priority first, then oldest first.
+- A claimed job is invisible to other workers until `locked_until`
+  (VISIBILITY_SECONDS). A heartbeat keeps extending it while the job runs; if
+  the process dies, the job becomes claimable again once it lapses.
+- A failed attempt is retried after an exponential backoff until
+  max_attempts; a handler raising Defer is put back without using an attempt.
+
+Handlers are registered with @handler(kind) and called as fn(db, payload) on
+the worker thread's own session; they return a JSON-serializable result.
+Jobs run at least once: a job whose worker is lost mid-run is run again.
+"""
+
+import json
+import logging
+import os
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import Session
+
+import coordination
+import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "2"))
+VISIBILITY_SECONDS = int(os.environ.get("JOB_VISIBILITY_SECONDS", "300"))
+HEARTBEAT_SECONDS = VISIBILITY_SECONDS / 3
+RETRY_BASE_SECONDS = int(os.environ.get("JOB_RETRY_BASE_SECONDS", "30"))
+RETRY_MAX_SECONDS = 3600
+RETENTION_DAYS = int(os.environ.get("JOB_RETENTION_DAYS", "7"))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+PRIORITY_HIGH = 10    # someone is waiting on it (exports)
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10    # maintenance and backfills
+
+_handlers = {}  # kind -> (fn, max_attempts, priority)
+_running = {}   # job id -> lock token, for the heartbeat
+_running_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+_threads = []
+
+
+class Defer(Exception):
+    """Raised by a handler to put its job back for `seconds` without counting an attempt."""
+
+    def __init__(self, seconds: float = 5, reason: str = ""):
+        super().__init__(reason)
+        self.seconds = seconds
+
+
+def handler(kind: str, max_attempts: int = 3, priority: int = PRIORITY_NORMAL):
+    """Register fn(db, payload) -> result as the handler for jobs of `kind`."""
+    def register(fn):
+        _handlers[kind] = (fn, max_attempts, priority)
+        return fn
+    return register
+
+
+def enqueue(db: Session, kind: str, payload: dict = None, user_id: int = None, priority: int = None,
+            dedupe_key: str = None, delay_seconds: float = 0) -> models.Job:
+    """
+    Queue a job and commit. With `dedupe_key`, a queued or running job with
+    the same key is returned instead of adding another.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for job kind '{kind}'")
+    if dedupe_key:
+        existing = db.query(models.Job).filter(
+            models.Job.dedupe_key == dedupe_key, models.Job.status.in_(ACTIVE_STATUSES)
+        ).order_by(models.Job.id).first()
+        if existing:
+            return existing
+
+    _, max_attempts, default_priority = _handlers[kind]
+    job = models.Job(
+        kind=kind, payload=json.dumps(payload or {}), status=STATUS_QUEUED,
+        priority=default_priority if priority is None else priority, max_attempts=max_attempts,
+        run_after=datetime.utcnow() + timedelta(seconds=delay_seconds),
+        dedupe_key=dedupe_key, user_id=user_id,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _wake.set()
+    return job
+
+
+def add_finished(db: Session, kind: str, payload: dict, result: dict, user_id: int = None) -> models.Job:
+    """Record a job that needed no work (e.g. answered from a cache) so clients can treat it like any other. Commits."""
+    now = datetime.utcnow()
+    job = models.Job(
+        kind=kind, payload=json.dumps(payload), status=STATUS_DONE, priority=PRIORITY_NORMAL, attempts=0, max_attempts=0,
+        run_after=now, user_id=user_id, result=json.dumps(result), started_at=now, finished_at=now,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _claimable(now: datetime):
+    return and_(
+        models.Job.kind.in_(list(_handlers)),
+        or_(
+            and_(models.Job.status == STATUS_QUEUED, models.Job.run_after <= now),
+            # Visibility timeout lapsed: the worker running it is gone
+            and_(models.Job.status == STATUS_RUNNING, models.Job.locked_until < now),
+        ),
+    )
+
+
+def claim(db: Session, token: str):
+    """Take the next due job for `token`, or None. Commits."""
+    while True:
+        now = datetime.utcnow()
+        job_id = db.execute(
+            select(models.Job.id).where(_claimable(now))
+            .order_by(models.Job.priority.desc(), models.Job.id).limit(1)
+        ).scalar()
+        if job_id is None:
+            db.rollback()
+            return None
+        claimed = db.execute(update(models.Job).where(models.Job.id == job_id, _claimable(now)).values(
+            status=STATUS_RUNNING, locked_by=token, locked_until=now + timedelta(seconds=VISIBILITY_SECONDS),
+            attempts=models.Job.attempts + 1, started_at=now,
+        )).rowcount
+        db.commit()
+        if claimed:
+            return db.get(models.Job, job_id)
+        # Another worker took it between the select and the update: look again
+
+
+def _finish(db: Session, job_id: int, token: str, **values) -> bool:
+    """Write the outcome unless the job was taken over meanwhile (lease lapsed). Commits."""
+    updated = db.execute(update(models.Job).where(
+        models.Job.id == job_id, models.Job.locked_by == token, models.Job.status == STATUS_RUNNING
+    ).values(locked_until=None, **values)).rowcount
+    db.commit()
+    return bool(updated)
+
+
+def retry_delay(attempts: int) -> float:
+    return min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS)
+
+
+def run_one(token: str) -> bool:
+    """Claim and run one job. Returns whether there was one."""
+    db = SessionLocal()
+    try:
+        job = claim(db, token)
+        if job is None:
+            return False
+        job_id, kind, attempts, max_attempts = job.id, job.kind, job.attempts, job.max_attempts
+        payload = json.loads(job.payload or "{}")
+    finally:
+        db.close()
+
+    with _running_lock:
+        _running[job_id] = token
+    db = SessionLocal()
+    try:
+        if attempts > max_attempts:
+            # Claimed again after its worker was lost on the last attempt
+            _finish(db, job_id, token, status=STATUS_FAILED, error=f"Gave up after {max_attempts} attempts",
+                    finished_at=datetime.utcnow(), attempts=max_attempts)
+            return True
+
+        fn = _handlers[kind][0]
+        try:
+            result = fn(db, payload)
+        except Defer as e:
+            db.rollback()
+            _finish(db, job_id, token, status=STATUS_QUEUED, attempts=attempts - 1, locked_by=None,
+                    run_after=datetime.utcnow() + timedelta(seconds=e.seconds))
+            return True
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Job {job_id} ({kind}) attempt {attempts} failed: {e}\n{traceback.format_exc()}")
+            if attempts < max_attempts:
+                _finish(db, job_id, token, status=STATUS_QUEUED, error=str(e), locked_by=None,
+                        run_after=datetime.utcnow() + timedelta(seconds=retry_delay(attempts)))
+            else:
+                _finish(db, job_id, token, status=STATUS_FAILED, error=str(e), finished_at=datetime.utcnow())
+            return True
+
+        if not _finish(db, job_id, token, status=STATUS_DONE, error=None, finished_at=datetime.utcnow(),
+                       result=json.dumps(result, default=str)):
+            logger.warning(f"Job {job_id} ({kind}) finished after another worker took it over")
+        return True
+    finally:
+        with _running_lock:
+            _running.pop(job_id, None)
+        db.close()
+
+
+def _heartbeat():
+    """Extend the visibility timeout of the jobs this process is running."""
+    while not _stop.wait(HEARTBEAT_SECONDS):
+        with _running_lock:
+            running = dict(_running)
+        if not running:
+            continue
+        db = SessionLocal()
+        try:
+            locked_until = datetime.utcnow() + timedelta(seconds=VISIBILITY_SECONDS)
+            for job_id, token in running.items():
+                db.execute(update(models.Job).where(
+                    models.Job.id == job_id, models.Job.locked_by == token, models.Job.status == STATUS_RUNNING
+                ).values(locked_until=locked_until))
+            db.commit()
+        except Exception as e:
+            logger.error(f"Job heartbeat failed: {e}")
+        finally:
+            db.close()
+
+
+def _work(token: str):
+    while not _stop.is_set():
+        try:
+            if run_one(token):
+                continue
+        except Exception as e:
+            logger.error(f"Job worker {token} error: {e}")
+        _wake.wait(POLL_SECONDS)
+        _wake.clear()
+
+
+def start():
+    """Start this process's job worker threads and heartbeat."""
+    if _threads:
+        return
+    _stop.clear()
+    for n in range(JOB_WORKERS):
+        token = f"{coordination.WORKER_ID}/{n}"
+        _threads.append(threading.Thread(target=_work, args=(token,), name=f"job-worker-{n}", daemon=True))
+    _threads.append(threading.Thread(target=_heartbeat, name="job-heartbeat", daemon=True))
+    for t in _threads:
+        t.start()
+
+
+def stop(db: Session):
+    """
+    Stop taking jobs and hand back the ones still running here, so another
+    worker (or this one after a restart) picks them up right away. Commits.
+    """
+    _stop.set()
+    _wake.set()
+    db.execute(update(models.Job).where(
+        models.Job.status == STATUS_RUNNING, models.Job.locked_by.like(f"{coordination.WORKER_ID}/%")
+    ).values(status=STATUS_QUEUED, locked_by=None, locked_until=None, attempts=models.Job.attempts - 1))
+    db.commit()
+
+
+def cancel(db: Session, job: models.Job) -> bool:
+    """Cancel a job that has not started yet. Commits. Returns whether it was cancelled."""
+    cancelled = db.execute(update(models.Job).where(
+        models.Job.id == job.id, models.Job.status == STATUS_QUEUED
+    ).values(status=STATUS_CANCELLED, finished_at=datetime.utcnow())).rowcount
+    db.commit()
+    db.refresh(job)
+    return bool(cancelled)
+
+
+def prune(db: Session) -> int:
+    """Delete finished jobs older than RETENTION_DAYS. Commits. Returns the number removed."""
+    cutoff = datetime.utcnow() - timedelta(days=RETENTION_DAYS)
+    removed = db.query(models.Job).filter(
+        models.Job.status.notin_(ACTIVE_STATUSES), models.Job.finished_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+
+def payload_of(job: models.Job) -> dict:
+    return json.loads(job.payload) if job.payload else {}
+
+
+def result_of(job: models.Job):
+    return json.loads(job.result) if job.result else None
+
+
+def public(job: models.Job) -> dict:
+    """Job fields returned to clients."""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "priority": job.priority,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "user_id": job.user_id,
+        "result": result_of(job),
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "run_after": job.run_after.isoformat() if job.status == STATUS_QUEUED and job.run_after else None,
+    }
@@ -6,7 +6,7 @@ import os
 import logging
 import sys
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Setup Logging first
 logging.basicConfig(level=logging.INFO)
@@ -71,6 +71,13 @@ try:
     from database import SessionLocal, engine, Base
     import ingester
     import init_admin
+    import rollups
+    import upload_sessions
+    import delta_sync
+    import auth
+    import coordination
+    import job_queue
+    import models
     from routes import router
 
     # Mount Uploads
@@ -123,32 +130,136 @@ try:
 
             return {"message": "Frontend not found, but API is alive"}
 
-    # Scheduler
+    SHEET_SYNC_HOURS = int(os.environ.get("SHEET_SYNC_HOURS", "24"))
+
+    # Scheduler. Every worker process runs one, but the jobs only do anything
+    # in the worker holding the scheduler lease (see coordination).
     scheduler = AsyncIOScheduler()
+    # The lease renewal runs every few seconds in every worker: don't log each run
+    logging.getLogger("apscheduler.executors.default").setLevel(logging.WARNING)
+
+    def leader_only(job):
+        def run():
+            if coordination.holds_lease(coordination.SCHEDULER_LEASE):
+                job()
+        run.__name__ = job.__name__
+        return run
+
+    def renew_scheduler_lease():
+        db = SessionLocal()
+        try:
+            was_leader = coordination.holds_lease(coordination.SCHEDULER_LEASE)
+            if coordination.acquire_lease(db, coordination.SCHEDULER_LEASE) and not was_leader:
+                logger.info(f"Worker {coordination.WORKER_ID} now runs the scheduled jobs")
+        except Exception as e:
+            logger.error(f"Scheduler lease renewal failed: {e}")
+        finally:
+            db.close()
+
+    def run_scheduled_sync():
+        # Checked hourly against the job table rather than a 24h interval, which
+        # restarts with the process: the daily sync happens even if workers restart often.
+        # Only queues the sync; a job worker (in any process) runs it.
+        db = SessionLocal()
+        try:
+            since = datetime.utcnow() - timedelta(hours=SHEET_SYNC_HOURS)
+            if db.query(models.Job.id).filter(models.Job.kind == "sheet_sync", models.Job.created_at > since).first():
+                return
+            url = ingester.DEFAULT_SHEET_URL
+            job = job_queue.enqueue(db, "sheet_sync", {"sheet_url": url}, dedupe_key=f"sheet_sync:{url}")
+            logger.info(f"Scheduled sync queued as job {job.id}")
+        except Exception as e:
+            logger.error(f"Queueing scheduled sync failed: {e}")
+        finally:
+            db.close()
+
+    def run_upload_gc():
+        # Plain function: the scheduler runs it in a thread, off the event loop
+        db = SessionLocal()
+        try:
+            removed = upload_sessions.gc(db)
+            if removed:
+                logger.info(f"Removed {removed} abandoned upload session(s)")
+        except Exception as e:
+            logger.error(f"Upload session cleanup failed: {e}")
+        finally:
+            db.close()
+
+    def run_sync_log_prune():
+        db = SessionLocal()
+        try:
+            removed = delta_sync.prune(db)
+            if removed:
+                logger.info(f"Pruned {removed} sync change log entries")
+        except Exception as e:
+            logger.error(f"Sync change log pruning failed: {e}")
+        finally:
+            db.close()
 
-    async def run_scheduled_sync():
-        logger.info("Starting Scheduled Sync...")
+    def run_token_gc():
         db = SessionLocal()
         try:
-            ingester.sync_from_google_sheet(db, ingester.DEFAULT_SHEET_URL)
-            logger.info("Sync Complete.")
+            removed = auth.gc(db)
+            if removed:
+                logger.info(f"Removed {removed} expired refresh token(s)")
         except Exception as e:
-            logger.error(f"Sync Failed: {e}")
+            logger.error(f"Token cleanup failed: {e}")
+        finally:
+            db.close()
+
+    def run_job_prune():
+        db = SessionLocal()
+        try:
+            removed = job_queue.prune(db)
+            if removed:
+                logger.info(f"Removed {removed} finished job(s)")
+        except Exception as e:
+            logger.error(f"Job cleanup failed: {e}")
         finally:
             db.close()
 
     @app.on_event("startup")
     def startup():
         try:
-            Base.metadata.create_all(bind=engine)
-            init_admin.create_admin_if_missing()
+            # Worker processes start together: one at a time creates tables and seed users
+            with coordination.file_lock(os.path.join(DATA_DIR, ".startup.lock")):
+                Base.metadata.create_all(bind=engine)
+                init_admin.create_admin_if_missing()
+
+                db = SessionLocal()
+                try:
+                    rollups.ensure_built(db)
+                finally:
+                    db.close()
             
-            scheduler.add_job(run_scheduled_sync, 'interval', hours=24)
+            scheduler.add_job(renew_scheduler_lease, 'interval', seconds=coordination.RENEW_SECONDS, next_run_time=datetime.now())
+            scheduler.add_job(leader_only(run_scheduled_sync), 'interval', hours=1)
+            scheduler.add_job(leader_only(run_upload_gc), 'interval', hours=1)
+            scheduler.add_job(leader_only(run_sync_log_prune), 'interval', hours=24)
+            scheduler.add_job(leader_only(run_token_gc), 'interval', hours=24)
+            scheduler.add_job(leader_only(run_job_prune), 'interval', hours=24)
             scheduler.start()
+            job_queue.start()
             logger.info("Startup Complete.")
         except Exception as e:
             logger.critical(f"Startup Event Error: {e}")
 
+    @app.on_event("shutdown")
+    def shutdown():
+        if scheduler.running:
+            scheduler.shutdown(wait=False)
+        db = SessionLocal()
+        try:
+            job_queue.stop(db)
+        finally:
+            db.close()
+        if coordination.holds_lease(coordination.SCHEDULER_LEASE):
+            db = SessionLocal()
+            try:
+                coordination.release_lease(db, coordination.SCHEDULER_LEASE)
+            finally:
+                db.close()
+
 
 except Exception as e:
     STARTUP_ERROR = f"{str(e)}\n{traceback.format_exc()}"
@@ -1,5 +1,5 @@
 
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text, UniqueConstraint
 from database import Base
 from sqlalchemy import create_engine
 from sqlalchemy.orm import relationship
@@ -115,6 +115,137 @@ class WorkPhoto(Base):
     uploaded_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     work = relationship("Work", back_populates="work_photos")
+    variants = relationship("WorkPhotoVariant", back_populates="photo", cascade="all, delete-orphan",
+                            order_by="WorkPhotoVariant.width")
+
+class WorkPhotoVariant(Base):
+    """Resized copy of a WorkPhoto (responsive ladder, e.g. 160/400/800/1600px in WebP and JPEG)."""
+    __tablename__ = "work_photo_variants"
+    id = Column(Integer, primary_key=True, index=True)
+    photo_id = Column(Integer, ForeignKey("work_photos.id"), index=True)
+    width = Column(Integer)
+    height = Column(Integer)
+    format = Column(String)           # webp, jpeg
+    path = Column(String)
+    size_bytes = Column(Integer)
+
+    photo = relationship("WorkPhoto", back_populates="variants")
+
+    __table_args__ = (UniqueConstraint("photo_id", "width", "format", name="uq_work_photo_variant"),)
+
+class PhotoBlob(Base):
+    """
+    One processed upload, stored under content-addressed paths. WorkPhotos that
+    share its image_path (re-uploads of the same bytes) share its files.
+    """
+    __tablename__ = "photo_blobs"
+    sha256 = Column(String, primary_key=True)          # of the uploaded bytes
+    phash = Column(String, index=True)                 # 64-bit dHash, 16 hex digits
+    image_path = Column(String, unique=True, index=True)
+    thumbnail_path = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class PhotoDuplicate(Base):
+    """WorkPhotos that look like (but are not byte-identical to) an earlier photo of the same work."""
+    __tablename__ = "photo_duplicates"
+    id = Column(Integer, primary_key=True, index=True)
+    photo_id = Column(Integer, ForeignKey("work_photos.id"), unique=True, index=True)
+    duplicate_of_id = Column(Integer, ForeignKey("work_photos.id"), index=True)
+    work_id = Column(Integer, ForeignKey("works.id"), index=True)
+    distance = Column(Integer)                         # differing perceptual-hash bits
+    flagged_at = Column(DateTime, default=datetime.datetime.utcnow)
+    reviewed = Column(Boolean, default=False)
+
+class UploadSession(Base):
+    """Resumable photo upload: chunks are appended to a file on disk until finalized."""
+    __tablename__ = "upload_sessions"
+    id = Column(String, primary_key=True)             # random hex token
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    work_id = Column(Integer, ForeignKey("works.id"), index=True)
+    filename = Column(String)
+    size = Column(Integer)                             # declared total bytes
+    sha256 = Column(String, nullable=True)             # optional, checked on finalize
+    category = Column(String, default="During")
+    caption = Column(Text, nullable=True)
+    status = Column(String, default="open", index=True)  # open, done
+    photo_id = Column(Integer, ForeignKey("work_photos.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class SyncReceipt(Base):
+    """Result of an offline-queued item already applied, keyed by the client's idempotency id."""
+    __tablename__ = "sync_receipts"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    client_id = Column(String)
+    inspection_id = Column(Integer, ForeignKey("inspections.id"), nullable=True)
+    result = Column(Text)                              # JSON returned for the item
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+    __table_args__ = (UniqueConstraint("user_id", "client_id", name="uq_sync_receipt_client_id"),)
+
+class SyncChange(Base):
+    """
+    Append-only change log for delta sync: one entry per written row of a
+    tracked table. `id` is the sync token order; op "delete" entries are tombstones.
+    """
+    __tablename__ = "sync_changes"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String)                            # work, assignment, photo, inspection, user
+    entity_id = Column(Integer)
+    work_id = Column(Integer, index=True, nullable=True)
+    op = Column(String)                                # upsert, delete
+    changed_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+    # Tokens must never go backwards: without AUTOINCREMENT, SQLite reuses ids
+    # once prune() has emptied the table
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class RefreshToken(Base):
+    """Long-lived refresh token, stored as its SHA-256. Rotated on every use (replaced_by_id)."""
+    __tablename__ = "refresh_tokens"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    token_hash = Column(String, unique=True, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime)
+    revoked_at = Column(DateTime, nullable=True)
+    replaced_by_id = Column(Integer, nullable=True)
+
+class TokenRevocation(Base):
+    """Access tokens of `user_id` issued before `revoked_at` are no longer accepted."""
+    __tablename__ = "token_revocations"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    revoked_at = Column(DateTime, index=True)
+
+class WorkerLease(Base):
+    """A named lease held by one server worker process until `expires_at` (see coordination)."""
+    __tablename__ = "worker_leases"
+    name = Column(String, primary_key=True)
+    holder = Column(String)                            # host:pid:nonce of the worker
+    acquired_at = Column(DateTime)
+    expires_at = Column(DateTime)
+
+class Job(Base):
+    """Background job in the durable queue (see job_queue). `payload` and `result` are JSON."""
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, index=True)                  # handler name, e.g. export, sheet_sync
+    payload = Column(Text, nullable=True)
+    status = Column(String, default="queued", index=True)  # queued, running, done, failed, cancelled
+    priority = Column(Integer, default=0)              # higher runs first
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    run_after = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    locked_by = Column(String, nullable=True)          # worker/thread running it
+    locked_until = Column(DateTime, nullable=True)     # visibility timeout, extended while it runs
+    dedupe_key = Column(String, nullable=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
 
 # New Model for System-wide settings/metadata
 class SystemMetadata(Base):
@@ -122,3 +253,38 @@ class SystemMetadata(Base):
     key = Column(String, primary_key=True, index=True)
     value = Column(String, nullable=True)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class GpsAnomaly(Base):
+    """Inspections whose submitted GPS fix is far from the work / GP / block."""
+    __tablename__ = "gps_anomalies"
+    id = Column(Integer, primary_key=True, index=True)
+    inspection_id = Column(Integer, ForeignKey("inspections.id"), unique=True, index=True)
+    work_id = Column(Integer, ForeignKey("works.id"), index=True)
+    reason = Column(String, index=True)  # invalid_coordinates, outside_block, far_from_site, near_gp_only (low severity)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    distance_work_km = Column(Float, nullable=True)
+    distance_gp_km = Column(Float, nullable=True)
+    distance_block_km = Column(Float, nullable=True)
+    flagged_at = Column(DateTime, default=datetime.datetime.utcnow)
+    reviewed = Column(Boolean, default=False)
+
+    inspection = relationship("Inspection")
+    work = relationship("Work")
+
+class WorkRollup(Base):
+    """Work counts and sanctioned sums per dashboard group, maintained by rollups.py."""
+    __tablename__ = "work_rollups"
+    __table_args__ = (
+        UniqueConstraint("block", "panchayat", "department", "financial_year", "current_status", "panchayat_agency",
+                         name="uq_work_rollup_key"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    block = Column(String, default="", index=True)           # '' = NULL in works
+    panchayat = Column(String, default="")
+    department = Column(String, default="")
+    financial_year = Column(String, default="")
+    current_status = Column(String, default="")
+    panchayat_agency = Column(Boolean, default=False)        # agency is a Janpad Panchayat CEO
+    work_count = Column(Integer, default=0)
+    sanctioned_sum = Column(Float, default=0.0)
@@ -0,0 +1,235 @@
+"""
+Offline bundles for field officers.
+
+One gzip-compressed SQLite file per officer holding everything needed to work
+without connectivity for days: their assigned works, each photo's smallest
+stored variant as an embedded thumbnail, the GP centroids of those works and a
+visiting order over the open ones (route_planner). The client loads it in one
+step (e.g. sql.js over the decompressed bytes) and afterwards keeps it current
+with /sync/changes, starting from the bundle's sync_token.
+
+Bundles are cached per officer and data version. The uncompressed database of
+the last build is kept as the base of the next one: only works touched since
+its sync token (delta_sync) or newly assigned are re-read, unassigned ones are
+dropped, and thumbnails of photos already in it are kept, so rebuilding after
+a few changes costs a few queries rather than re-reading every image.
+
+Tables: meta(key, value), works, photos(id, work_id, ..., thumb BLOB),
+gp(panchayat, block, latitude, longitude), route(work_id, ord, day, leg_km).
+"""
+
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import datetime
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+import coordination
+import data_version
+import delta_sync
+import gps_check
+import image_utils
+import ingester
+import models
+import route_planner
+from database import DATA_DIR
+
+BUNDLE_DIR = os.path.join(DATA_DIR, "offline_bundles")
+BUNDLE_FORMAT = 1  # bump when the bundle schema changes; older bases are rebuilt from scratch
+
+WORK_COLUMNS = [
+    "id", "work_code", "work_name", "work_name_brief", "department", "financial_year", "block", "panchayat",
+    "agency_name", "current_status", "work_percentage", "sanctioned_amount", "latitude", "longitude",
+    "assignment_status", "inspection_deadline", "remark", "admin_remarks",
+]
+PHOTO_COLUMNS = ["id", "work_id", "category", "caption", "uploaded_by", "uploaded_at", "image_path", "thumb_format", "thumb"]
+
+SCHEMA = f"""
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE works ({", ".join(c + (" INTEGER PRIMARY KEY" if c == "id" else "") for c in WORK_COLUMNS)});
+CREATE TABLE photos ({", ".join(c + (" INTEGER PRIMARY KEY" if c == "id" else "") for c in PHOTO_COLUMNS)});
+CREATE INDEX photos_work_id ON photos (work_id);
+CREATE TABLE gp (panchayat TEXT, block TEXT, latitude REAL, longitude REAL, PRIMARY KEY (panchayat, block));
+CREATE TABLE route (work_id INTEGER PRIMARY KEY, ord INTEGER, day INTEGER, leg_km REAL);
+"""
+
+_locks = {}  # user id -> lock; one build per officer at a time (plus a file lock across worker processes)
+_locks_guard = threading.Lock()
+
+
+def _user_dir(user_id: int) -> str:
+    return os.path.join(BUNDLE_DIR, str(user_id))
+
+
+def bundle_path(user_id: int, version: int) -> str:
+    return os.path.join(_user_dir(user_id), f"bundle-{version}.sqlite.gz")
+
+
+def _assigned_work_ids(db: Session, user_id: int) -> set:
+    assigned_ids = db.query(models.WorkAssignment.work_id).filter(models.WorkAssignment.user_id == user_id)
+    return {row[0] for row in db.query(models.Work.id).filter(
+        or_(models.Work.assigned_officer_id == user_id, models.Work.id.in_(assigned_ids))
+    )}
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _smallest_thumbnail(photo: models.WorkPhoto, variants: list):
+    """(format, bytes) of the smallest stored variant, else the legacy JPEG thumbnail; (None, None) if no file."""
+    candidates = [(v.size_bytes or 0, v.format, v.path) for v in variants]
+    candidates.sort()
+    candidates.append((0, "jpeg", photo.thumbnail_path))
+    for _, fmt, path in candidates:
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                return fmt, f.read()
+    return None, None
+
+
+def _open_base(path: str, pruned_through: int, head: int):
+    """The previous build's database and its sync token, or (None, None) if it can't be built upon."""
+    if not os.path.exists(path):
+        return None, None
+    try:
+        conn = sqlite3.connect(path)
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        token = int(meta.get("sync_token", -1))
+        if int(meta.get("format", 0)) == BUNDLE_FORMAT and pruned_through <= token <= head:
+            return conn, token
+        conn.close()
+    except (sqlite3.Error, ValueError):
+        pass
+    os.remove(path)
+    return None, None
+
+
+def _touched_work_ids(db: Session, since: int) -> set:
+    touched = set()
+    while True:
+        entries, since, has_more = delta_sync.changes(db, since, 5000)
+        touched.update(e.work_id for e in entries if e.work_id is not None)
+        if not has_more:
+            return touched
+
+
+def _write_works(db: Session, conn, work_ids: list, known_thumbs: dict):
+    for start in range(0, len(work_ids), 900):  # stay under SQLite's bound-parameter limit
+        chunk = work_ids[start:start + 900]
+        works = db.query(models.Work).filter(models.Work.id.in_(chunk)).all()
+        conn.executemany(
+            f"INSERT INTO works VALUES ({', '.join('?' * len(WORK_COLUMNS))})",
+            [[_value(getattr(w, c)) for c in WORK_COLUMNS] for w in works]
+        )
+        photos = db.query(models.WorkPhoto).filter(models.WorkPhoto.work_id.in_(chunk)).all()
+        variants = {}
+        for v in db.query(models.WorkPhotoVariant).filter(
+            models.WorkPhotoVariant.photo_id.in_([p.id for p in photos if (p.id, p.image_path) not in known_thumbs])
+        ):
+            variants.setdefault(v.photo_id, []).append(v)
+        rows = []
+        for p in photos:
+            fmt, thumb = known_thumbs.get((p.id, p.image_path)) or _smallest_thumbnail(p, variants.get(p.id, []))
+            rows.append([p.id, p.work_id, p.category, p.caption, p.uploaded_by, _value(p.uploaded_at), p.image_path, fmt, thumb])
+        conn.executemany(f"INSERT INTO photos VALUES ({', '.join('?' * len(PHOTO_COLUMNS))})", rows)
+
+
+def _write_gp_and_route(conn):
+    conn.execute("DELETE FROM gp")
+    conn.execute("DELETE FROM route")
+    centroids = gps_check.gp_centroids()
+    gps = set()
+    for panchayat, block in conn.execute("SELECT DISTINCT panchayat, block FROM works"):
+        centroid = centroids.get(gps_check.gp_key(panchayat, block))
+        if centroid:
+            gps.add((panchayat, block, centroid[0], centroid[1]))
+    conn.executemany("INSERT INTO gp VALUES (?, ?, ?, ?)", sorted(gps, key=lambda g: (str(g[0]), str(g[1]))))
+
+    stops = [{"work_id": work_id, "latitude": lat, "longitude": lng} for work_id, lat, lng in conn.execute(
+        "SELECT id, latitude, longitude FROM works WHERE latitude IS NOT NULL AND longitude IS NOT NULL "
+        "AND (current_status IS NULL OR current_status NOT IN ('Completed', 'Cancelled')) ORDER BY id"
+    )]
+    # Same default start as the route-plan endpoint
+    plan = route_planner.plan_route(ingester.BLOCK_CENTERS['DANTEWADA'], stops)
+    conn.executemany("INSERT INTO route VALUES (?, ?, ?, ?)",
+                     [(s["work_id"], s["order"], s["day"], s["leg_km"]) for s in plan["stops"]])
+
+
+def build(db: Session, user_id: int) -> tuple[str, int]:
+    """
+    Path and data version of the officer's bundle, building it if the cached
+    one is older than the current data version. Blocking (run it in a thread).
+    """
+    with _locks_guard:
+        lock = _locks.setdefault(user_id, threading.Lock())
+    os.makedirs(_user_dir(user_id), exist_ok=True)
+    with lock, coordination.file_lock(os.path.join(_user_dir(user_id), ".lock")):
+        version = data_version.current(db)
+        path = bundle_path(user_id, version)
+        if os.path.exists(path):
+            return path, version
+
+        base_path = os.path.join(_user_dir(user_id), "base.sqlite")
+        # Token read before the data, so anything written meanwhile is re-read next time
+        token = delta_sync.head(db)
+        work_ids = _assigned_work_ids(db, user_id)
+
+        conn, base_token = _open_base(base_path, delta_sync.pruned_through(db), token)
+        known_thumbs = {}
+        if conn is None:
+            conn = sqlite3.connect(base_path)
+            conn.executescript(SCHEMA)
+            refresh, stale = work_ids, []
+        else:
+            have = {row[0] for row in conn.execute("SELECT id FROM works")}
+            refresh = (work_ids & _touched_work_ids(db, base_token)) | (work_ids - have)
+            stale = (have - work_ids) | refresh
+            # Keyed on the (content-addressed) image path too: a deleted photo's id
+            # may have been reused by a new upload since the base was built
+            for photo_id, image_path, fmt, thumb in conn.execute(
+                "SELECT id, image_path, thumb_format, thumb FROM photos WHERE thumb IS NOT NULL"
+            ):
+                known_thumbs[(photo_id, image_path)] = (fmt, thumb)
+            stale = list(stale)
+            for start in range(0, len(stale), 900):
+                chunk = stale[start:start + 900]
+                marks = ", ".join("?" * len(chunk))
+                conn.execute(f"DELETE FROM works WHERE id IN ({marks})", chunk)
+                conn.execute(f"DELETE FROM photos WHERE work_id IN ({marks})", chunk)
+
+        try:
+            _write_works(db, conn, sorted(refresh), known_thumbs)
+            if refresh or stale:
+                _write_gp_and_route(conn)
+            conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+                ("format", str(BUNDLE_FORMAT)),
+                ("user_id", str(user_id)),
+                ("data_version", str(version)),
+                ("sync_token", str(token)),
+                ("generated_at", datetime.utcnow().isoformat() + "Z"),
+                ("thumbnail_width", str(min(image_utils.VARIANT_WIDTHS))),
+            ])
+            conn.commit()
+            conn.execute("VACUUM")
+        except Exception:
+            conn.close()
+            os.remove(base_path)
+            raise
+        conn.close()
+
+        tmp_path = path + ".tmp"
+        with open(base_path, "rb") as src, gzip.open(tmp_path, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, path)
+        for name in os.listdir(_user_dir(user_id)):
+            if name.startswith("bundle-") and name != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(_user_dir(user_id), name))
+                except OSError:
+                    pass
+        return path, version
@@ -1,5 +1,13 @@
 import os
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from io import BytesIO
+from xml.sax.saxutils import escape
+from reportlab import rl_config
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -7,88 +15,299 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib.units import inch
 from PIL import Image
 
-def build_visual_pdf(works_data):
+from disk_cache import DiskCache
+
+# Photos are drawn at a fixed size; pre-scaling them to exactly that size at
+# PRINT_DPI lets ReportLab embed the small JPEG as-is instead of loading and
+# scaling every full thumbnail.
+PHOTO_WIDTH = 2.5 * inch
+PHOTO_HEIGHT = 1.8 * inch
+PRINT_DPI = 150
+PRINT_SIZE = (int(PHOTO_WIDTH / inch * PRINT_DPI), int(PHOTO_HEIGHT / inch * PRINT_DPI))
+PRINT_QUALITY = 80
+PRINT_CACHE_DIR = os.path.join(os.environ.get("DATA_DIR", "."), "pdf_cache")
+PRINT_CACHE_MAX_BYTES = int(os.environ.get("PDF_PRINT_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+PHOTOS_PER_WORK = 3      # We will show up to 3 most recent photos side by side
+CHUNK_SIZE = 250         # works rendered per worker task
+# One process pool shared by all reports; at most PDF_QUEUE_LIMIT reports are
+# built at a time (per server process), further requests are refused
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_QUEUE_LIMIT = int(os.environ.get("PDF_QUEUE_LIMIT", "2"))
+
+TITLE = "Dantewada Infrastructure - Visual Inspection Report"
+
+# Embed JPEG streams as raw binary: ASCII85-wrapping them is done in pure Python
+# when reportlab's C accelerator is missing and dominated rendering time.
+rl_config.useA85 = 0
+
+
+def _styles():
+    styles = getSampleStyleSheet()
+    return {
+        "title": ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=16, textColor=colors.HexColor('#1E3A8A'), spaceAfter=14),
+        "heading": ParagraphStyle('WorkHeading', parent=styles['Heading2'], fontSize=12, textColor=colors.black, spaceAfter=6),
+        "normal": ParagraphStyle('NormalStyle', parent=styles['Normal'], fontSize=10, textColor=colors.darkgrey),
+    }
+
+
+def _doc(target):
+    return SimpleDocTemplate(target, pagesize=landscape(A4), rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30)
+
+
+def _photo_source(photo):
+    return photo.get('thumbnail_path') or photo.get('image_path')
+
+
+class PdfPoolBusy(Exception):
+    """Raised when PDF_QUEUE_LIMIT reports are already being built."""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_reports = 0  # reports being built in this process
+_reports_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: never fork the (threaded) server process
+            _pool = ProcessPoolExecutor(max_workers=max(PDF_WORKERS, 1), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _map_in_pool(fn, jobs, chunksize=1) -> list:
+    pool = _get_pool()
+    try:
+        return list(pool.map(fn, jobs, chunksize=chunksize))
+    except BrokenProcessPool:
+        global _pool
+        with _pool_lock:
+            if _pool is pool:  # a worker died (e.g. OOM); start fresh next time
+                _pool = None
+                pool.shutdown(wait=False)
+        raise
+
+
+@contextmanager
+def report_slot():
     """
-    Given a list of works dictionaries (same format as returned by GET /works),
-    this generates a PDF buffer showcasing the works and their photos side-by-side.
+    Hold one of the PDF_QUEUE_LIMIT report slots while building a report.
+
+    Raises:
+        PdfPoolBusy if all slots are taken.
     """
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30)
-    styles = getSampleStyleSheet()
-    
-    # Custom Styles
-    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=16, textColor=colors.HexColor('#1E3A8A'), spaceAfter=14)
-    heading_style = ParagraphStyle('WorkHeading', parent=styles['Heading2'], fontSize=12, textColor=colors.black, spaceAfter=6)
-    normal_style = ParagraphStyle('NormalStyle', parent=styles['Normal'], fontSize=10, textColor=colors.darkgrey)
-    status_style = ParagraphStyle('StatusStyle', parent=styles['Normal'], fontSize=10, textColor=colors.HexColor('#D97706'), fontName='Helvetica-Bold')
+    global _reports
+    with _reports_lock:
+        if _reports >= PDF_QUEUE_LIMIT:
+            raise PdfPoolBusy(f"{_reports} PDF reports are already being generated, please retry shortly")
+        _reports += 1
+    try:
+        yield
+    finally:
+        with _reports_lock:
+            _reports -= 1
 
-    elements = []
-    
-    # Title
-    elements.append(Paragraph("Dantewada Infrastructure - Visual Inspection Report", title_style))
-    elements.append(Spacer(1, 0.2 * inch))
 
-    # Process each work
+# --- Print-ready photo cache ---
+
+print_cache = DiskCache(PRINT_CACHE_DIR, PRINT_CACHE_MAX_BYTES)
+
+
+def print_cache_path(src: str) -> str:
+    """Cache file for `src` at print size; changes whenever the source file changes."""
+    return print_cache.path_for(src, PRINT_SIZE, extension="jpg")
+
+
+def _prescale(job):
+    """Worker: scale one photo to PRINT_SIZE and write it to the cache. Returns the cache path or None."""
+    src, dst = job
+    try:
+        with Image.open(src) as img:
+            img.draft('RGB', PRINT_SIZE)  # JPEG: decode at a reduced scale
+            img = img.convert('RGB').resize(PRINT_SIZE, Image.LANCZOS)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), suffix=".tmp")
+            os.close(fd)
+            img.save(tmp, "JPEG", quality=PRINT_QUALITY)
+            os.replace(tmp, dst)
+        return dst
+    except Exception as e:
+        print(f"Failed to prepare {src} for PDF: {e}")
+        return None
+
+
+def prepare_photos(works_data, workers: int = PDF_WORKERS) -> dict:
+    """
+    Make sure every photo the report will show has a print-ready copy in the
+    cache, scaling missing ones in the shared process pool (workers > 1)
+    or in this process.
+
+    Returns:
+        {source path: cached print-size path} (sources that fail are left out)
+    """
+    resolved, missing = {}, []
     for work in works_data:
-        # Title of Work
-        work_title = f"[{work['work_code']}] {work['work_name']}"
-        elements.append(Paragraph(work_title, heading_style))
-        
-        # Detail line
-        details_text = (
-            f"<b>Agency:</b> {work.get('agency_name', 'N/A')} | "
-            f"<b>Block:</b> {work.get('block', 'N/A')} | "
-            f"<b>Sanctioned:</b> ₹{work.get('sanctioned_amount', 0)} Lakhs | "
-            f"<b>Status:</b> {work.get('current_status', 'N/A')}"
-        )
-        elements.append(Paragraph(details_text, normal_style))
-        
-        if work.get('admin_remarks'):
-            elements.append(Paragraph(f"<b>Admin Remarks:</b> {work['admin_remarks']}", normal_style))
-            
-        elements.append(Spacer(1, 0.1 * inch))
-        
-        # Photos Table
-        photos = work.get('photos', [])
-        if photos:
-            # We will show up to 3 most recent photos side by side
-            recent_photos = photos[:3]
-            img_row = []
-            caption_row = []
-            
-            for p in recent_photos:
-                img_path = p.get('thumbnail_path') or p.get('image_path')
-                if img_path and os.path.exists(img_path):
-                    try:
-                        # Add image to row
-                        img = RLImage(img_path, width=2.5*inch, height=1.8*inch)
-                        img_row.append(img)
-                        # Build caption
-                        cat = p.get('category', 'Unknown')
-                        date = p.get('uploaded_at', '')[:10] if p.get('uploaded_at') else 'N/A'
-                        caption_row.append(Paragraph(f"<b>{cat}</b> ({date})", normal_style))
-                    except Exception as e:
-                        img_row.append(Paragraph("[Image Error]", normal_style))
-                        caption_row.append(Paragraph("", normal_style))
-                        
-            if img_row:
-                # Pad if less than 3
-                while len(img_row) < 3:
-                    img_row.append("")
-                    caption_row.append("")
-                
-                t = Table([img_row, caption_row], colWidths=[2.6*inch, 2.6*inch, 2.6*inch])
-                t.setStyle(TableStyle([
-                    ('VALIGN', (0,0), (-1,-1), 'TOP'),
-                    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                    ('BOTTOMPADDING', (0,0), (-1,-1), 2),
-                ]))
-                elements.append(t)
+        for photo in work.get('photos', [])[:PHOTOS_PER_WORK]:
+            src = _photo_source(photo)
+            if not src or src in resolved or not os.path.exists(src):
+                continue
+            dst = print_cache_path(src)
+            resolved[src] = dst
+            if not print_cache.hit(dst):
+                missing.append((src, dst))
+
+    if missing:
+        if workers > 1 and len(missing) > 1:
+            results = _map_in_pool(_prescale, missing, chunksize=16)
         else:
-            elements.append(Paragraph("<i>No photos available for this work.</i>", normal_style))
-            
-        elements.append(Spacer(1, 0.3 * inch))
-        
-    doc.build(elements)
+            results = [_prescale(job) for job in missing]
+        for (src, _), dst in zip(missing, results):
+            if dst is None:
+                del resolved[src]
+        print_cache.added(sum(os.path.getsize(dst) for dst in results if dst))
+    return resolved
+
+
+# --- Rendering ---
+
+def _work_elements(work, styles, photo_map) -> list:
+    normal_style = styles["normal"]
+    elements = []
+
+    # Title of Work
+    work_title = f"[{escape(str(work['work_code']))}] {escape(str(work['work_name']))}"
+    elements.append(Paragraph(work_title, styles["heading"]))
+
+    # Detail line
+    details_text = (
+        f"<b>Agency:</b> {escape(str(work.get('agency_name', 'N/A')))} | "
+        f"<b>Block:</b> {escape(str(work.get('block', 'N/A')))} | "
+        f"<b>Sanctioned:</b> ₹{work.get('sanctioned_amount', 0)} Lakhs | "
+        f"<b>Status:</b> {escape(str(work.get('current_status', 'N/A')))}"
+    )
+    elements.append(Paragraph(details_text, normal_style))
+
+    if work.get('admin_remarks'):
+        elements.append(Paragraph(f"<b>Admin Remarks:</b> {escape(str(work['admin_remarks']))}", normal_style))
+
+    elements.append(Spacer(1, 0.1 * inch))
+
+    # Photos Table
+    photos = work.get('photos', [])
+    if photos:
+        img_row = []
+        caption_row = []
+
+        for p in photos[:PHOTOS_PER_WORK]:
+            img_path = photo_map.get(_photo_source(p))
+            if img_path:
+                img_row.append(RLImage(img_path, width=PHOTO_WIDTH, height=PHOTO_HEIGHT))
+                cat = p.get('category', 'Unknown')
+                date = p.get('uploaded_at', '')[:10] if p.get('uploaded_at') else 'N/A'
+                caption_row.append(Paragraph(f"<b>{escape(str(cat))}</b> ({date})", normal_style))
+            elif _photo_source(p) and os.path.exists(_photo_source(p)):
+                img_row.append(Paragraph("[Image Error]", normal_style))
+                caption_row.append(Paragraph("", normal_style))
+
+        if img_row:
+            # Pad if less than 3
+            while len(img_row) < PHOTOS_PER_WORK:
+                img_row.append("")
+                caption_row.append("")
+
+            t = Table([img_row, caption_row], colWidths=[2.6*inch, 2.6*inch, 2.6*inch])
+            t.setStyle(TableStyle([
+                ('VALIGN', (0,0), (-1,-1), 'TOP'),
+                ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+                ('BOTTOMPADDING', (0,0), (-1,-1), 2),
+            ]))
+            elements.append(t)
+    else:
+        elements.append(Paragraph("<i>No photos available for this work.</i>", normal_style))
+
+    elements.append(Spacer(1, 0.3 * inch))
+    return elements
+
+
+def _render(works_data, photo_map, target, with_title=True):
+    styles = _styles()
+    elements = []
+    if with_title:
+        elements.append(Paragraph(TITLE, styles["title"]))
+        elements.append(Spacer(1, 0.2 * inch))
+    for work in works_data:
+        elements.extend(_work_elements(work, styles, photo_map))
+    _doc(target).build(elements)
+
+
+def _render_chunk(job):
+    """Worker: render one chunk of works to its own PDF file."""
+    works_chunk, photo_map, path, with_title = job
+    _render(works_chunk, photo_map, path, with_title)
+    return path
+
+
+def build_visual_pdf(works_data):
+    """
+    Given a list of works dictionaries (same format as returned by GET /works),
+    this generates a PDF buffer showcasing the works and their photos side-by-side.
+    """
+    buffer = BytesIO()
+    with report_slot():
+        _render(works_data, prepare_photos(works_data), buffer)
     buffer.seek(0)
     return buffer
+
+
+def build_visual_pdf_file(works_data, path: str, workers: int = PDF_WORKERS) -> int:
+    """
+    Large-report variant of build_visual_pdf writing to `path`: photos are
+    pre-scaled in the shared process pool, chunks of CHUNK_SIZE works are
+    rendered in parallel and the chunk PDFs are concatenated (requires pypdf;
+    renders serially without it, or with workers <= 1). Returns the number of works.
+
+    Raises:
+        PdfPoolBusy if PDF_QUEUE_LIMIT reports are already being built.
+    """
+    with report_slot():
+        return _build_file(works_data, path, workers)
+
+
+def _build_file(works_data, path: str, workers: int) -> int:
+    photo_map = prepare_photos(works_data, workers)
+    chunks = [works_data[i:i + CHUNK_SIZE] for i in range(0, len(works_data), CHUNK_SIZE)]
+
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        PdfWriter = None
+    if PdfWriter is None or workers <= 1 or len(chunks) <= 1:
+        _render(works_data, photo_map, path)
+        return len(works_data)
+
+    tmp_dir = tempfile.mkdtemp(prefix="pdf_chunks_")
+    try:
+        jobs = []
+        for i, chunk in enumerate(chunks):
+            chunk_map = {}
+            for work in chunk:
+                for photo in work.get('photos', [])[:PHOTOS_PER_WORK]:
+                    src = _photo_source(photo)
+                    if src in photo_map:
+                        chunk_map[src] = photo_map[src]
+            jobs.append((chunk, chunk_map, os.path.join(tmp_dir, f"{i:05d}.pdf"), i == 0))
+        parts = _map_in_pool(_render_chunk, jobs)
+
+        writer = PdfWriter()
+        for part in parts:
+            writer.append(part)
+        with open(path, "wb") as f:
+            writer.write(f)
+    finally:
+        for name in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, name))
+        os.rmdir(tmp_dir)
+    return len(works_data)
@@ -0,0 +1,268 @@
+"""
+Content-addressed photo storage with duplicate detection.
+
+Uploads are identified by the SHA-256 of their bytes. The first upload of some
+bytes is processed (image_utils.process_upload) into files named after the
+hash and recorded as a PhotoBlob; any later upload of the same bytes - an
+officer retrying from the offline queue, the same photo attached to another
+work - reuses those files without decoding anything:
+
+- same work: no new WorkPhoto, the existing one is returned as a duplicate
+- other work: a new WorkPhoto pointing at the shared files
+
+Photos of the same work whose perceptual hashes are within
+NEAR_DUPLICATE_DISTANCE bits (re-encoded, resized, cropped a little) are
+stored but flagged in photo_duplicates for review.
+
+Files are shared between WorkPhotos, so they are only deleted with the last
+photo referencing them, and only once that deletion is committed
+(delete_photo, then remove_files).
+"""
+
+import os
+
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import image_utils
+import models
+from database import begin_transaction
+
+NEAR_DUPLICATE_DISTANCE = int(os.environ.get("PHOTO_NEAR_DUPLICATE_DISTANCE", "6"))
+
+
+def add_photo_variants(photo: models.WorkPhoto, variants: list):
+    """Attach variant dicts (see image_utils.build_variants) to a new WorkPhoto."""
+    for v in variants:
+        photo.variants.append(models.WorkPhotoVariant(
+            width=v["width"], height=v["height"], format=v["format"], path=v["path"], size_bytes=v["size_bytes"]
+        ))
+
+
+def _stored_variants(db: Session, image_path: str) -> list:
+    """Variants already recorded for another WorkPhoto sharing `image_path`."""
+    rows = db.query(models.WorkPhotoVariant).join(
+        models.WorkPhoto, models.WorkPhoto.id == models.WorkPhotoVariant.photo_id
+    ).filter(models.WorkPhoto.image_path == image_path).all()
+    unique = {}
+    for v in rows:
+        unique.setdefault((v.width, v.format), {
+            "width": v.width, "height": v.height, "format": v.format, "path": v.path, "size_bytes": v.size_bytes
+        })
+    return list(unique.values())
+
+
+class PreparedUploads:
+    """Uploaded files hashed and, where new, processed and recorded as PhotoBlobs (see prepare_uploads)."""
+
+    def __init__(self, hashes: list, blobs: dict, errors: dict, new_variants: dict):
+        self.hashes = hashes              # per file, in order
+        self.blobs = blobs                # sha256 -> PhotoBlob
+        self.errors = errors              # sha256 -> Exception raised processing it
+        self.new_variants = new_variants  # sha256 -> variants of files processed just now
+
+
+def prepare_uploads(db: Session, files: list) -> PreparedUploads:
+    """
+    Hash (file_bytes, filename) uploads and run only bytes never seen before
+    through the image pipeline - once, even if repeated within `files`.
+    Blocks until the pool is done (see image_utils.process_uploads).
+
+    Raises:
+        image_utils.ImagePoolBusy if new photos cannot be queued for processing.
+    """
+    hashes = [image_utils.content_hash(data) for data, _ in files]
+    blobs = {b.sha256: b for b in db.query(models.PhotoBlob).filter(models.PhotoBlob.sha256.in_(set(hashes)))}
+
+    pending = {}
+    for (data, filename), file_hash in zip(files, hashes):
+        if file_hash not in blobs and file_hash not in pending:
+            pending[file_hash] = (data, filename, file_hash)
+    processed = {}
+    jobs = list(pending.items())
+    # Large batches (offline sync) are fed to the pool in slices the queue limit allows
+    for start in range(0, len(jobs), image_utils.IMAGE_QUEUE_LIMIT):
+        batch = jobs[start:start + image_utils.IMAGE_QUEUE_LIMIT]
+        results = image_utils.process_uploads([args for _, args in batch])
+        processed.update(zip([file_hash for file_hash, _ in batch], results))
+
+    errors, new_variants = {}, {}
+    for file_hash, result in processed.items():
+        if isinstance(result, Exception):
+            errors[file_hash] = result
+            continue
+        full_path, thumb_path, variants, phash = result
+        # A concurrent request may have stored the same bytes meanwhile; the files are identical
+        db.execute(insert(models.PhotoBlob).values(
+            sha256=file_hash, phash=phash, image_path=full_path, thumbnail_path=thumb_path
+        ).on_conflict_do_nothing())
+        blobs[file_hash] = models.PhotoBlob(sha256=file_hash, phash=phash, image_path=full_path, thumbnail_path=thumb_path)
+        new_variants[file_hash] = variants
+    return PreparedUploads(hashes, blobs, errors, new_variants)
+
+
+def attach_uploads(db: Session, work_id: int, prepared: PreparedUploads, indexes, uploaded_by: str, caption: str, category: str) -> list:
+    """
+    Create WorkPhotos of `work_id` for the prepared files at `indexes` (flushed, not committed).
+
+    Returns:
+        per index, in order, either the Exception processing the file raised or
+        {"photo": WorkPhoto, "duplicate": bool, "near_duplicate_of": photo id or None}
+    """
+    existing = db.query(models.WorkPhoto.id, models.WorkPhoto.image_path, models.PhotoBlob.phash).outerjoin(
+        models.PhotoBlob, models.PhotoBlob.image_path == models.WorkPhoto.image_path
+    ).filter(models.WorkPhoto.work_id == work_id).all()
+    photo_by_path = {image_path: photo_id for photo_id, image_path, _ in existing}
+    known_hashes = [(photo_id, phash) for photo_id, _, phash in existing if phash]
+
+    results = []
+    for index in indexes:
+        file_hash = prepared.hashes[index]
+        if file_hash in prepared.errors:
+            results.append(prepared.errors[file_hash])
+            continue
+        blob = prepared.blobs[file_hash]
+
+        if blob.image_path in photo_by_path:
+            photo = db.query(models.WorkPhoto).filter(models.WorkPhoto.id == photo_by_path[blob.image_path]).first()
+            results.append({"photo": photo, "duplicate": True, "near_duplicate_of": None})
+            continue
+
+        photo = models.WorkPhoto(
+            work_id=work_id,
+            image_path=blob.image_path,
+            thumbnail_path=blob.thumbnail_path,
+            caption=caption,
+            category=category,
+            uploaded_by=uploaded_by
+        )
+        add_photo_variants(photo, prepared.new_variants.get(file_hash) or _stored_variants(db, blob.image_path))
+        db.add(photo)
+        db.flush()
+        if file_hash not in prepared.new_variants and not os.path.exists(blob.image_path):
+            # The last photo sharing the blob was deleted after prepare_uploads
+            # found it (see remove_files); now that this transaction holds the
+            # write lock, the files cannot go away any more
+            db.delete(photo)
+            db.flush()
+            results.append(FileNotFoundError(f"Stored image {blob.image_path} was deleted meanwhile, upload it again"))
+            continue
+        photo_by_path[blob.image_path] = photo.id
+
+        near_duplicate_of = None
+        if known_hashes:
+            distance, match_id = min((image_utils.hamming(blob.phash, phash), pid) for pid, phash in known_hashes)
+            if distance <= NEAR_DUPLICATE_DISTANCE:
+                near_duplicate_of = match_id
+                db.add(models.PhotoDuplicate(photo_id=photo.id, duplicate_of_id=match_id, work_id=work_id, distance=distance))
+        known_hashes.append((photo.id, blob.phash))
+
+        results.append({"photo": photo, "duplicate": False, "near_duplicate_of": near_duplicate_of})
+    return results
+
+
+def store_uploads(db: Session, work_id: int, files: list, uploaded_by: str, caption: str, category: str) -> list:
+    """
+    Store (file_bytes, filename) uploads as WorkPhotos of `work_id` (flushed, not committed).
+    Call it before the session has written anything: it blocks on the image pool,
+    and a flushed write would hold SQLite's write lock meanwhile. Otherwise use
+    prepare_uploads first and attach_uploads after the other writes.
+
+    Returns:
+        see attach_uploads, one entry per file
+    Raises:
+        image_utils.ImagePoolBusy if new photos cannot be queued for processing.
+    """
+    prepared = prepare_uploads(db, files)
+    return attach_uploads(db, work_id, prepared, range(len(files)), uploaded_by, caption, category)
+
+
+def delete_photo(db: Session, photo: models.WorkPhoto) -> list:
+    """
+    Delete a WorkPhoto (not committed); its PhotoBlob goes too if no other photo shares it.
+
+    Returns:
+        the file paths to pass to remove_files once the deletion is committed
+        (empty while another photo still uses the files)
+    """
+    shared = db.query(models.WorkPhoto.id).filter(
+        models.WorkPhoto.image_path == photo.image_path,
+        models.WorkPhoto.id != photo.id
+    ).first()
+    paths = []
+    if not shared:
+        paths = [p for p in [photo.image_path, photo.thumbnail_path] + [v.path for v in photo.variants] if p]
+        db.query(models.PhotoBlob).filter(models.PhotoBlob.image_path == photo.image_path).delete()
+
+    db.query(models.PhotoDuplicate).filter(
+        (models.PhotoDuplicate.photo_id == photo.id) | (models.PhotoDuplicate.duplicate_of_id == photo.id)
+    ).delete()
+    db.delete(photo)
+    return paths
+
+
+def remove_files(db: Session, paths: list):
+    """
+    Remove files returned by delete_photo, after its deletion was committed.
+    Files a photo references again (a concurrent upload of the same bytes
+    committed meanwhile) are kept. Holds the write lock while checking and
+    removing, so an upload attaching the files after that finds them missing
+    (see attach_uploads) rather than referencing deleted files.
+    """
+    if not paths:
+        return
+    try:
+        begin_transaction(db, immediate=True)
+        referenced = set()
+        for column in (models.WorkPhoto.image_path, models.WorkPhoto.thumbnail_path, models.WorkPhotoVariant.path):
+            referenced.update(p for (p,) in db.query(column).filter(column.in_(paths)).distinct())
+        for path in paths:
+            if path not in referenced and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    finally:
+        db.rollback()
+
+
+def backfill_variants(db: Session, batch_size: int = None) -> dict:
+    """
+    Build the variant ladder for photos stored without one (uploaded before
+    it existed), a batch at a time in the image pool; commits after each batch.
+    Photos sharing an image reuse variants already recorded for it.
+
+    Raises:
+        image_utils.ImagePoolBusy if the image pool has no room for a batch.
+    """
+    batch_size = batch_size or image_utils.IMAGE_WORKERS * 2
+    after_id, built, skipped = 0, 0, 0
+    while True:
+        photos = db.query(models.WorkPhoto).filter(
+            models.WorkPhoto.id > after_id, ~models.WorkPhoto.variants.any()
+        ).order_by(models.WorkPhoto.id).limit(batch_size).all()
+        if not photos:
+            break
+        after_id = photos[-1].id
+
+        pending = []
+        for photo in photos:
+            if not photo.image_path or not os.path.exists(photo.image_path):
+                skipped += 1
+                continue
+            shared = _stored_variants(db, photo.image_path)
+            if shared:
+                add_photo_variants(photo, shared)
+                built += 1
+            else:
+                pending.append(photo)
+
+        sources = [(p.image_path, os.path.splitext(os.path.basename(p.image_path))[0]) for p in pending]
+        for photo, variants in zip(pending, image_utils.build_files_variants(sources)):
+            if isinstance(variants, Exception) or not variants:
+                skipped += 1  # unreadable, or no wider than the smallest variant
+                continue
+            add_photo_variants(photo, variants)
+            built += 1
+        db.commit()
+    return {"built": built, "skipped": skipped}
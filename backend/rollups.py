@@ -0,0 +1,287 @@
+"""
+Incrementally maintained aggregates over the works table.
+
+work_rollups holds one row per (block, panchayat, department, financial_year,
+current_status, panchayat_agency) with the work count and sanctioned sum.
+Writers that change any of those columns (ingest) pass old/new values through
+`add()` and `apply()`; dashboard endpoints read the rollups instead of scanning
+works. `check_consistency()` compares the table against the base table and
+`rebuild()` recomputes it from scratch.
+"""
+
+import math
+from sqlalchemy import case, func, literal
+from sqlalchemy.orm import Session
+
+import models
+
+# Agencies counted by the "Panchayat View" of the village summary (exact upper-case strings)
+PANCHAYAT_AGENCIES = [
+    "CEO JANPAND PANCHAYAT KATEKALYAN",
+    "CEO JANPAND PANCHAYAT DANTEWADA",
+    "CEO JANPAND PANCHAYAT GEEDAM",
+    "CEO JANPAND PANCHAYAT KUWAKONDA"
+]
+
+KEY_COLUMNS = ["block", "panchayat", "department", "financial_year", "current_status", "panchayat_agency"]
+
+# Statuses reported separately by /works/stats and the village summary
+STATUS_COMPLETED = "Completed"
+STATUS_IN_PROGRESS = "In Progress"
+STATUS_NOT_STARTED = "Not Started"
+STATUS_CC_PENDING = "CC Not Come in DMF"
+STATUS_CANCELLED = "Cancelled"
+
+
+def _dim(value) -> str:
+    """Normalize a dimension value the way it is stored in the rollup ('' = NULL)."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and math.isnan(value):
+        return ""
+    return str(value)
+
+
+def _amount(value) -> float:
+    if value is None:
+        return 0.0
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(value) else value
+
+
+def is_panchayat_agency(agency_name) -> bool:
+    if not agency_name or not isinstance(agency_name, str):
+        return False
+    return agency_name.strip().upper() in PANCHAYAT_AGENCIES
+
+
+def key_for(row) -> tuple:
+    """Rollup key for a work given as a dict or an object with Work attributes."""
+    get = row.get if isinstance(row, dict) else lambda k: getattr(row, k, None)
+    return (
+        _dim(get("block")),
+        _dim(get("panchayat")),
+        _dim(get("department")),
+        _dim(get("financial_year")),
+        _dim(get("current_status")),
+        is_panchayat_agency(get("agency_name")),
+    )
+
+
+def add(deltas: dict, row, sign: int = 1):
+    """Accumulate +1/-1 of a work (and its sanctioned amount) into `deltas`."""
+    get = row.get if isinstance(row, dict) else lambda k: getattr(row, k, None)
+    key = key_for(row)
+    count, amount = deltas.get(key, (0, 0.0))
+    deltas[key] = (count + sign, amount + sign * _amount(get("sanctioned_amount")))
+
+
+def apply(db: Session, deltas: dict):
+    """
+    Apply accumulated deltas to work_rollups (flushes, does not commit).
+    Groups that drop to zero works are removed.
+    """
+    deltas = {k: v for k, v in deltas.items() if v[0] != 0 or abs(v[1]) > 1e-9}
+    if not deltas:
+        return
+
+    existing = {}
+    blocks = {k[0] for k in deltas}
+    for r in db.query(models.WorkRollup).filter(models.WorkRollup.block.in_(blocks)):
+        existing[tuple(getattr(r, c) for c in KEY_COLUMNS)] = r
+
+    for key, (count, amount) in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            db.add(models.WorkRollup(**dict(zip(KEY_COLUMNS, key)), work_count=count, sanctioned_sum=amount))
+            continue
+        row.work_count += count
+        row.sanctioned_sum += amount
+        if row.work_count <= 0:
+            db.delete(row)
+    db.flush()
+
+
+def _base_groups(db: Session) -> dict:
+    """Aggregate the works table into rollup groups (used by rebuild and the checker)."""
+    rows = db.query(
+        models.Work.block,
+        models.Work.panchayat,
+        models.Work.department,
+        models.Work.financial_year,
+        models.Work.current_status,
+        models.Work.agency_name,
+        func.count(models.Work.id),
+        func.coalesce(func.sum(models.Work.sanctioned_amount), 0.0)
+    ).group_by(
+        models.Work.block,
+        models.Work.panchayat,
+        models.Work.department,
+        models.Work.financial_year,
+        models.Work.current_status,
+        models.Work.agency_name
+    ).all()
+
+    groups = {}
+    for block, panchayat, department, year, status, agency, count, amount in rows:
+        key = key_for({
+            "block": block, "panchayat": panchayat, "department": department,
+            "financial_year": year, "current_status": status, "agency_name": agency
+        })
+        c, a = groups.get(key, (0, 0.0))
+        groups[key] = (c + count, a + (amount or 0.0))
+    return groups
+
+
+def rebuild(db: Session) -> int:
+    """Recompute work_rollups from the works table. Returns the number of groups."""
+    groups = _base_groups(db)
+    db.query(models.WorkRollup).delete()
+    db.bulk_insert_mappings(models.WorkRollup, [
+        {**dict(zip(KEY_COLUMNS, key)), "work_count": count, "sanctioned_sum": amount}
+        for key, (count, amount) in groups.items()
+    ])
+    db.commit()
+    return len(groups)
+
+
+def ensure_built(db: Session):
+    """Build the rollups on first start (works exist but no rollups yet)."""
+    if not is_built(db) and db.query(models.Work.id).first() is not None:
+        rebuild(db)
+
+
+def check_consistency(db: Session, tolerance: float = 0.01) -> dict:
+    """
+    Compare work_rollups with an aggregate of the works table.
+
+    Returns:
+        {"consistent": bool, "groups": int, "mismatches": [...]} (mismatches capped at 50)
+    """
+    expected = _base_groups(db)
+    actual = {
+        tuple(getattr(r, c) for c in KEY_COLUMNS): (r.work_count, r.sanctioned_sum)
+        for r in db.query(models.WorkRollup)
+    }
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        exp = expected.get(key, (0, 0.0))
+        act = actual.get(key, (0, 0.0))
+        if exp[0] != act[0] or abs(exp[1] - act[1]) > tolerance:
+            mismatches.append({
+                **dict(zip(KEY_COLUMNS, key)),
+                "expected_count": exp[0], "actual_count": act[0],
+                "expected_amount": round(exp[1], 2), "actual_amount": round(act[1], 2)
+            })
+
+    return {"consistent": not mismatches, "groups": len(expected), "mismatches": mismatches[:50]}
+
+
+def work_stats(db: Session) -> dict:
+    """Counts per status plus the overall total, read from the rollups."""
+    rows = db.query(
+        models.WorkRollup.current_status,
+        func.sum(models.WorkRollup.work_count)
+    ).group_by(models.WorkRollup.current_status).all()
+    by_status = {status: int(count or 0) for status, count in rows}
+    total = sum(by_status.values())
+    by_status.pop("", None)  # NULL status only counts towards the total
+    return {"total": total, "by_status": by_status}
+
+
+# (status, response field prefix) pairs broken out by the village summary
+SUMMARY_STATUSES = [
+    (STATUS_COMPLETED, "completed"),
+    (STATUS_IN_PROGRESS, "progress"),
+    (STATUS_NOT_STARTED, "not_started"),
+    (STATUS_CC_PENDING, "cc_pending"),
+]
+
+
+def _village_summary(db: Session, block, panchayat, status, count, amount, filters) -> list:
+    """
+    Single grouped query with conditional aggregation (SUM(CASE ...)) per status.
+    `count`/`amount` are the per-row contributions of the source being summarized.
+    """
+    block_label = func.coalesce(func.nullif(block, ""), "Unknown")
+    panchayat_label = func.coalesce(func.nullif(panchayat, ""), "Unknown")
+
+    status_columns = []
+    for status_value, _ in SUMMARY_STATUSES:
+        status_columns.append(func.sum(case((status == status_value, count), else_=0)))
+        status_columns.append(func.sum(case((status == status_value, amount), else_=0.0)))
+
+    rows = db.query(
+        block_label,
+        panchayat_label,
+        func.sum(count),
+        func.sum(amount),
+        *status_columns
+    ).filter(*filters).group_by(block_label, panchayat_label).order_by(block_label, panchayat_label).all()
+
+    result = []
+    for row in rows:
+        if not row[2]:
+            continue
+        entry = {
+            "block": row[0],
+            "panchayat": row[1],
+            "total_works": int(row[2]),
+            "total_amount": float(round(row[3] or 0.0, 2)),
+        }
+        for i, (_, field) in enumerate(SUMMARY_STATUSES):
+            entry[f"{field}_works"] = int(row[4 + 2 * i] or 0)
+            entry[f"{field}_amount"] = float(round(row[5 + 2 * i] or 0.0, 2))
+        result.append(entry)
+    return result
+
+
+def village_summary(db: Session, department=None, year=None, panchayat_view: bool = False) -> list:
+    """Per (block, panchayat) totals and status breakdown, read from the rollups."""
+    filters = []
+    if department:
+        filters.append(models.WorkRollup.department.in_(department))
+    if year:
+        filters.append(models.WorkRollup.financial_year.in_(year))
+    if panchayat_view:
+        filters.append(models.WorkRollup.panchayat_agency == True)
+    return _village_summary(
+        db,
+        models.WorkRollup.block,
+        models.WorkRollup.panchayat,
+        models.WorkRollup.current_status,
+        models.WorkRollup.work_count,
+        models.WorkRollup.sanctioned_sum,
+        filters
+    )
+
+
+def village_summary_live(db: Session, department=None, year=None, panchayat_view: bool = False) -> list:
+    """
+    Same summary computed directly from the works table in one pass,
+    with the panchayat-view agency filter pushed down into the WHERE clause.
+    """
+    filters = []
+    if department:
+        filters.append(models.Work.department.in_(department))
+    if year:
+        filters.append(models.Work.financial_year.in_(year))
+    if panchayat_view:
+        filters.append(func.upper(func.trim(models.Work.agency_name)).in_(PANCHAYAT_AGENCIES))
+    return _village_summary(
+        db,
+        models.Work.block,
+        models.Work.panchayat,
+        models.Work.current_status,
+        literal(1),
+        func.coalesce(models.Work.sanctioned_amount, 0.0),
+        filters
+    )
+
+
+def is_built(db: Session) -> bool:
+    return db.query(models.WorkRollup.id).first() is not None
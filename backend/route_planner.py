@@ -0,0 +1,147 @@
+"""
+Inspection route planning for officers.
+Orders assigned works into a short visiting route (nearest neighbour + 2-opt)
+and splits the route into day-wise batches.
+"""
+
+import time
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Planner settings
+DEFAULT_STOPS_PER_DAY = 8
+TWO_OPT_TIME_BUDGET = 0.5   # seconds; 2-opt stops improving once this is spent
+
+
+def distance_matrix(lats, lngs) -> np.ndarray:
+    """Pairwise haversine distance matrix (km) for the given coordinates."""
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lng = np.radians(np.asarray(lngs, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_neighbour(dist: np.ndarray, start: int = 0) -> list[int]:
+    """Greedy open path from `start` always visiting the closest unvisited node."""
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    visited[start] = True
+    order = [start]
+    current = start
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[current])
+        current = int(np.argmin(row))
+        visited[current] = True
+        order.append(current)
+    return order
+
+
+def two_opt(order: list[int], dist: np.ndarray, time_budget: float = TWO_OPT_TIME_BUDGET) -> list[int]:
+    """
+    Improve an open path with 2-opt segment reversals.
+    The first node (the start location) stays fixed and the path does not return to it.
+    For each i the gain of every possible reversal order[i..j] is evaluated in one
+    vectorized step, so a 500-stop route converges well inside the time budget.
+    """
+    route = np.asarray(order)
+    n = len(route)
+    if n < 4:
+        return route.tolist()
+
+    deadline = time.perf_counter() + time_budget
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = route[i - 1], route[i]
+            c = route[i + 1:]                     # candidate segment ends (j = i+1 .. n-1)
+            d = np.append(route[i + 2:], -1)      # node after each segment end (-1 = path end)
+            has_next = d >= 0
+            d_safe = np.where(has_next, d, 0)
+
+            removed = dist[a, b] + np.where(has_next, dist[c, d_safe], 0.0)
+            added = dist[a, c] + np.where(has_next, dist[b, d_safe], 0.0)
+            gains = removed - added
+
+            k = int(np.argmax(gains))
+            if gains[k] > 1e-9:
+                j = i + 1 + k
+                route[i:j + 1] = route[i:j + 1][::-1]
+                improved = True
+            if time.perf_counter() >= deadline:
+                break
+    return route.tolist()
+
+
+def split_into_days(legs: list[float], stops_per_day: int = DEFAULT_STOPS_PER_DAY,
+                    max_km_per_day: float | None = None) -> list[int]:
+    """
+    Assign each stop (in visiting order) to a day number starting at 1.
+    A new day starts when the stop count or the travelled distance for the day
+    would exceed its limit. Every day gets at least one stop.
+    """
+    days = []
+    day, count, km = 1, 0, 0.0
+    for leg in legs:
+        over_stops = stops_per_day and count >= stops_per_day
+        over_km = max_km_per_day is not None and count > 0 and km + leg > max_km_per_day
+        if over_stops or over_km:
+            day, count, km = day + 1, 0, 0.0
+        count += 1
+        km += leg
+        days.append(day)
+    return days
+
+
+def plan_route(start: tuple[float, float], stops: list[dict],
+               stops_per_day: int = DEFAULT_STOPS_PER_DAY,
+               max_km_per_day: float | None = None) -> dict:
+    """
+    Plan a visiting order over `stops` (dicts with 'latitude' and 'longitude')
+    beginning at `start` (lat, lng).
+
+    Returns:
+        {"total_distance_km", "stops": [stop + order/leg_km/cumulative_km/day], "days": [...]}
+    """
+    if not stops:
+        return {"total_distance_km": 0.0, "stops": [], "days": []}
+
+    lats = [start[0]] + [s["latitude"] for s in stops]
+    lngs = [start[1]] + [s["longitude"] for s in stops]
+    dist = distance_matrix(lats, lngs)
+
+    order = two_opt(nearest_neighbour(dist, 0), dist)
+    visit = order[1:]  # drop the start node
+
+    legs = dist[order[:-1], order[1:]].tolist()
+    days = split_into_days(legs, stops_per_day, max_km_per_day)
+
+    planned = []
+    cumulative = 0.0
+    for pos, (node, leg, day) in enumerate(zip(visit, legs, days), start=1):
+        cumulative += leg
+        planned.append({
+            **stops[node - 1],
+            "order": pos,
+            "day": day,
+            "leg_km": round(leg, 2),
+            "cumulative_km": round(cumulative, 2),
+        })
+
+    day_batches = []
+    for stop in planned:
+        if not day_batches or day_batches[-1]["day"] != stop["day"]:
+            day_batches.append({"day": stop["day"], "stop_count": 0, "distance_km": 0.0, "work_ids": []})
+        batch = day_batches[-1]
+        batch["stop_count"] += 1
+        batch["distance_km"] = round(batch["distance_km"] + stop["leg_km"], 2)
+        batch["work_ids"].append(stop.get("work_id"))
+
+    return {
+        "total_distance_km": round(cumulative, 2),
+        "stops": planned,
+        "days": day_batches,
+    }
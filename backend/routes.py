@@ -1,43 +1,124 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Response, Query
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Response, Query, Request
+from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func
 from typing import List, Optional
 from database import get_db
 import models, auth
 from fastapi.security import OAuth2PasswordRequestForm
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel
 import shutil
 import os
 import pandas as pd
 from io import BytesIO
 import image_utils
+import photo_store
+import upload_sessions
+import delta_sync
+import offline_bundle
+import route_planner
+import gps_check
+import rollups
+import filter_cache
+import exporters
 import pdf_generator
+import export_jobs
+import job_queue
 
 router = APIRouter()
 
+# Handlers that use the database are plain `def`: FastAPI runs them in its
+# threadpool, so queries, pandas/openpyxl work and waits on the process pools
+# never stall the event loop. The few that must await something (a request
+# body stream, the bcrypt pool, a shared variant render) stay `async def` and
+# hand their queries to run_in_threadpool.
+
 # --- Auth ---
 @router.post("/token")
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    client_ip = request.client.host if request.client else "unknown"
+    retry_after = auth.login_retry_after(form_data.username, client_ip)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many login attempts, please wait and retry", headers={"Retry-After": str(retry_after)})
+
+    # async so a login burst waits on the bcrypt pool without tying up the
+    # request threadpool; its few queries are handed to the threadpool instead
+    user = await run_in_threadpool(find_user, db, form_data.username)
+    # Hand the pooled connection back while waiting for bcrypt: a login burst
+    # would otherwise hold every connection and time out unrelated requests
+    db.close()
+    try:
+        valid = bool(user) and await auth.verify_password_async(form_data.password, user.hashed_password)
+    except auth.PasswordHashBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
+    auth.record_login_result(form_data.username, client_ip, valid)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = auth.create_access_token(data={"sub": user.username})
+    if auth.needs_rehash(user.hashed_password):
+        # Cost factor changed (AUTH_BCRYPT_ROUNDS): upgrade the stored hash while we have the password
+        try:
+            hashed_password = await auth.get_password_hash_async(form_data.password)
+            await run_in_threadpool(store_password_hash, db, user, hashed_password)
+        except auth.PasswordHashBusy:
+            pass  # next login
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="Account is deactivated")
+    return await run_in_threadpool(issue_tokens, db, user)
+
+def find_user(db: Session, username: str) -> Optional[models.User]:
+    return db.query(models.User).filter(models.User.username == username).first()
+
+def store_password_hash(db: Session, user: models.User, hashed_password: str):
+    db.query(models.User).filter(models.User.id == user.id).update({"hashed_password": hashed_password})
+    db.commit()
+    auth.invalidate_user(user.username)
+
+def issue_tokens(db: Session, user: models.User, refresh_token: Optional[str] = None) -> dict:
+    """Login/refresh response: a short-lived access token plus a (new) refresh token."""
+    if refresh_token is None:
+        refresh_token, _ = auth.issue_refresh_token(db, user.id)
+    db.commit()
     return {
-        "access_token": access_token, 
-        "token_type": "bearer", 
+        "access_token": auth.create_user_access_token(user),
+        "token_type": "bearer",
+        "expires_in": auth.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": refresh_token,
         "role": user.role,
         "id": user.id,
         "allowed_agencies": user.allowed_agencies
     }
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+@router.post("/token/refresh")
+def refresh_access_token(req: RefreshRequest, db: Session = Depends(get_db)):
+    """
+    Exchange a refresh token for a new access token and a new refresh token
+    (the one sent is used up). Clients call this when the access token expires
+    or is rejected after a change to the account.
+    """
+    try:
+        user, refresh_token = auth.rotate_refresh_token(db, req.refresh_token)
+    except auth.InvalidRefreshToken as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+    return issue_tokens(db, user, refresh_token)
+
+@router.post("/logout")
+def logout(req: RefreshRequest, db: Session = Depends(get_db)):
+    """Revoke a refresh token (the short-lived access token simply expires)."""
+    auth.revoke_refresh_token(db, req.refresh_token)
+    db.commit()
+    return {"message": "Logged out"}
+
 @router.get("/users/me")
-async def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
+def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
     return {
         "id": current_user.id,
         "username": current_user.username, 
@@ -48,7 +129,7 @@ async def read_users_me(current_user: models.User = Depends(auth.get_current_use
 
 # --- Officers ---
 @router.get("/officers")
-async def get_officers(db: Session = Depends(get_db)):
+def get_officers(db: Session = Depends(get_db)):
     return db.query(models.User).filter(models.User.role == "officer").all()
 
 # --- Works ---
@@ -72,7 +153,7 @@ def parse_float(row, col_name):
         return 0.0
 
 @router.post("/works/upload")
-async def upload_works(
+def upload_works(
     file: UploadFile = File(...), 
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
@@ -81,7 +162,7 @@ async def upload_works(
         if current_user.role != "admin":
             raise HTTPException(status_code=403, detail="Only admin can upload works")
         
-        contents = await file.read()
+        contents = file.file.read()
         
         # Validate format
         if file.filename.endswith('.csv'):
@@ -102,197 +183,120 @@ async def upload_works(
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 # --- Google Sheet Sync ---
-@router.post("/works/sync-sheet")
-async def sync_google_sheet(
+@job_queue.handler("sheet_sync")
+def run_sheet_sync_job(db: Session, payload: dict) -> dict:
+    import ingester
+    result = ingester.sync_from_google_sheet(db, payload.get("sheet_url") or ingester.DEFAULT_SHEET_URL)
+    return {"message": f"Sync Complete. Processed {result['total_processed']} rows (Inserted: {result['inserted']}, Updated: {result['updated']})", **result}
+
+@router.post("/works/sync-sheet", status_code=202)
+def sync_google_sheet(
     sheet_url: Optional[str] = Form(None),
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Syncs data from a Google Sheet. 
+    Queues a sync from a Google Sheet; poll GET /jobs/{id} for the result.
     If sheet_url is not provided, uses the Default Main Sheet.
     """
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admin can sync data")
 
-    try:
-        import ingester
-        target_url = sheet_url if sheet_url and sheet_url.strip() else ingester.DEFAULT_SHEET_URL
-        
-        result = ingester.sync_from_google_sheet(db, target_url)
-        
-        return {"message": f"Sync Complete. Processed {result['total_processed']} rows (Inserted: {result['inserted']}, Updated: {result['updated']})"}
+    import ingester
+    target_url = sheet_url if sheet_url and sheet_url.strip() else ingester.DEFAULT_SHEET_URL
+    if not ingester.sheet_id_from_url(target_url):
+        raise HTTPException(status_code=400, detail="Invalid Google Sheet URL")
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Sync failed: {str(e)}")
+    # A sync of the same sheet already waiting or running covers this request
+    job = job_queue.enqueue(db, "sheet_sync", {"sheet_url": target_url}, user_id=current_user.id,
+                            dedupe_key=f"sheet_sync:{target_url}")
+    return {"message": "Sync started", "job": job_queue.public(job)}
 
 @router.get("/works/stats")
-async def get_work_stats(db: Session = Depends(get_db)):
-    # Group by status
-    from sqlalchemy import func
-    stats_query = db.query(models.Work.current_status, func.count(models.Work.id)).filter(models.Work.current_status != None).group_by(models.Work.current_status).all()
-    stats = {status: count for status, count in stats_query}
-    
-    total = db.query(models.Work).count()
-    completed = stats.get('Completed', 0)
-    cancelled = stats.get('Cancelled', 0) # Assumes 'Cancelled' is the exact string
+def get_work_stats(db: Session = Depends(get_db)):
+    # Counts come from the incrementally maintained rollups (see rollups.py)
+    stats = rollups.work_stats(db)
+    by_status = stats["by_status"]
     
     # Last Sync Time
     last_sync_meta = db.query(models.SystemMetadata).filter(models.SystemMetadata.key == "last_sync_time").first()
     last_sync = last_sync_meta.value if last_sync_meta else None
 
     return {
-        "total": total,
-        "completed": stats.get('Completed', 0),
-        "in_progress": stats.get('In Progress', 0),
-        "not_started": stats.get('Not Started', 0),
-        "cc_pending": stats.get('CC Not Come in DMF', 0),
-        "cancelled": cancelled,
+        "total": stats["total"],
+        "completed": by_status.get(rollups.STATUS_COMPLETED, 0),
+        "in_progress": by_status.get(rollups.STATUS_IN_PROGRESS, 0),
+        "not_started": by_status.get(rollups.STATUS_NOT_STARTED, 0),
+        "cc_pending": by_status.get(rollups.STATUS_CC_PENDING, 0),
+        "cancelled": by_status.get(rollups.STATUS_CANCELLED, 0),
         "last_sync": last_sync
     }
 
+@router.get("/works/rollups/check")
+def check_work_rollups(
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Verify the dashboard rollups against the works table. Admin only."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return rollups.check_consistency(db)
+
+@router.post("/works/rollups/rebuild")
+def rebuild_work_rollups(
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Recompute the dashboard rollups from the works table. Admin only."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    groups = rollups.rebuild(db)
+    return {"message": f"Rebuilt {groups} rollup groups"}
+
 @router.get("/works/filters")
-async def get_work_filters(db: Session = Depends(get_db)):
-    # Fetch all raw values and normalize in Python to ensure case-insensitivity
-    def get_clean_values(column):
-        raw = db.query(column).distinct().filter(column != None).all()
-        # Deduplicate and strip, but preserve original casing (User Requirement: Exact Similarity)
-        return sorted(list(set(str(r[0]).strip() for r in raw if r[0])))
-
-    # Get earliest date for default filter
-    from sqlalchemy import func
-    min_date = db.query(func.min(models.Work.sanctioned_date)).scalar()
-    # Format as YYYY-MM-DD string if it exists
-    min_date_str = min_date.strftime('%Y-%m-%d') if min_date else None
+def get_work_filters(
+    block: Optional[List[str]] = Query(None),
+    panchayat: Optional[List[str]] = Query(None),
+    department: Optional[List[str]] = Query(None),
+    agency: Optional[List[str]] = Query(None),
+    status: Optional[List[str]] = Query(None),
+    year: Optional[List[str]] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Distinct filter values (stripped, original casing preserved) plus the earliest AS date.
+    Served from the in-process dimension cache; any selections narrow the other lists.
+    """
+    return filter_cache.get_filters(db, None, block, panchayat, department, agency, status, year)
 
-    return {
-        "blocks": get_clean_values(models.Work.block),
-        "panchayats": get_clean_values(models.Work.panchayat),
-        "departments": get_clean_values(models.Work.department),
-        "agencies": get_clean_values(models.Work.agency_name),
-        "statuses": get_clean_values(models.Work.current_status),
-        "years": get_clean_values(models.Work.financial_year),
-        "earliest_date": min_date_str
-    }
+@router.get("/works/filters/scoped")
+def get_scoped_work_filters(
+    block: Optional[List[str]] = Query(None),
+    panchayat: Optional[List[str]] = Query(None),
+    department: Optional[List[str]] = Query(None),
+    agency: Optional[List[str]] = Query(None),
+    status: Optional[List[str]] = Query(None),
+    year: Optional[List[str]] = Query(None),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Filter values limited to the works the current user can see."""
+    return filter_cache.get_filters(db, current_user, block, panchayat, department, agency, status, year)
 
 @router.get("/works/summary/village")
-async def get_village_summary(
+def get_village_summary(
     department: Optional[List[str]] = Query(None),
     year: Optional[List[str]] = Query(None),
-    panchayat_view: bool = Query(False), # New Filter
+    panchayat_view: bool = Query(False), # Only works of the Janpad Panchayat agencies
     db: Session = Depends(get_db)
 ):
-    # Base query
-    query = db.query(
-        models.Work.block,
-        models.Work.panchayat,
-        models.Work.current_status,
-        models.Work.sanctioned_amount,
-        models.Work.agency_name # Needed for filter
-    )
-    
-    # Apply optional filtering
-    if department:
-        query = query.filter(models.Work.department.in_(department))
-    if year:
-        query = query.filter(models.Work.financial_year.in_(year))
-        
-    results = query.all()
-    
-    if not results:
-        return []
-        
-    # Process with Pandas
-    data = []
-    
-    # Target Agencies for Panchayat View (Exact strings from DB)
-    PANCHAYAT_AGENCIES = [
-        "CEO JANPAND PANCHAYAT KATEKALYAN",
-        "CEO JANPAND PANCHAYAT DANTEWADA", 
-        "CEO JANPAND PANCHAYAT GEEDAM",
-        "CEO JANPAND PANCHAYAT KUWAKONDA"
-    ]
-    
-    for r in results:
-        # Panchayat View Logic
-        if panchayat_view:
-            if not r.agency_name:
-                continue
-            # Normalize for check
-            agency = r.agency_name.strip().upper()
-            if agency not in PANCHAYAT_AGENCIES:
-                continue
-
-        data.append({
-            "Block": r.block or "Unknown",
-            "Panchayat": r.panchayat or "Unknown",
-            "Status": r.current_status,
-            "Amount": r.sanctioned_amount or 0.0
-        })
-        
-    if not data:
-        return [] # Return empty if filter removed all
-        
-    df = pd.DataFrame(data)
-    
-    # Helper to calculate stats
-    grouped = df.groupby(['Block', 'Panchayat'])
-    
-    summary_list = []
-    
-    for (block, panchayat), group in grouped:
-        # Total
-        total_count = len(group)
-        total_amount = group['Amount'].sum()
-        
-        # Completed
-        completed = group[group['Status'] == 'Completed']
-        completed_count = len(completed)
-        completed_amount = completed['Amount'].sum()
-        
-        # In Progress
-        in_progress = group[group['Status'] == 'In Progress']
-        in_progress_count = len(in_progress)
-        in_progress_amount = in_progress['Amount'].sum()
-        
-        # Not Started
-        not_started = group[group['Status'] == 'Not Started'] 
-        not_started_count = len(not_started)
-        not_started_amount = not_started['Amount'].sum()
-
-        # CC Not Come
-        # Note: Check exact string match from user request "CC Not Come in DMF"
-        # Based on routes.py line 140, usage is 'CC Not Come in DMF' or similar. 
-        # Let's match roughly or exact. Providing exact from stats API code: 'CC Not Come in DMF'
-        cc_pending = group[group['Status'] == 'CC Not Come in DMF']
-        cc_pending_count = len(cc_pending)
-        cc_pending_amount = cc_pending['Amount'].sum()
-
-        
-        summary_list.append({
-            "block": block,
-            "panchayat": panchayat,
-            "total_works": int(total_count),
-            "total_amount": float(round(total_amount, 2)),
-            "completed_works": int(completed_count),
-            "completed_amount": float(round(completed_amount, 2)),
-            "progress_works": int(in_progress_count),
-            "progress_amount": float(round(in_progress_amount, 2)),
-            "not_started_works": int(not_started_count),
-            "not_started_amount": float(round(not_started_amount, 2)),
-            "cc_pending_works": int(cc_pending_count),
-            "cc_pending_amount": float(round(cc_pending_amount, 2))
-        })
-        
-    # Sort by Block then Panchayat
-    summary_list.sort(key=lambda x: (x['block'], x['panchayat']))
-    
-    return summary_list
+    # Sorted by Block then Panchayat. Rollups when available, else one grouped query over works.
+    if rollups.is_built(db):
+        return rollups.village_summary(db, department, year, panchayat_view)
+    return rollups.village_summary_live(db, department, year, panchayat_view)
 
 @router.get("/works/locations")
-async def get_work_locations(
+def get_work_locations(
     response: Response,
     department: Optional[List[str]] = Query(None), 
     block: Optional[List[str]] = Query(None),
@@ -387,12 +391,19 @@ def build_works_query(
         query = query.filter(models.Work.sanctioned_date <= end_dt)
 
     # List filters (Department, Panchayat, Year, Agency, Status)
+    # Normalize non-breaking spaces \u00a0 to standard space; filter_cache
+    # normalizes the same way, so every offered option matches its rows
+    def normalized(col):
+        return func.replace(func.trim(func.lower(col)), '\u00a0', ' ')
+
+    def clean(values):
+        return [str(v).strip().lower().replace('\u00a0', ' ') for v in values if v]
+
     def apply_list_filter(q, col, values):
         if not values: return q
-        # Normalize non-breaking spaces \u00a0 to standard space
-        clean_values = [str(v).strip().lower().replace('\u00a0', ' ') for v in values if v]
+        clean_values = clean(values)
         if not clean_values: return q
-        return q.filter(func.replace(func.trim(func.lower(col)), '\u00a0', ' ').in_(clean_values))
+        return q.filter(normalized(col).in_(clean_values))
 
     query = apply_list_filter(query, models.Work.department, department)
     query = apply_list_filter(query, models.Work.panchayat, panchayat)
@@ -402,20 +413,20 @@ def build_works_query(
 
     # Special Block Logic
     if block:
-        clean_blocks = [b for b in block if b]
+        clean_blocks = clean(block)
         if clean_blocks:
             # Check for special "District/Block Level Works" flag
-            SPECIAL_FLAG = "District/Block Level Works"
+            SPECIAL_FLAG = filter_cache.SPECIAL_BLOCK_FLAG.lower()
             if SPECIAL_FLAG in clean_blocks:
                 # Remove flag from standard block list
                 std_blocks = [b for b in clean_blocks if b != SPECIAL_FLAG]
                 
                 from sqlalchemy import or_
                 # Logic: (Block IN std_blocks) OR (Is District/Block Level Work)
-                block_cond = models.Work.block.in_(std_blocks) if std_blocks else None
+                block_cond = normalized(models.Work.block).in_(std_blocks) if std_blocks else None
                 special_cond = or_(
-                    models.Work.panchayat.ilike("Block Level%"),
-                    models.Work.panchayat.ilike("District Level%")
+                    normalized(models.Work.panchayat).like("block level%"),
+                    normalized(models.Work.panchayat).like("district level%")
                 )
                 
                 if block_cond is not None:
@@ -423,7 +434,7 @@ def build_works_query(
                 else:
                      query = query.filter(special_cond)
             else:
-                query = query.filter(models.Work.block.in_(clean_blocks))
+                query = query.filter(normalized(models.Work.block).in_(clean_blocks))
 
     # --- PRIVACY FILTER ---
     if user and user.role != "admin":
@@ -431,31 +442,26 @@ def build_works_query(
         restriction_filters = []
         any_restriction = False
         
-        # Match case-insensitively and normalize spaces (\u00a0 -> ' ')
+        # Match case-insensitively and normalize spaces (\u00a0 -> ' '); the scope
+        # sets come pre-parsed with the cached principal (auth.scope_sets)
+        agencies, blocks, panchayats = auth.scope_sets(user)
         # 1. Agency restriction
-        if user.allowed_agencies:
-            agencies = [a.strip().lower().replace('\u00a0', ' ') for a in user.allowed_agencies.split(',') if a.strip()]
-            if agencies:
-                restriction_filters.append(func.replace(func.trim(func.lower(models.Work.agency_name)), '\u00a0', ' ').in_(agencies))
-                any_restriction = True
+        if agencies:
+            restriction_filters.append(func.replace(func.trim(func.lower(models.Work.agency_name)), '\u00a0', ' ').in_(sorted(agencies)))
+            any_restriction = True
         
         # 2. Block restriction
-        if user.allowed_blocks:
-            blocks = [b.strip().lower().replace('\u00a0', ' ') for b in user.allowed_blocks.split(',') if b.strip()]
-            if blocks:
-                restriction_filters.append(func.replace(func.trim(func.lower(models.Work.block)), '\u00a0', ' ').in_(blocks))
-                any_restriction = True
+        if blocks:
+            restriction_filters.append(func.replace(func.trim(func.lower(models.Work.block)), '\u00a0', ' ').in_(sorted(blocks)))
+            any_restriction = True
                 
         # 3. Panchayat restriction
-        if user.allowed_panchayats:
-            panchayats = [p.strip().lower().replace('\u00a0', ' ') for p in user.allowed_panchayats.split(',') if p.strip()]
-            if panchayats:
-                restriction_filters.append(func.replace(func.trim(func.lower(models.Work.panchayat)), '\u00a0', ' ').in_(panchayats))
-                any_restriction = True
-
-        # Explicit assignments override (OR)
-        user_assignment_ids = db.query(models.WorkAssignment.work_id).filter(models.WorkAssignment.user_id == user.id).all()
-        assigned_ids = [r[0] for r in user_assignment_ids]
+        if panchayats:
+            restriction_filters.append(func.replace(func.trim(func.lower(models.Work.panchayat)), '\u00a0', ' ').in_(sorted(panchayats)))
+            any_restriction = True
+
+        # Explicit assignments override (OR); a subquery, not a separate round trip
+        assigned_ids = db.query(models.WorkAssignment.work_id).filter(models.WorkAssignment.user_id == user.id)
         
         explicit_cond = or_(
             models.Work.assigned_officer_id == user.id,
@@ -510,8 +516,72 @@ def apply_sorting(query, sort_by, sort_order):
             query = query.order_by(col.asc())
     return query
 
+def parse_range_filters(min_amount, max_amount, start_date, end_date):
+    """Parse the amount / date range query strings leniently (invalid values are ignored)."""
+    parsed_min = None
+    if min_amount and str(min_amount).strip():
+        try: parsed_min = float(min_amount)
+        except: pass
+
+    parsed_max = None
+    if max_amount and str(max_amount).strip():
+        try: parsed_max = float(max_amount)
+        except: pass
+
+    parsed_start = None
+    if start_date and str(start_date).strip():
+        try: parsed_start = datetime.fromisoformat(str(start_date).replace('Z', '+00:00'))
+        except: pass
+
+    parsed_end = None
+    if end_date and str(end_date).strip():
+        try: parsed_end = datetime.fromisoformat(str(end_date).replace('Z', '+00:00'))
+        except: pass
+
+    return parsed_min, parsed_max, parsed_start, parsed_end
+
+# Helpers for responsive photo variants (srcset)
+def photo_variants_map(db: Session, photo_ids) -> dict:
+    """{photo id: [WorkPhotoVariant, ...] ordered by width} for the given WorkPhoto ids."""
+    photo_ids = list(photo_ids)
+    result = {}
+    for start in range(0, len(photo_ids), 900):  # stay under SQLite's bound-parameter limit
+        variants = db.query(models.WorkPhotoVariant).filter(
+            models.WorkPhotoVariant.photo_id.in_(photo_ids[start:start + 900])
+        ).order_by(models.WorkPhotoVariant.width).all()
+        for v in variants:
+            result.setdefault(v.photo_id, []).append(v)
+    return result
+
+def photo_version(image_path: str) -> str:
+    """Content version of a photo for cacheable URLs: its file name (content-addressed), unlike ids which SQLite reuses."""
+    return os.path.splitext(os.path.basename(image_path or ""))[0]
+
+def photo_variant_fields(photo: models.WorkPhoto, variants) -> dict:
+    """
+    "variants" (one entry per size/format) and "srcset" (per format, ready for
+    <img srcset>/<source srcset>) for a photo's API representation. Photos
+    without stored variants (uploaded before the ladder existed) point at the
+    on-demand /photos/{id}/variant endpoint instead, versioned by content.
+    """
+    if variants:
+        entries = [(v.width, v.height, v.format, v.path, v.size_bytes) for v in sorted(variants, key=lambda v: v.width)]
+    else:
+        version = photo_version(photo.image_path)
+        entries = [
+            (width, None, fmt, f"api/photos/{photo.id}/variant?width={width}&format={fmt}&v={version}", None)
+            for width in image_utils.VARIANT_WIDTHS for fmt in image_utils.VARIANT_FORMATS
+        ]
+    srcset = {}
+    for width, _, fmt, url, _ in entries:
+        srcset.setdefault(fmt, []).append(f"/{url.replace(os.sep, '/')} {width}w")
+    return {
+        "variants": [{"width": w, "height": h, "format": fmt, "url": url, "size_bytes": size} for w, h, fmt, url, size in entries],
+        "srcset": {fmt: ", ".join(items) for fmt, items in srcset.items()},
+    }
+
 @router.get("/works/my-assignments")
-async def get_my_assignments(
+def get_my_assignments(
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -534,16 +604,91 @@ async def get_my_assignments(
     result = []
     for w in works:
         photos = db.query(models.WorkPhoto).filter(models.WorkPhoto.work_id == w.id).all()
+        variants_map = photo_variants_map(db, [p.id for p in photos])
         assigned_officer = db.query(models.User).filter(models.User.id == w.assigned_officer_id).first() if w.assigned_officer_id else None
         work_dict = {c.name: getattr(w, c.name) for c in w.__table__.columns}
-        work_dict["photos"] = [{"id": p.id, "image_path": p.image_path, "thumbnail_path": p.thumbnail_path, "category": p.category, "caption": p.caption, "uploaded_at": str(p.uploaded_at) if p.uploaded_at else None, "uploaded_by": p.uploaded_by} for p in photos]
+        work_dict["photos"] = [{"id": p.id, "image_path": p.image_path, "thumbnail_path": p.thumbnail_path, "category": p.category, "caption": p.caption, "uploaded_at": str(p.uploaded_at) if p.uploaded_at else None, "uploaded_by": p.uploaded_by, **photo_variant_fields(p, variants_map.get(p.id, []))} for p in photos]
         work_dict["assigned_officer"] = {"id": assigned_officer.id, "username": assigned_officer.username} if assigned_officer else None
         result.append(work_dict)
 
     return result
 
+@router.get("/works/route-plan")
+def get_route_plan(
+    start_lat: Optional[float] = None,
+    start_lng: Optional[float] = None,
+    officer_id: Optional[int] = None,
+    stops_per_day: int = Query(route_planner.DEFAULT_STOPS_PER_DAY, ge=1, le=100),
+    max_km_per_day: Optional[float] = Query(None, gt=0),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Plan an inspection route over the officer's open assigned works.
+    Officers plan for themselves; admin may pass officer_id.
+    Without a start location the route starts from the Dantewada block center.
+    """
+    from sqlalchemy import or_
+    import ingester
+
+    user_id = current_user.id
+    if officer_id is not None and officer_id != current_user.id:
+        if current_user.role != "admin":
+            raise HTTPException(status_code=403, detail="Only admin can plan routes for other officers")
+        user_id = officer_id
+
+    if (start_lat is None) != (start_lng is None):
+        raise HTTPException(status_code=400, detail="Provide both start_lat and start_lng")
+    start = (start_lat, start_lng) if start_lat is not None else ingester.BLOCK_CENTERS['DANTEWADA']
+
+    assigned_ids = db.query(models.WorkAssignment.work_id).filter(models.WorkAssignment.user_id == user_id)
+    works = db.query(
+        models.Work.id,
+        models.Work.work_code,
+        models.Work.work_name,
+        models.Work.block,
+        models.Work.panchayat,
+        models.Work.current_status,
+        models.Work.inspection_deadline,
+        models.Work.latitude,
+        models.Work.longitude
+    ).filter(
+        or_(
+            models.Work.assigned_officer_id == user_id,
+            models.Work.id.in_(assigned_ids)
+        ),
+        or_(
+            models.Work.current_status == None,
+            models.Work.current_status.notin_(["Completed", "Cancelled"])
+        )
+    ).order_by(models.Work.id).all()
+
+    stops = []
+    missing_coords = []
+    for w in works:
+        if w.latitude is None or w.longitude is None:
+            missing_coords.append(w.id)
+            continue
+        stops.append({
+            "work_id": w.id,
+            "work_code": w.work_code,
+            "work_name": w.work_name,
+            "block": w.block,
+            "panchayat": w.panchayat,
+            "current_status": w.current_status,
+            "inspection_deadline": w.inspection_deadline.isoformat() if w.inspection_deadline else None,
+            "latitude": w.latitude,
+            "longitude": w.longitude
+        })
+
+    plan = route_planner.plan_route(start, stops, stops_per_day, max_km_per_day)
+    plan["start"] = {"latitude": start[0], "longitude": start[1]}
+    plan["officer_id"] = user_id
+    plan["skipped_without_coordinates"] = missing_coords
+    return plan
+
 @router.get("/works")
-async def get_works(
+def get_works(
     response: Response,
     department: Optional[List[str]] = Query(None), 
     block: Optional[List[str]] = Query(None),
@@ -603,6 +748,7 @@ async def get_works(
     if work_ids:
         from sqlalchemy import func
         photos = db.query(models.WorkPhoto).filter(models.WorkPhoto.work_id.in_(work_ids)).order_by(models.WorkPhoto.uploaded_at.desc()).all()
+        variants_map = photo_variants_map(db, [p.id for p in photos])
         for p in photos:
             if p.work_id not in work_photos_map:
                 work_photos_map[p.work_id] = []
@@ -613,7 +759,8 @@ async def get_works(
                 "caption": p.caption,
                 "category": p.category,
                 "uploaded_by": p.uploaded_by,
-                "uploaded_at": p.uploaded_at.isoformat() if p.uploaded_at else None
+                "uploaded_at": p.uploaded_at.isoformat() if p.uploaded_at else None,
+                **photo_variant_fields(p, variants_map.get(p.id, []))
             })
             
         subq_insp = db.query(
@@ -673,7 +820,7 @@ async def get_works(
     return result
 
 @router.get("/works/export")
-async def export_works(
+def export_works(
     department: Optional[List[str]] = Query(None), 
     block: Optional[List[str]] = Query(None),
     panchayat: Optional[List[str]] = Query(None),
@@ -687,96 +834,59 @@ async def export_works(
     max_amount: Optional[str] = Query(None),
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
+    export_format: str = Query("xlsx", alias="format"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    try:
-        # Parse numeric filters safely
-        parsed_min = None
-        if min_amount and str(min_amount).strip():
-            try: parsed_min = float(min_amount)
-            except: pass
-            
-        parsed_max = None
-        if max_amount and str(max_amount).strip():
-            try: parsed_max = float(max_amount)
-            except: pass
+    export_format = (export_format or "xlsx").lower()
+    if export_format not in exporters.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format. Use one of: {', '.join(exporters.EXPORT_FORMATS)}")
+    media_type, extension = exporters.EXPORT_FORMATS[export_format]
+    filename = f"works_export_{datetime.now().strftime('%Y%m%d')}.{extension}"
 
-        # Parse date filters safely
-        parsed_start = None
-        if start_date and str(start_date).strip():
-            try: parsed_start = datetime.fromisoformat(str(start_date).replace('Z', '+00:00'))
-            except: pass
-
-        parsed_end = None
-        if end_date and str(end_date).strip():
-            try: parsed_end = datetime.fromisoformat(str(end_date).replace('Z', '+00:00'))
-            except: pass
+    try:
+        parsed_min, parsed_max, parsed_start, parsed_end = parse_range_filters(min_amount, max_amount, start_date, end_date)
 
         query = build_works_query(db, current_user, department, block, panchayat, status, agency, year, search, parsed_start, parsed_end, parsed_min, parsed_max)
         query = apply_sorting(query, sort_by, sort_order)
-        results = query.all()
-        print(f"DEBUG: Export found {len(results)} rows")
-        
-        # Convert manually to avoid pandas overhead? No, pandas is safer for Excel
-        data = []
-        for r in results:
-            data.append({
-                "Work Code": r.work_code,
-                "Work Name": r.work_name,
-                "Department": r.department,
-                "Type": r.financial_year, # Column 2 is Financial Year mostly
-                "Location": r.panchayat, # Strict
-                "Block": r.block,
-                "Sanctioned Amount": r.sanctioned_amount,
-                "Sanctioned Date": r.sanctioned_date,
-                "Status": r.current_status,
-                "Agency": r.agency_name,
-                "Released": r.total_released_amount,
-                "Pending": r.amount_pending,
-                "Est End Date": r.probable_completion_date,
-                "Remark": r.remark,
-                "Assigned To": r.assigned_officer.username if r.assigned_officer else "Unassigned"
-            })
-        
-        df = pd.DataFrame(data)
-        
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Works')
-            # Auto-wrap text
-            worksheet = writer.sheets['Works']
-            from openpyxl.styles import Alignment
-            for row in worksheet.iter_rows():
-                for cell in row:
-                    cell.alignment = Alignment(wrap_text=True, vertical='top')
-            
-            # Adjust column widths
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except: pass
-                adjusted_width = min(max_length + 2, 50) # Cap width at 50
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-
-        output.seek(0)
-        
-        return Response(
-            content=output.getvalue(), 
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", 
-            headers={"Content-Disposition": f"attachment; filename=works_export_{datetime.now().strftime('%Y%m%d')}.xlsx"}
+
+        # CSV / NDJSON are streamed row batches straight from the cursor
+        if export_format == "csv":
+            body = exporters.stream_works_csv(query)
+            return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f"attachment; filename={filename}"})
+        if export_format == "ndjson":
+            body = exporters.stream_works_ndjson(query)
+            return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+        # XLSX / Parquet need a footer written last: build into a temp file, then stream it in chunks
+        writer = exporters.write_works_parquet if export_format == "parquet" else exporters.write_works_xlsx
+        path = exporters.temp_path(f".{extension}")
+        try:
+            writer(query, path)
+        except ImportError:
+            os.remove(path)
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow on the server")
+        except Exception:
+            os.remove(path)
+            raise
+
+        return StreamingResponse(
+            exporters.iter_file(path),
+            media_type=media_type,
+            headers={
+                "Content-Disposition": f"attachment; filename={filename}",
+                "Content-Length": str(os.path.getsize(path))
+            }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Export Failed: {str(e)}")
 
 @router.get("/works/export/pdf")
-async def export_works_pdf(
+def export_works_pdf(
     department: Optional[List[str]] = Query(None), 
     block: Optional[List[str]] = Query(None),
     panchayat: Optional[List[str]] = Query(None),
@@ -794,72 +904,32 @@ async def export_works_pdf(
     db: Session = Depends(get_db)
 ):
     try:
-        # Parse numeric filters safely
-        parsed_min = None
-        if min_amount and str(min_amount).strip():
-            try: parsed_min = float(min_amount)
-            except: pass
-            
-        parsed_max = None
-        if max_amount and str(max_amount).strip():
-            try: parsed_max = float(max_amount)
-            except: pass
+        parsed_min, parsed_max, parsed_start, parsed_end = parse_range_filters(min_amount, max_amount, start_date, end_date)
 
-        # Parse date filters safely
-        parsed_start = None
-        if start_date and str(start_date).strip():
-            try: parsed_start = datetime.fromisoformat(str(start_date).replace('Z', '+00:00'))
-            except: pass
-
-        parsed_end = None
-        if end_date and str(end_date).strip():
-            try: parsed_end = datetime.fromisoformat(str(end_date).replace('Z', '+00:00'))
-            except: pass
-
-        # 1. Fetch filtered works
         query = build_works_query(db, current_user, department, block, panchayat, status, agency, year, search, parsed_start, parsed_end, parsed_min, parsed_max)
         query = apply_sorting(query, sort_by, sort_order)
-        # Limit to prevent massive un-renderable PDFs
-        works = query.limit(500).all()
-        
-        # 2. Fetch all photos for the works
-        work_ids = [w.id for w in works]
-        work_photos_map = {}
-        
-        if work_ids:
-            photos = db.query(models.WorkPhoto).filter(models.WorkPhoto.work_id.in_(work_ids)).order_by(models.WorkPhoto.uploaded_at.desc()).all()
-            for p in photos:
-                if p.work_id not in work_photos_map:
-                    work_photos_map[p.work_id] = []
-                work_photos_map[p.work_id].append({
-                    "image_path": p.image_path,
-                    "thumbnail_path": p.thumbnail_path,
-                    "category": p.category,
-                    "uploaded_at": p.uploaded_at.isoformat() if p.uploaded_at else None
-                })
-                
-        # 3. Build dictionary format matching pdf_generator expectations
-        result = []
-        for w in works:
-            result.append({
-                "work_code": w.work_code,
-                "work_name": w.work_name,
-                "agency_name": w.agency_name,
-                "block": f"{w.block} - {w.panchayat}",
-                "sanctioned_amount": w.sanctioned_amount,
-                "current_status": w.current_status,
-                "admin_remarks": w.admin_remarks,
-                "photos": work_photos_map.get(w.id, [])
-            })
-            
-        # 4. Generate PDF buffer
-        pdf_buffer = pdf_generator.build_visual_pdf(result)
+
+        # Photos pre-scaled and chunks rendered in worker processes
+        path = exporters.temp_path(".pdf")
+        try:
+            exporters.write_works_pdf(db, query, path)
+        except pdf_generator.PdfPoolBusy as e:
+            os.remove(path)
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+        except Exception:
+            os.remove(path)
+            raise
         
-        return Response(
-            content=pdf_buffer.getvalue(),
+        return StreamingResponse(
+            exporters.iter_file(path),
             media_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=Dantewada_Visual_Report.pdf"}
+            headers={
+                "Content-Disposition": "attachment; filename=Dantewada_Visual_Report.pdf",
+                "Content-Length": str(os.path.getsize(path))
+            }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print("PDF Export failed:", str(e))
         import traceback
@@ -868,87 +938,41 @@ async def export_works_pdf(
 
 
 @router.get("/reports/inspection-status")
-async def export_inspection_status(db: Session = Depends(get_db)):
+def export_inspection_status(
+    department: Optional[List[str]] = Query(None),
+    block: Optional[List[str]] = Query(None),
+    panchayat: Optional[List[str]] = Query(None),
+    status: Optional[List[str]] = Query(None),
+    agency: Optional[List[str]] = Query(None),
+    year: Optional[List[str]] = Query(None),
+    search: Optional[str] = None,
+    min_amount: Optional[str] = Query(None),
+    max_amount: Optional[str] = Query(None),
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
     try:
-        works = db.query(models.Work).all()
-        work_ids = [w.id for w in works]
-        
-        from sqlalchemy import func
-        photo_counts = dict(
-            db.query(models.WorkPhoto.work_id, func.count(models.WorkPhoto.id))
-            .filter(models.WorkPhoto.work_id.in_(work_ids))
-            .group_by(models.WorkPhoto.work_id)
-            .all()
-        ) if work_ids else {}
-        
-        latest_inspections = dict(
-            db.query(models.Inspection.work_id, func.max(models.Inspection.inspection_date))
-            .filter(models.Inspection.work_id.in_(work_ids))
-            .group_by(models.Inspection.work_id)
-            .all()
-        ) if work_ids else {}
-        
-        data = []
-        for w in works:
-            if not w.assigned_officer_id:
-                continue 
-            
-            p_count = photo_counts.get(w.id, 0)
-            inspection_date = latest_inspections.get(w.id)
-            data.append({
-                "Agency": w.agency_name or "Unknown",
-                "Work Code": w.work_code,
-                "Assigned User": w.assigned_officer.username if w.assigned_officer else "Unknown",
-                "Has Photo": "Yes" if p_count > 0 else "No",
-                "Photo Count": p_count,
-                "Latest Inspection Date": inspection_date.isoformat() if inspection_date else None
-            })
-            
-        df = pd.DataFrame(data)
-        
-        if df.empty:
-            summary_df = pd.DataFrame(columns=["Agency", "Total Assigned", "With Photos", "Pending Photos"])
-        else:
-            summary = df.groupby("Agency").agg(
-                Total_Assigned=("Work Code", "count"),
-                With_Photos=("Has Photo", lambda x: (x == "Yes").sum()),
-            ).reset_index()
-            summary["Pending_Photos"] = summary["Total_Assigned"] - summary["With_Photos"]
-            summary_df = summary.rename(columns={
-                "Total_Assigned": "Total Assigned", 
-                "With_Photos": "With Photos",
-                "Pending_Photos": "Pending Photos"
-            })
-        
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            summary_df.to_excel(writer, index=False, sheet_name='Agency Summary')
-            if not df.empty:
-                df.to_excel(writer, index=False, sheet_name='Detailed Works')
-            
-            for sheetname in writer.sheets:
-                worksheet = writer.sheets[sheetname]
-                from openpyxl.styles import Alignment
-                for row in worksheet.iter_rows():
-                    for cell in row:
-                        cell.alignment = Alignment(wrap_text=True, vertical='top')
-                
-                for column in worksheet.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except: pass
-                    worksheet.column_dimensions[column_letter].width = min(max_length + 2, 50)
-
-        output.seek(0)
+        parsed_min, parsed_max, parsed_start, parsed_end = parse_range_filters(min_amount, max_amount, start_date, end_date)
+        # Scoped like /works/export: only the works the caller may see
+        query = build_works_query(db, current_user, department, block, panchayat, status, agency, year, search, parsed_start, parsed_end, parsed_min, parsed_max)
+
+        # Two grouped queries streamed into a write-only workbook
+        path = exporters.temp_path(".xlsx")
+        try:
+            exporters.write_inspection_status_xlsx(db, path, query)
+        except Exception:
+            os.remove(path)
+            raise
         
-        return Response(
-            content=output.getvalue(), 
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", 
-            headers={"Content-Disposition": f"attachment; filename=inspection_status_report_{datetime.now().strftime('%Y%m%d')}.xlsx"}
+        return StreamingResponse(
+            exporters.iter_file(path),
+            media_type=exporters.XLSX_MEDIA_TYPE,
+            headers={
+                "Content-Disposition": f"attachment; filename=inspection_status_report_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                "Content-Length": str(os.path.getsize(path))
+            }
         )
     except Exception as e:
         import traceback
@@ -956,16 +980,183 @@ async def export_inspection_status(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Report Export Failed: {str(e)}")
 
 
+# --- EXPORT JOBS ---
+# Same filters as the GET export endpoints, built on the job queue and cached
+EXPORT_JOB_KINDS = ["works", "works_pdf", "inspection_status"]
+
+def _export_job_filters(raw):
+    """build_works_query filters from the raw query values stored in an export job."""
+    department, block, panchayat, status, agency, year, search, min_amount, max_amount, start_date, end_date = raw
+    parsed_min, parsed_max, parsed_start, parsed_end = parse_range_filters(min_amount, max_amount, start_date, end_date)
+    return (department, block, panchayat, status, agency, year, search, parsed_start, parsed_end, parsed_min, parsed_max)
+
+@export_jobs.builder("works")
+@export_jobs.builder("works_pdf")
+def build_works_export(db: Session, params: dict, user_id: int, path: str) -> int:
+    """Re-resolves the user and query on the job worker's own session."""
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    query = apply_sorting(build_works_query(db, user, *_export_job_filters(params["filters"])), params["sort_by"], params["sort_order"])
+    export_format = params["format"]
+    if export_format == "pdf":
+        try:
+            return exporters.write_works_pdf(db, query, path)
+        except pdf_generator.PdfPoolBusy:
+            raise job_queue.Defer(10, "PDF report slots are busy")
+    if export_format in ("csv", "ndjson"):
+        return exporters.write_works_text(query, path, export_format)
+    if export_format == "parquet":
+        return exporters.write_works_parquet(query, path)
+    return exporters.write_works_xlsx(query, path)
+
+@export_jobs.builder("inspection_status")
+def build_inspection_status_export(db: Session, params: dict, user_id: int, path: str) -> int:
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    return exporters.write_inspection_status_xlsx(db, path, build_works_query(db, user, *_export_job_filters(params["filters"])))
+
+@router.post("/exports/jobs")
+def submit_export_job(
+    kind: str = Query("works"),
+    department: Optional[List[str]] = Query(None),
+    block: Optional[List[str]] = Query(None),
+    panchayat: Optional[List[str]] = Query(None),
+    status: Optional[List[str]] = Query(None),
+    agency: Optional[List[str]] = Query(None),
+    year: Optional[List[str]] = Query(None),
+    search: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    sort_order: Optional[str] = "asc",
+    min_amount: Optional[str] = Query(None),
+    max_amount: Optional[str] = Query(None),
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    export_format: str = Query("xlsx", alias="format"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Submit an export job (kind: works | works_pdf | inspection_status).
+    Returns the job; poll GET /exports/jobs/{id} and download once status is "done".
+    An identical export that is cached is returned at once, one being built is waited for.
+    """
+    if kind not in EXPORT_JOB_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unsupported kind. Use one of: {', '.join(EXPORT_JOB_KINDS)}")
+    stamp = datetime.now().strftime('%Y%m%d')
+
+    # Raw values (parsed again by the builder) so the job payload stays plain JSON
+    filters = (department, block, panchayat, status, agency, year, search, min_amount, max_amount, start_date, end_date)
+    raw_filters = [sorted(v) if isinstance(v, list) else v for v in filters]
+
+    if kind == "inspection_status":
+        params = {"filters": raw_filters}
+        scope = export_jobs.scope_for(current_user)
+        media_type, extension = exporters.XLSX_MEDIA_TYPE, "xlsx"
+        filename = f"inspection_status_report_{stamp}.xlsx"
+    else:
+        export_format = "pdf" if kind == "works_pdf" else (export_format or "xlsx").lower()
+        if export_format != "pdf" and export_format not in exporters.EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported format. Use one of: {', '.join(exporters.EXPORT_FORMATS)}")
+
+        params = {"filters": raw_filters, "sort_by": sort_by, "sort_order": sort_order, "format": export_format}
+        scope = export_jobs.scope_for(current_user)
+        if export_format == "pdf":
+            media_type, extension = "application/pdf", "pdf"
+            filename = "Dantewada_Visual_Report.pdf"
+        else:
+            media_type, extension = exporters.EXPORT_FORMATS[export_format]
+            filename = f"works_export_{stamp}.{extension}"
+
+    job = export_jobs.submit(db, kind, params, scope, current_user.id, extension, media_type, filename)
+    return export_jobs.public(job)
+
+@router.get("/exports/jobs/{job_id}")
+def get_export_job(job_id: int, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    job = export_jobs.get_job(db, job_id, current_user)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return export_jobs.public(job)
+
+@router.get("/exports/jobs/{job_id}/download")
+def download_export_job(job_id: int, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    job = export_jobs.get_job(db, job_id, current_user)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job.status != job_queue.STATUS_DONE:
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+    path = export_jobs.artifact_for_download(job)
+    if not path:
+        raise HTTPException(status_code=410, detail="Export has expired, please submit it again")
+    payload = job_queue.payload_of(job)
+    return StreamingResponse(
+        exporters.iter_file(path, delete=False),
+        media_type=payload["media_type"],
+        headers={
+            "Content-Disposition": f"attachment; filename={payload['filename']}",
+            "Content-Length": str(os.path.getsize(path))
+        }
+    )
+
 @router.get("/works/{work_id}")
-async def get_work(work_id: int, db: Session = Depends(get_db)):
+def get_work(work_id: int, db: Session = Depends(get_db)):
     # Work does not have 'photos' relationship directly. Inspections have photos.
     work = db.query(models.Work).filter(models.Work.id == work_id).first()
     if not work:
         raise HTTPException(status_code=404, detail="Work not found")
     return work
 
+def record_inspection(db: Session, work: models.Work, user: models.User, status: str, latitude: float, longitude: float,
+                      remarks: str = "", inspector_name: str = "", inspector_designation: str = "", inspected_at: datetime = None):
+    """
+    Add an Inspection of `work` and apply it to the work (location, verified on
+    ground, last visited); a GPS fix far from the work is flagged instead of
+    moving it. Flushed, not committed.
+
+    Returns:
+        (inspection, gps_flag or None)
+    """
+    # Create Inspection Record
+    final_inspector_name = inspector_name if inspector_name else user.username
+    inspected_at = inspected_at or datetime.utcnow()
+    
+    new_inspection = models.Inspection(
+        work_id=work.id,
+        inspector_name=final_inspector_name,
+        inspector_designation=inspector_designation,
+        status_at_time=status,
+        remarks=remarks,
+        latitude=latitude,
+        longitude=longitude,
+        inspection_date=inspected_at
+    )
+    db.add(new_inspection)
+    db.flush() # Get ID
+
+    # Check the submitted fix against the work / GP / block reference points.
+    # Only a fix within WORK_RADIUS_KM of the work (or for a work with no
+    # coordinates yet) may move it on the map; anything else, including a fix
+    # that is merely inside the GP, is flagged for review instead.
+    # BUT DO NOT update current_status automatically. Admin must approve.
+    gps_flag = gps_check.check_inspection(work, latitude, longitude)
+    if gps_flag:
+        db.add(models.GpsAnomaly(
+            inspection_id=new_inspection.id,
+            work_id=work.id,
+            latitude=latitude,
+            longitude=longitude,
+            **gps_flag
+        ))
+    else:
+        work.latitude = latitude
+        work.longitude = longitude
+    # Also update verified status? User said "Verified on ground?" - keeping this as it reflects field reality
+    work.verified_on_ground = "Yes"
+    # work.inspection_date = datetime.utcnow() # Maybe keep this? Or only on approval? 
+    # Let's keep inspection_date as "last visited".
+    work.inspection_date = inspected_at
+    work.last_updated = datetime.utcnow()
+    return new_inspection, gps_flag
+
 @router.post("/works/{work_id}/inspections")
-async def create_inspection(
+def create_inspection(
     work_id: int,
     status: str = Form(...),
     photo_category: str = Form("During"),
@@ -983,60 +1174,332 @@ async def create_inspection(
         if not work:
             raise HTTPException(status_code=404, detail="Work not found")
             
-        # Create Inspection Record
-        final_inspector_name = inspector_name if inspector_name else current_user.username
-        
-        new_inspection = models.Inspection(
-            work_id=work_id,
-            inspector_name=final_inspector_name,
-            inspector_designation=inspector_designation,
-            status_at_time=status,
-            remarks=remarks,
-            latitude=latitude,
-            longitude=longitude,
-            inspection_date=datetime.utcnow()
+        # Process Photos (compression, thumbnail, orientation) in parallel in the image pool
+        # before anything is written, so no write lock is held while it runs; photos already
+        # stored (e.g. resent from the offline queue) are not processed again
+        files = [(photo.file.read(), photo.filename) for photo in photos]
+        try:
+            prepared = photo_store.prepare_uploads(db, files)
+        except image_utils.ImagePoolBusy as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+        new_inspection, gps_flag = record_inspection(
+            db, work, current_user, status, latitude, longitude, remarks, inspector_name, inspector_designation
         )
-        db.add(new_inspection)
-        db.flush() # Get ID
-        
-        # Save Photos
-        for photo in photos:
-            # Read file bytes for processing
-            file_bytes = await photo.read()
-            
-            # Use image_utils for processing (compression, thumbnail, orientation)
-            full_path, thumb_path = image_utils.process_upload(file_bytes, photo.filename)
-            
-            new_photo = models.WorkPhoto(
-                work_id=work_id,
-                image_path=full_path,
-                thumbnail_path=thumb_path,
-                caption=f"Status: {status} | Remarks: {remarks}",
-                category=photo_category,
-                uploaded_by=current_user.username
-            )
-            db.add(new_photo)
-            
-        # Update Work's latitude/longitude to reflect latest inspection location (useful for tracking)
-        # BUT DO NOT update current_status automatically. Admin must approve.
-        work.latitude = latitude
-        work.longitude = longitude
-        # Also update verified status? User said "Verified on ground?" - keeping this as it reflects field reality
-        work.verified_on_ground = "Yes"
-        # work.inspection_date = datetime.utcnow() # Maybe keep this? Or only on approval? 
-        # Let's keep inspection_date as "last visited".
-        work.inspection_date = datetime.utcnow()
-        work.last_updated = datetime.utcnow()
+        stored = photo_store.attach_uploads(
+            db, work_id, prepared, range(len(files)), current_user.username,
+            caption=f"Status: {status} | Remarks: {remarks}", category=photo_category
+        )
+
+        for result in stored:
+            if isinstance(result, Exception):
+                raise result
         
         db.commit()
-        return {"message": "Inspection submitted successfully"}
+        return {"message": "Inspection submitted successfully", "gps_flag": gps_flag["reason"] if gps_flag else None}
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Inspection failed: {str(e)}")
 
+# --- Offline sync ---
+SYNC_MAX_ITEMS = 100
+
+class SyncInspectionItem(BaseModel):
+    client_id: str                     # idempotency id generated on the device
+    work_id: int
+    status: str
+    latitude: float
+    longitude: float
+    remarks: str = ""
+    inspector_name: str = ""
+    inspector_designation: str = ""
+    photo_category: str = "During"
+    recorded_at: Optional[datetime] = None  # when the officer inspected (offline), defaults to now
+    photos: List[str] = []             # filenames of this request's uploaded files
+
+@router.post("/sync/inspections")
+def sync_inspections(
+    items: str = Form(...),
+    photos: List[UploadFile] = File([]),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Apply a backlog of offline-queued inspections in one request.
+
+    `items` is a JSON list of SyncInspectionItem; each item names its photos by
+    the filenames of the files uploaded alongside. Items are applied in one
+    transaction, each in its own savepoint, so a bad item fails alone. Items
+    whose client_id was already applied are not applied again - their original
+    result is returned - so a batch can be retried safely after a lost response.
+    """
+    import json
+    from pydantic import ValidationError
+    from database import begin_transaction
+
+    try:
+        raw_items = json.loads(items)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="items must be a JSON list")
+    if not isinstance(raw_items, list):
+        raise HTTPException(status_code=400, detail="items must be a JSON list")
+    if len(raw_items) > SYNC_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {SYNC_MAX_ITEMS} items per batch")
+
+    files_by_name = {}
+    for photo in photos:
+        files_by_name[photo.filename] = (photo.file.read(), photo.filename)
+
+    client_ids = [it.get("client_id") for it in raw_items if isinstance(it, dict)]
+    receipts = {r.client_id: r for r in db.query(models.SyncReceipt).filter(
+        models.SyncReceipt.user_id == current_user.id,
+        models.SyncReceipt.client_id.in_([c for c in client_ids if isinstance(c, str)])
+    )}
+
+    results = [None] * len(raw_items)
+    pending, seen = [], set()
+    for i, raw in enumerate(raw_items):
+        try:
+            item = SyncInspectionItem(**raw)
+        except (ValidationError, TypeError) as e:
+            results[i] = {"client_id": raw.get("client_id") if isinstance(raw, dict) else None, "status": "error", "error": str(e)}
+            continue
+        if item.client_id in receipts:
+            results[i] = {**json.loads(receipts[item.client_id].result), "status": "duplicate"}
+        elif item.client_id in seen:
+            results[i] = {"client_id": item.client_id, "status": "error", "error": "client_id repeated in this batch"}
+        elif any(name not in files_by_name for name in item.photos):
+            missing = [name for name in item.photos if name not in files_by_name]
+            results[i] = {"client_id": item.client_id, "status": "error", "error": f"Photos not in request: {missing}"}
+        else:
+            pending.append((i, item))
+        seen.add(item.client_id)
+
+    # Every new photo of the batch goes through the image pool in one go (before
+    # the write transaction starts, so no lock is held while images are processed)
+    files, file_index = [], {}
+    for _, item in pending:
+        for name in item.photos:
+            if name not in file_index:
+                file_index[name] = len(files)
+                files.append(files_by_name[name])
+    try:
+        prepared = photo_store.prepare_uploads(db, files)
+    except image_utils.ImagePoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    begin_transaction(db)
+    works = {w.id: w for w in db.query(models.Work).filter(models.Work.id.in_({item.work_id for _, item in pending}))}
+    for i, item in pending:
+        work = works.get(item.work_id)
+        if not work:
+            results[i] = {"client_id": item.client_id, "status": "error", "error": "Work not found"}
+            continue
+        savepoint = db.begin_nested()
+        try:
+            recorded_at = item.recorded_at
+            if recorded_at and recorded_at.tzinfo:
+                recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)  # stored as naive UTC
+            inspection, gps_flag = record_inspection(
+                db, work, current_user, item.status, item.latitude, item.longitude, item.remarks,
+                item.inspector_name, item.inspector_designation, recorded_at
+            )
+            stored = photo_store.attach_uploads(
+                db, work.id, prepared, [file_index[name] for name in item.photos], current_user.username,
+                caption=f"Status: {item.status} | Remarks: {item.remarks}", category=item.photo_category
+            )
+            failed = [r for r in stored if isinstance(r, Exception)]
+            if failed:
+                raise failed[0]
+            result = {
+                "client_id": item.client_id,
+                "status": "created",
+                "inspection_id": inspection.id,
+                "photo_ids": [r["photo"].id for r in stored],
+                "gps_flag": gps_flag["reason"] if gps_flag else None,
+            }
+            db.add(models.SyncReceipt(user_id=current_user.id, client_id=item.client_id, inspection_id=inspection.id, result=json.dumps(result)))
+            savepoint.commit()
+            results[i] = result
+        except Exception as e:
+            savepoint.rollback()
+            results[i] = {"client_id": item.client_id, "status": "error", "error": str(e)}
+    db.commit()
+
+    counts = {state: sum(1 for r in results if r["status"] == state) for state in ("created", "duplicate", "error")}
+    return {**counts, "results": results}
+
+SYNC_CHANGES_LIMIT = 500
+
+def sync_photo_payload(p: models.WorkPhoto, variants) -> dict:
+    return {
+        "id": p.id,
+        "work_id": p.work_id,
+        "image_path": p.image_path,
+        "thumbnail_path": p.thumbnail_path,
+        "caption": p.caption,
+        "category": p.category,
+        "uploaded_by": p.uploaded_by,
+        "uploaded_at": p.uploaded_at.isoformat() if p.uploaded_at else None,
+        **photo_variant_fields(p, variants)
+    }
+
+def sync_inspection_payload(i: models.Inspection) -> dict:
+    return {
+        "id": i.id,
+        "work_id": i.work_id,
+        "status": i.status_at_time,
+        "remarks": i.remarks,
+        "inspector_name": i.inspector_name,
+        "inspector_designation": i.inspector_designation,
+        "latitude": i.latitude,
+        "longitude": i.longitude,
+        "date": i.inspection_date.isoformat() if i.inspection_date else None,
+    }
+
+def sync_works_payload(db: Session, work_ids) -> list:
+    """Works with all their photos and inspections, for /sync/changes."""
+    work_ids = list(work_ids)
+    works, photos, inspections = [], [], []
+    for start in range(0, len(work_ids), 900):  # stay under SQLite's bound-parameter limit
+        chunk = work_ids[start:start + 900]
+        works += db.query(models.Work).filter(models.Work.id.in_(chunk)).order_by(models.Work.id).all()
+        photos += db.query(models.WorkPhoto).filter(models.WorkPhoto.work_id.in_(chunk)).order_by(models.WorkPhoto.uploaded_at.desc()).all()
+        inspections += db.query(models.Inspection).filter(models.Inspection.work_id.in_(chunk)).order_by(models.Inspection.id).all()
+    variants_map = photo_variants_map(db, [p.id for p in photos])
+    photos_by_work, inspections_by_work = {}, {}
+    for p in photos:
+        photos_by_work.setdefault(p.work_id, []).append(sync_photo_payload(p, variants_map.get(p.id, [])))
+    for i in inspections:
+        inspections_by_work.setdefault(i.work_id, []).append(sync_inspection_payload(i))
+    result = []
+    for w in works:
+        work_dict = {c.name: getattr(w, c.name) for c in w.__table__.columns}
+        work_dict["photos"] = photos_by_work.get(w.id, [])
+        work_dict["inspections"] = inspections_by_work.get(w.id, [])
+        result.append(work_dict)
+    return result
+
+@router.get("/sync/changes")
+def get_sync_changes(
+    since: Optional[str] = None,
+    limit: int = Query(SYNC_CHANGES_LIMIT, ge=1, le=5000),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    What changed in the current user's works since `since` (the token of the previous call).
+
+    Without a usable token (first sync, a token older than the pruned change
+    log, or after the user's own permissions changed) the response is a full
+    snapshot ("full": true): every work in scope with its photos and
+    inspections. Otherwise it holds only:
+    - works: works whose row or assignments changed, with all their photos and inspections
+    - photos / inspections: rows added or edited in other works
+    - deleted: {"photos": [...], "inspections": [...]} ids removed (tombstones)
+    - removed: work ids deleted or no longer visible to the user
+    Call again with the returned token while "has_more" is true.
+    """
+    try:
+        since_token = int(since) if since else None
+    except ValueError:
+        since_token = None
+
+    scope = build_works_query(db, current_user).with_entities(models.Work.id)
+    # A token ahead of the log (database restored from a backup) is as unusable as a pruned one
+    if since_token is not None and delta_sync.pruned_through(db) <= since_token <= delta_sync.head(db):
+        entries, token, has_more = delta_sync.changes(db, since_token, limit)
+        if not any(e.entity == "user" and e.entity_id == current_user.id for e in entries):
+            return sync_delta(db, scope, entries, token, has_more)
+
+    # Token taken before reading, so changes made meanwhile are sent again next time
+    token = delta_sync.head(db)
+    work_ids = [row[0] for row in scope.all()]
+    return {
+        "token": str(token),
+        "full": True,
+        "has_more": False,
+        "works": sync_works_payload(db, work_ids),
+        "photos": [],
+        "inspections": [],
+        "deleted": {"photos": [], "inspections": []},
+        "removed": [],
+    }
+
+def sync_delta(db: Session, scope, entries, token: int, has_more: bool) -> dict:
+    # Photo/inspection entries of works the user can't see are dropped silently;
+    # work and assignment changes may have moved a work out of scope, so those are reported
+    touched = {e.work_id for e in entries if e.work_id is not None}
+    scope_changes = {e.work_id for e in entries if e.entity in ("work", "assignment")}
+    visible = set()
+    touched_list = list(touched)
+    for start in range(0, len(touched_list), 900):
+        visible.update(row[0] for row in scope.filter(models.Work.id.in_(touched_list[start:start + 900])))
+
+    # Latest op per entity wins: an upsert followed by a delete is a delete, and vice versa
+    latest = {}
+    for e in entries:
+        latest[(e.entity, e.entity_id)] = e
+    work_ids = {e.work_id for e in latest.values() if e.entity in ("work", "assignment") and e.work_id in visible}
+    photo_ids = [e.entity_id for e in latest.values() if e.entity == "photo" and e.op == delta_sync.OP_UPSERT and e.work_id in visible and e.work_id not in work_ids]
+    inspection_ids = [e.entity_id for e in latest.values() if e.entity == "inspection" and e.op == delta_sync.OP_UPSERT and e.work_id in visible and e.work_id not in work_ids]
+
+    photos = db.query(models.WorkPhoto).filter(models.WorkPhoto.id.in_(photo_ids)).all() if photo_ids else []
+    variants_map = photo_variants_map(db, [p.id for p in photos])
+    inspections = db.query(models.Inspection).filter(models.Inspection.id.in_(inspection_ids)).all() if inspection_ids else []
+    return {
+        "token": str(token),
+        "full": False,
+        "has_more": has_more,
+        "works": sync_works_payload(db, work_ids),
+        "photos": [sync_photo_payload(p, variants_map.get(p.id, [])) for p in photos],
+        "inspections": [sync_inspection_payload(i) for i in inspections],
+        "deleted": {
+            "photos": sorted(e.entity_id for e in latest.values() if e.entity == "photo" and e.op == delta_sync.OP_DELETE and e.work_id in visible),
+            "inspections": sorted(e.entity_id for e in latest.values() if e.entity == "inspection" and e.op == delta_sync.OP_DELETE and e.work_id in visible),
+        },
+        "removed": sorted(scope_changes - visible),
+    }
+
+@router.get("/offline/bundle")
+def get_offline_bundle(
+    request: Request,
+    officer_id: Optional[int] = None,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Download the officer's offline bundle (gzip-compressed SQLite, see offline_bundle).
+    Officers get their own; admin may pass officer_id. The ETag is the data
+    version, so a client that already has the current bundle gets a 304.
+    """
+    user_id = current_user.id
+    if officer_id is not None and officer_id != current_user.id:
+        if current_user.role != "admin":
+            raise HTTPException(status_code=403, detail="Only admin can download bundles for other officers")
+        if not db.query(models.User.id).filter(models.User.id == officer_id).first():
+            raise HTTPException(status_code=404, detail="Officer not found")
+        user_id = officer_id
+
+    try:
+        path, version = offline_bundle.build(db, user_id)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Bundle build failed: {str(e)}")
+
+    etag = f'"bundle-{user_id}-{version}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "X-Bundle-Version": str(version)}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="application/gzip", filename=f"offline-bundle-{user_id}.sqlite.gz", headers=headers)
+
 @router.get("/works/{work_id}/timeline")
-async def get_work_timeline(
+def get_work_timeline(
     work_id: int,
     db: Session = Depends(get_db)
 ):
@@ -1063,7 +1526,7 @@ class AssignRequest(BaseModel):
     deadline_days: Optional[int] = None
 
 @router.post("/works/{work_id}/assign")
-async def assign_work(
+def assign_work(
     work_id: int,
     payload: AssignRequest,
     current_user: models.User = Depends(auth.get_current_user),
@@ -1116,7 +1579,7 @@ class AdminUpdate(BaseModel):
     user_remark: Optional[str] = None
 
 @router.put("/works/{work_id}/admin")
-async def update_work_admin(
+def update_work_admin(
     work_id: int,
     update: AdminUpdate,
     db: Session = Depends(get_db),
@@ -1158,7 +1621,7 @@ class BulkAssignRequest(BaseModel):
     max_amount: Optional[str] = None
 
 @router.put("/works/bulk-assign")
-async def bulk_assign_works(
+def bulk_assign_works(
     req: BulkAssignRequest,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
@@ -1240,7 +1703,7 @@ async def bulk_assign_works(
     return {"message": msg}
 
 @router.post("/works/admin/auto-assign")
-async def bulk_auto_assign_system(
+def bulk_auto_assign_system(
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -1308,7 +1771,7 @@ async def bulk_auto_assign_system(
 # =============================================
 
 @router.post("/works/{work_id}/photos")
-async def upload_work_photos(
+def upload_work_photos(
     work_id: int,
     photos: List[UploadFile] = File(...),
     category: str = Form("During"),
@@ -1327,40 +1790,186 @@ async def upload_work_photos(
     if not auth.check_work_access(current_user, work):
         raise HTTPException(status_code=403, detail="You don't have access to this work")
     
+    # Decode / resize / encode in the image process pool, all photos in parallel, before
+    # anything is written (no write lock held meanwhile). Byte-identical re-uploads reuse
+    # the stored files instead of being processed again.
+    files = [(photo.file.read(), photo.filename) for photo in photos]
+    try:
+        prepared = photo_store.prepare_uploads(db, files)
+    except image_utils.ImagePoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    stored = photo_store.attach_uploads(db, work_id, prepared, range(len(files)), current_user.username, caption=caption, category=category)
+
     results = []
-    for photo in photos:
-        try:
-            file_bytes = await photo.read()
-            full_path, thumb_path = image_utils.process_upload(file_bytes, photo.filename)
-            
-            new_photo = models.WorkPhoto(
-                work_id=work_id,
-                image_path=full_path,
-                thumbnail_path=thumb_path,
-                caption=caption,
-                category=category,
-                uploaded_by=current_user.username
-            )
-            db.add(new_photo)
-            db.flush()
-            
-            results.append({
-                "id": new_photo.id,
-                "image_path": full_path,
-                "thumbnail_path": thumb_path,
-                "size_kb": round(image_utils.get_file_size_kb(full_path), 1)
-            })
-        except Exception as e:
+    for photo, result in zip(photos, stored):
+        if isinstance(result, Exception):
             import traceback
-            traceback.print_exc()
-            results.append({"error": f"Failed to process {photo.filename}: {str(e)}"})
+            traceback.print_exception(result)
+            results.append({"error": f"Failed to process {photo.filename}: {str(result)}"})
+            continue
+        new_photo = result["photo"]
+        results.append({
+            "id": new_photo.id,
+            "image_path": new_photo.image_path,
+            "thumbnail_path": new_photo.thumbnail_path,
+            "size_kb": round(image_utils.get_file_size_kb(new_photo.image_path), 1),
+            "duplicate": result["duplicate"],
+            "near_duplicate_of": result["near_duplicate_of"],
+            **photo_variant_fields(new_photo, new_photo.variants)
+        })
     
     db.commit()
     return {"message": f"Uploaded {len([r for r in results if 'id' in r])} photo(s)", "photos": results}
 
 
+# --- Resumable photo uploads ---
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+    category: str = "During"
+    caption: str = ""
+
+def upload_session_status(session: models.UploadSession) -> dict:
+    return {
+        "id": session.id,
+        "work_id": session.work_id,
+        "filename": session.filename,
+        "size": session.size,
+        "offset": session.size if session.status == upload_sessions.STATUS_DONE else upload_sessions.received(session.id),
+        "status": session.status,
+        "photo_id": session.photo_id,
+        "chunk_size": upload_sessions.CHUNK_SIZE,
+    }
+
+def get_upload_session(db: Session, session_id: str, user: models.User) -> models.UploadSession:
+    session = db.query(models.UploadSession).filter(models.UploadSession.id == session_id).first()
+    if not session or (session.user_id != user.id and user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+@router.post("/works/{work_id}/photo-uploads")
+def create_photo_upload(
+    work_id: int,
+    req: UploadSessionCreate,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Start a resumable photo upload; PUT the bytes to /photo-uploads/{id} in chunks, then finalize."""
+    work = db.query(models.Work).filter(models.Work.id == work_id).first()
+    if not work:
+        raise HTTPException(status_code=404, detail="Work not found")
+    if not auth.check_work_access(current_user, work):
+        raise HTTPException(status_code=403, detail="You don't have access to this work")
+    try:
+        session = upload_sessions.create(
+            db, current_user.id, work_id, req.filename, req.size, req.sha256, req.category, req.caption
+        )
+    except upload_sessions.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    db.commit()
+    return upload_session_status(session)
+
+@router.get("/photo-uploads/{session_id}")
+def get_photo_upload(
+    session_id: str,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload progress: `offset` is where the next chunk must start."""
+    return upload_session_status(get_upload_session(db, session_id, current_user))
+
+@router.put("/photo-uploads/{session_id}")
+async def put_photo_upload_chunk(
+    session_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Append the raw request body at `offset`. Returns the new offset; on 409 the
+    response's offset says where to resume.
+    """
+    from starlette.requests import ClientDisconnect
+
+    # async to read the body stream; the session lookup goes to the threadpool
+    session = await run_in_threadpool(get_upload_session, db, session_id, current_user)
+    if session.status != upload_sessions.STATUS_OPEN:
+        raise HTTPException(status_code=409, detail={"message": "Upload already finalized", "offset": session.size})
+    size = session.size
+    db.close()  # don't hold a connection while a slow client streams the chunk
+
+    try:
+        new_offset = await upload_sessions.write_chunk(session_id, size, offset, request.stream())
+    except upload_sessions.OffsetMismatch as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.offset})
+    except upload_sessions.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ClientDisconnect:
+        # Whatever arrived is on disk; the client resumes from GET /photo-uploads/{id}
+        return Response(status_code=499)
+    return {"id": session_id, "offset": new_offset, "size": size, "complete": new_offset == size}
+
+@router.post("/photo-uploads/{session_id}/finalize")
+def finalize_photo_upload(
+    session_id: str,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Check the assembled file and store it as a work photo (image pipeline, dedup). Safe to repeat."""
+    session = get_upload_session(db, session_id, current_user)
+    if session.status == upload_sessions.STATUS_DONE:
+        photo = db.query(models.WorkPhoto).filter(models.WorkPhoto.id == session.photo_id).first()
+        return {**upload_session_status(session), "photo": photo and {
+            "id": photo.id, "image_path": photo.image_path, "thumbnail_path": photo.thumbnail_path,
+            **photo_variant_fields(photo, photo.variants)
+        }}
+
+    try:
+        data = upload_sessions.read_complete(session)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": upload_sessions.received(session.id)})
+
+    try:
+        stored = photo_store.store_uploads(
+            db, session.work_id, [(data, session.filename)], current_user.username,
+            caption=session.caption, category=session.category
+        )
+    except image_utils.ImagePoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    result = stored[0]
+    if isinstance(result, Exception):
+        db.rollback()
+        raise HTTPException(status_code=422, detail=f"Failed to process {session.filename}: {result}")
+
+    photo = result["photo"]
+    session.status = upload_sessions.STATUS_DONE
+    session.photo_id = photo.id
+    session.updated_at = datetime.utcnow()
+    db.commit()
+    upload_sessions.discard(session.id)
+    return {**upload_session_status(session), "photo": {
+        "id": photo.id, "image_path": photo.image_path, "thumbnail_path": photo.thumbnail_path,
+        "duplicate": result["duplicate"], "near_duplicate_of": result["near_duplicate_of"],
+        **photo_variant_fields(photo, photo.variants)
+    }}
+
+@router.delete("/photo-uploads/{session_id}")
+def cancel_photo_upload(
+    session_id: str,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    session = get_upload_session(db, session_id, current_user)
+    upload_sessions.discard(session.id)
+    db.delete(session)
+    db.commit()
+    return {"message": "Upload cancelled"}
+
+
 @router.get("/works/{work_id}/photos")
-async def get_work_photos(
+def get_work_photos(
     work_id: int,
     category: Optional[str] = None,
     db: Session = Depends(get_db)
@@ -1375,6 +1984,11 @@ async def get_work_photos(
         query = query.filter(models.WorkPhoto.category == category)
     
     photos = query.order_by(models.WorkPhoto.uploaded_at.desc()).all()
+    variants_map = photo_variants_map(db, [p.id for p in photos])
+    near_duplicates = dict(db.query(models.PhotoDuplicate.photo_id, models.PhotoDuplicate.duplicate_of_id).filter(
+        models.PhotoDuplicate.work_id == work_id,
+        models.PhotoDuplicate.reviewed == False
+    ).all())
     
     # Build base URL for serving
     return [
@@ -1385,18 +1999,70 @@ async def get_work_photos(
             "caption": p.caption,
             "category": p.category,
             "uploaded_by": p.uploaded_by,
-            "uploaded_at": p.uploaded_at.isoformat() if p.uploaded_at else None
+            "uploaded_at": p.uploaded_at.isoformat() if p.uploaded_at else None,
+            "near_duplicate_of": near_duplicates.get(p.id),
+            **photo_variant_fields(p, variants_map.get(p.id, []))
         }
         for p in photos
     ]
 
 
+def stored_variant(db: Session, photo_id: int, width: int, fmt: str, version: Optional[str] = None) -> tuple:
+    """(path of the stored variant, None), or (None, full image to render it from) if it has none."""
+    photo = db.query(models.WorkPhoto).filter(models.WorkPhoto.id == photo_id).first()
+    if not photo or (version is not None and version != photo_version(photo.image_path)):
+        # A versioned URL of a deleted photo must not serve whatever now has its id
+        raise HTTPException(status_code=404, detail="Photo not found")
+
+    stored = next((v for v in photo.variants if v.width == width and v.format == fmt), None)
+    if stored and os.path.exists(stored.path):
+        return stored.path, None
+    if not photo.image_path or not os.path.exists(photo.image_path):
+        raise HTTPException(status_code=404, detail="Photo file not found")
+    return None, photo.image_path
+
+@router.get("/photos/{photo_id}/variant")
+async def get_photo_variant(
+    photo_id: int,
+    width: int,
+    format: str = "webp",
+    v: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    One size/format of a photo. Stored ladder variants are served directly;
+    anything else allowed is rendered from the full image on first request
+    and cached on disk. Responses are immutable only for URLs carrying the
+    photo's content version `v` (see photo_variant_fields): photo ids are
+    reused after a delete, so an id alone must be revalidated.
+    """
+    import variant_cache
+
+    fmt = format.lower()
+    if width not in image_utils.VARIANT_WIDTHS or fmt not in image_utils.VARIANT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Allowed widths: {image_utils.VARIANT_WIDTHS}, formats: {image_utils.VARIANT_FORMATS}")
+
+    # async to share in-flight renders (variant_cache); the lookup goes to the threadpool
+    path, source = await run_in_threadpool(stored_variant, db, photo_id, width, fmt, v)
+    if path is None:
+        try:
+            path = await variant_cache.get_variant(source, width, fmt)
+        except image_utils.ImagePoolBusy as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    return FileResponse(
+        path,
+        media_type=f"image/{fmt}",
+        headers={"Cache-Control": "public, max-age=31536000, immutable" if v else "no-cache"}
+    )
+
+
 class PhotoUpdate(BaseModel):
     caption: Optional[str] = None
     category: Optional[str] = None
 
 @router.patch("/works/{work_id}/photos/{photo_id}")
-async def update_work_photo(
+def update_work_photo(
     work_id: int,
     photo_id: int,
     update: PhotoUpdate,
@@ -1431,8 +2097,18 @@ async def update_work_photo(
 class DeleteRequest(BaseModel):
     admin_password: str
 
+def verify_admin_password(db: Session, current_user: models.User, password: str):
+    """Confirm a destructive admin action with the admin's password; bcrypt runs in the bounded hash pool."""
+    hashed_password = db.query(models.User.hashed_password).filter(models.User.id == current_user.id).scalar()
+    try:
+        valid = auth.verify_password_pooled(password, hashed_password)
+    except auth.PasswordHashBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid admin password")
+
 @router.delete("/works/{work_id}/photos/{photo_id}")
-async def delete_work_photo(
+def delete_work_photo(
     work_id: int,
     photo_id: int,
     req: DeleteRequest,
@@ -1444,8 +2120,7 @@ async def delete_work_photo(
         raise HTTPException(status_code=403, detail="Only admin can delete photos")
     
     # Verify password
-    if not auth.verify_password(req.admin_password, current_user.hashed_password):
-        raise HTTPException(status_code=401, detail="Invalid admin password")
+    verify_admin_password(db, current_user, req.admin_password)
 
     photo = db.query(models.WorkPhoto).filter(
         models.WorkPhoto.id == photo_id,
@@ -1455,20 +2130,15 @@ async def delete_work_photo(
     if not photo:
         raise HTTPException(status_code=404, detail="Photo not found")
     
-    # Delete files from disk
-    for path in [photo.image_path, photo.thumbnail_path]:
-        if path and os.path.exists(path):
-            try:
-                os.remove(path)
-            except OSError:
-                pass
-    
-    db.delete(photo)
+    # Delete the record, and its files unless another photo shares them -
+    # only once the deletion is committed
+    paths = photo_store.delete_photo(db, photo)
     db.commit()
+    photo_store.remove_files(db, paths)
     return {"message": "Photo deleted"}
 
 @router.delete("/works/{work_id}/inspections/{inspection_id}")
-async def delete_inspection(
+def delete_inspection(
     work_id: int,
     inspection_id: int,
     req: DeleteRequest,
@@ -1480,8 +2150,7 @@ async def delete_inspection(
         raise HTTPException(status_code=403, detail="Only admin can delete inspections")
     
     # Verify password
-    if not auth.verify_password(req.admin_password, current_user.hashed_password):
-        raise HTTPException(status_code=401, detail="Invalid admin password")
+    verify_admin_password(db, current_user, req.admin_password)
 
     inspection = db.query(models.Inspection).filter(
         models.Inspection.id == inspection_id,
@@ -1494,12 +2163,186 @@ async def delete_inspection(
     # Optionally delete photos associated only with this inspection? 
     # Current WorkPhoto model doesn't strictly have an inspection_id, 
     # but let's just delete the record for now per user request.
+    db.query(models.GpsAnomaly).filter(models.GpsAnomaly.inspection_id == inspection_id).delete()
     
     db.delete(inspection)
     db.commit()
     return {"message": "Inspection deleted"}
 
 
+# =============================================
+# GPS ANOMALIES - Inspection location checks
+# =============================================
+
+@router.get("/inspections/gps-anomalies")
+def list_gps_anomalies(
+    work_id: Optional[int] = None,
+    block: Optional[List[str]] = Query(None),
+    reason: Optional[List[str]] = Query(None),
+    reviewed: Optional[bool] = None,
+    skip: int = 0,
+    limit: int = 100,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """List flagged inspection locations. Admin only."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    query = db.query(models.GpsAnomaly, models.Inspection, models.Work).join(
+        models.Inspection, models.Inspection.id == models.GpsAnomaly.inspection_id
+    ).join(
+        models.Work, models.Work.id == models.GpsAnomaly.work_id
+    )
+    if work_id is not None:
+        query = query.filter(models.GpsAnomaly.work_id == work_id)
+    if block:
+        query = query.filter(models.Work.block.in_(block))
+    if reason:
+        query = query.filter(models.GpsAnomaly.reason.in_(reason))
+    if reviewed is not None:
+        query = query.filter(models.GpsAnomaly.reviewed == reviewed)
+
+    rows = query.order_by(models.GpsAnomaly.flagged_at.desc(), models.GpsAnomaly.id.desc()).offset(skip).limit(limit).all()
+    return [
+        {
+            "id": a.id,
+            "inspection_id": a.inspection_id,
+            "work_id": a.work_id,
+            "work_code": w.work_code,
+            "block": w.block,
+            "panchayat": w.panchayat,
+            "inspector": i.inspector_name,
+            "inspection_date": i.inspection_date.isoformat() if i.inspection_date else None,
+            "reason": a.reason,
+            "severity": gps_check.SEVERITY.get(a.reason, gps_check.SEVERITY_HIGH),
+            "latitude": a.latitude,
+            "longitude": a.longitude,
+            "distance_work_km": a.distance_work_km,
+            "distance_gp_km": a.distance_gp_km,
+            "distance_block_km": a.distance_block_km,
+            "reviewed": a.reviewed,
+            "flagged_at": a.flagged_at.isoformat() if a.flagged_at else None
+        }
+        for a, i, w in rows
+    ]
+
+
+@job_queue.handler("gps_scan")
+def run_gps_scan_job(db: Session, payload: dict) -> dict:
+    result = gps_check.scan_inspections(db)
+    return {"message": f"Scanned {result['scanned']} inspections, flagged {result['flagged']}", **result}
+
+@router.post("/inspections/gps-anomalies/scan", status_code=202)
+def scan_gps_anomalies(
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue a re-check of every inspection's location and a rebuild of the anomaly table. Admin only."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    job = job_queue.enqueue(db, "gps_scan", user_id=current_user.id, dedupe_key="gps_scan")
+    return {"message": "GPS scan started", "job": job_queue.public(job)}
+
+
+@router.patch("/inspections/gps-anomalies/{anomaly_id}")
+def review_gps_anomaly(
+    anomaly_id: int,
+    reviewed: bool = True,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Mark a flagged location as reviewed. Admin only."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    anomaly = db.query(models.GpsAnomaly).filter(models.GpsAnomaly.id == anomaly_id).first()
+    if not anomaly:
+        raise HTTPException(status_code=404, detail="Anomaly not found")
+
+    anomaly.reviewed = reviewed
+    db.commit()
+    return {"message": "Anomaly updated", "id": anomaly.id, "reviewed": anomaly.reviewed}
+
+
+# =============================================
+# BACKGROUND JOBS
+# =============================================
+
+@job_queue.handler("geocode_works", priority=job_queue.PRIORITY_LOW)
+def run_geocode_job(db: Session, payload: dict) -> dict:
+    import ingester
+    result = ingester.geocode_missing(db, payload.get("limit"))
+    return {"message": f"Located {result['located']} of {result['panchayats']} panchayats ({result['works']} works)", **result}
+
+@job_queue.handler("photo_variants", priority=job_queue.PRIORITY_LOW)
+def run_photo_variants_job(db: Session, payload: dict) -> dict:
+    try:
+        result = photo_store.backfill_variants(db)
+    except image_utils.ImagePoolBusy:
+        raise job_queue.Defer(30, "image pool busy with uploads")
+    return {"message": f"Built variants for {result['built']} photos, skipped {result['skipped']}", **result}
+
+# Jobs an admin can start from POST /jobs (sheet syncs and exports have their own endpoints)
+ADMIN_JOB_KINDS = ["gps_scan", "geocode_works", "photo_variants"]
+
+class JobRequest(BaseModel):
+    kind: str
+    payload: Optional[dict] = None
+
+def get_visible_job(db: Session, job_id: int, user: models.User) -> models.Job:
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job or (user.role != "admin" and job.user_id != user.id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs")
+def list_jobs(
+    status: Optional[str] = None,
+    kind: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Background jobs, newest first: all of them for admins, otherwise the user's own."""
+    query = db.query(models.Job)
+    if current_user.role != "admin":
+        query = query.filter(models.Job.user_id == current_user.id)
+    if status:
+        query = query.filter(models.Job.status == status)
+    if kind:
+        query = query.filter(models.Job.kind == kind)
+    return [job_queue.public(job) for job in query.order_by(models.Job.id.desc()).limit(limit).all()]
+
+@router.post("/jobs", status_code=202)
+def create_job(
+    req: JobRequest,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue a maintenance job (kind: gps_scan | geocode_works | photo_variants). Admin only."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if req.kind not in ADMIN_JOB_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unsupported kind. Use one of: {', '.join(ADMIN_JOB_KINDS)}")
+    # One of each kind at a time; a queued or running one is returned instead
+    job = job_queue.enqueue(db, req.kind, req.payload, user_id=current_user.id, dedupe_key=req.kind)
+    return job_queue.public(job)
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: int, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    return job_queue.public(get_visible_job(db, job_id, current_user))
+
+@router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: int, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    """Cancel a job that has not started yet."""
+    job = get_visible_job(db, job_id, current_user)
+    if not job_queue.cancel(db, job):
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return job_queue.public(job)
+
+
 # =============================================
 # USER MANAGEMENT - CRUD
 # =============================================
@@ -1524,7 +2367,7 @@ class UserUpdate(BaseModel):
 
 
 @router.get("/users")
-async def list_users(
+def list_users(
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -1549,8 +2392,14 @@ async def list_users(
     ]
 
 
+def pooled_password_hash(password: str) -> str:
+    try:
+        return auth.get_password_hash_pooled(password)
+    except auth.PasswordHashBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
+
 @router.post("/users")
-async def create_user(
+def create_user(
     user_data: UserCreate,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
@@ -1566,7 +2415,7 @@ async def create_user(
     
     new_user = models.User(
         username=user_data.username,
-        hashed_password=auth.get_password_hash(user_data.password),
+        hashed_password=pooled_password_hash(user_data.password),
         role=user_data.role,
         department=user_data.department,
         allowed_blocks=user_data.allowed_blocks,
@@ -1581,7 +2430,7 @@ async def create_user(
 
 
 @router.put("/users/{user_id}")
-async def update_user(
+def update_user(
     user_id: int,
     user_data: UserUpdate,
     current_user: models.User = Depends(auth.get_current_user),
@@ -1608,14 +2457,20 @@ async def update_user(
     if user_data.is_active is not None:
         user.is_active = user_data.is_active
     if user_data.new_password:
-        user.hashed_password = auth.get_password_hash(user_data.new_password)
+        user.hashed_password = pooled_password_hash(user_data.new_password)
     
+    # Outstanding access tokens carry the old role/scope: make clients refresh them.
+    # A deactivated account or a new password also ends its refresh tokens.
+    auth.revoke_access_tokens(db, user.id)
+    if not user.is_active or user_data.new_password:
+        auth.revoke_refresh_tokens(db, user.id)
     db.commit()
+    auth.invalidate_user(user.username)
     return {"message": f"User '{user.username}' updated"}
 
 
 @router.delete("/users/{user_id}")
-async def delete_user(
+def delete_user(
     user_id: int,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
@@ -1632,6 +2487,9 @@ async def delete_user(
         raise HTTPException(status_code=400, detail="Cannot deactivate the admin account")
     
     user.is_active = False
+    auth.revoke_access_tokens(db, user.id)
+    auth.revoke_refresh_tokens(db, user.id)
     db.commit()
+    auth.invalidate_user(user.username)
     return {"message": f"User '{user.username}' deactivated"}
 
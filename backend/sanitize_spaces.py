@@ -1,4 +1,6 @@
-import models, database
+import models, database, rollups
+import data_version  # registers the version-bump session events
+import delta_sync  # registers the change-log session events
 from sqlalchemy import func
 
 def sanitize():
@@ -33,6 +35,9 @@ def sanitize():
             if u.allowed_panchayats: u.allowed_panchayats = u.allowed_panchayats.replace(chr(160), ' ')
 
         db.commit()
+
+        # Block/panchayat names are rollup keys
+        rollups.rebuild(db)
         print("Sanitization complete.")
     except Exception as e:
         db.rollback()
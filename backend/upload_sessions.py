@@ -0,0 +1,173 @@
+"""
+Resumable photo uploads for poor connectivity.
+
+Instead of one multipart request that has to be resent from scratch when the
+connection drops, the client:
+
+1. creates a session (declared size, optional SHA-256),
+2. PUTs the bytes in chunks, each at the offset the server reports,
+3. finalizes, which hands the assembled file to the image pipeline.
+
+Chunks are streamed straight into DATA_DIR/upload_sessions/<id>.part, never
+held in memory, so the part file's size *is* the resume offset: after a drop
+the client asks for the offset and continues from there. Sessions idle for
+longer than UPLOAD_SESSION_TTL_HOURS are garbage-collected with their files.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+import models
+from database import DATA_DIR
+
+SESSION_DIR = os.path.join(DATA_DIR, "upload_sessions")
+MAX_UPLOAD_BYTES = int(os.environ.get("UPLOAD_MAX_MB", "30")) * 1024 * 1024
+SESSION_TTL = timedelta(hours=int(os.environ.get("UPLOAD_SESSION_TTL_HOURS", "72")))
+CHUNK_SIZE = 256 * 1024  # suggested to clients: small enough to finish between 2G drop-outs
+
+STATUS_OPEN = "open"
+STATUS_DONE = "done"
+
+_locks = {}  # session id -> asyncio.Lock, so two PUTs never interleave writes to one file (flock across processes)
+
+
+class OffsetMismatch(Exception):
+    """A chunk was sent for an offset past what the server has; `offset` is where to resume."""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Expected offset <= {offset}")
+        self.offset = offset
+
+
+class ChunkInProgress(OffsetMismatch):
+    """Another worker process is still writing a chunk of this upload; retry from `offset`."""
+
+    def __init__(self, offset: int):
+        Exception.__init__(self, "Another chunk of this upload is still being written")
+        self.offset = offset
+
+
+class UploadTooLarge(Exception):
+    """More bytes were sent than the session declared."""
+
+
+def part_path(session_id: str) -> str:
+    return os.path.join(SESSION_DIR, f"{session_id}.part")
+
+
+def received(session_id: str) -> int:
+    """Bytes stored so far, i.e. the offset to resume from."""
+    try:
+        return os.path.getsize(part_path(session_id))
+    except OSError:
+        return 0
+
+
+def create(db: Session, user_id: int, work_id: int, filename: str, size: int, sha256: str = None,
+           category: str = "During", caption: str = None) -> models.UploadSession:
+    if size <= 0 or size > MAX_UPLOAD_BYTES:
+        raise UploadTooLarge(f"Size must be between 1 and {MAX_UPLOAD_BYTES} bytes")
+    os.makedirs(SESSION_DIR, exist_ok=True)
+    session = models.UploadSession(
+        id=uuid.uuid4().hex, user_id=user_id, work_id=work_id, filename=filename, size=size,
+        sha256=sha256.lower() if sha256 else None, category=category, caption=caption, status=STATUS_OPEN
+    )
+    db.add(session)
+    open(part_path(session.id), "wb").close()
+    return session
+
+
+async def write_chunk(session_id: str, size: int, offset: int, chunks) -> int:
+    """
+    Write the async byte iterator `chunks` at `offset` and return the new offset.
+
+    `offset` may be below what is stored (the client resends data whose
+    acknowledgement it missed); the file is cut back to it first. Bytes
+    streamed before a dropped connection stay on disk and count.
+
+    Raises:
+        OffsetMismatch if `offset` is past the stored bytes (ChunkInProgress if
+        another process is writing to the session),
+        UploadTooLarge if the chunk would go past the declared `size` (the chunk is discarded).
+    """
+    lock = _locks.setdefault(session_id, asyncio.Lock())
+    async with lock:
+        current = received(session_id)
+        if offset > current:
+            raise OffsetMismatch(current)
+        with open(part_path(session_id), "r+b") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)  # released when the file is closed
+            except BlockingIOError:
+                raise ChunkInProgress(current)
+            f.seek(offset)
+            f.truncate()
+            position = offset
+            try:
+                async for chunk in chunks:
+                    if position + len(chunk) > size:
+                        f.truncate(offset)
+                        raise UploadTooLarge(f"Upload exceeds the declared size of {size} bytes")
+                    f.write(chunk)
+                    position += len(chunk)
+            finally:
+                f.flush()
+        return position
+
+
+def read_complete(session: models.UploadSession) -> bytes:
+    """
+    The assembled upload.
+
+    Raises:
+        ValueError if bytes are missing or the SHA-256 does not match.
+    """
+    have = received(session.id)
+    if have != session.size:
+        raise ValueError(f"Upload incomplete: {have} of {session.size} bytes received")
+    with open(part_path(session.id), "rb") as f:
+        data = f.read()
+    if session.sha256 and hashlib.sha256(data).hexdigest() != session.sha256:
+        raise ValueError("Checksum mismatch: the uploaded bytes differ from the declared sha256")
+    return data
+
+
+def discard(session_id: str):
+    _locks.pop(session_id, None)
+    try:
+        os.remove(part_path(session_id))
+    except OSError:
+        pass
+
+
+def gc(db: Session) -> int:
+    """
+    Delete sessions (and part files) idle for longer than SESSION_TTL - open
+    ones by their last chunk, finished ones by their finalize time - plus part
+    files left without a session. Returns the number of sessions removed.
+    """
+    cutoff = datetime.utcnow() - SESSION_TTL
+    removed = 0
+    for session in db.query(models.UploadSession).filter(models.UploadSession.updated_at < cutoff).all():
+        path = part_path(session.id)
+        if session.status == STATUS_OPEN and os.path.exists(path) and \
+                datetime.utcfromtimestamp(os.path.getmtime(path)) >= cutoff:
+            continue  # still receiving chunks
+        discard(session.id)
+        db.delete(session)
+        removed += 1
+    db.commit()
+
+    if os.path.isdir(SESSION_DIR):
+        known = {row[0] for row in db.query(models.UploadSession.id).all()}
+        for name in os.listdir(SESSION_DIR):
+            path = os.path.join(SESSION_DIR, name)
+            if name.split(".")[0] not in known and datetime.utcfromtimestamp(os.path.getmtime(path)) < cutoff:
+                os.remove(path)
+    return removed
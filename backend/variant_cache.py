@@ -0,0 +1,61 @@
+"""
+On-demand photo variants with a size-bounded disk cache.
+
+Photos uploaded before the responsive ladder existed (or sizes added to
+IMAGE_VARIANT_WIDTHS later) have no stored variants. Instead of re-processing
+the archive, a variant is rendered from the stored full image the first time
+it is requested, in the image process pool, and kept here. Concurrent first
+requests for the same variant share one render. Files are evicted least
+recently used first (mtime is touched on every hit) once the cache exceeds
+VARIANT_CACHE_MAX_MB.
+"""
+
+import asyncio
+import os
+
+import image_utils
+from database import DATA_DIR
+from disk_cache import DiskCache
+
+CACHE_DIR = os.path.join(DATA_DIR, "variant_cache")
+MAX_CACHE_BYTES = int(os.environ.get("VARIANT_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+_cache = DiskCache(CACHE_DIR, MAX_CACHE_BYTES)
+_in_flight = {}  # cache path -> Future of the render producing it (event loop only)
+
+
+def cache_path(src: str, width: int, fmt: str) -> str:
+    """Cache file for `src` at `width` in `fmt`; changes whenever the source file changes."""
+    return _cache.path_for(src, width, fmt, extension=image_utils.VARIANT_EXTENSIONS[fmt])
+
+
+async def get_variant(src: str, width: int, fmt: str) -> str:
+    """
+    Path of the cached variant, rendering it first if needed.
+
+    Raises:
+        FileNotFoundError if `src` is missing, ImagePoolBusy if the pool queue is full.
+    """
+    path = cache_path(src, width, fmt)
+    if _cache.hit(path):
+        return path
+
+    future = _in_flight.get(path)
+    if future is None:
+        future = asyncio.ensure_future(_render(src, path, width, fmt))
+        _in_flight[path] = future
+        future.add_done_callback(lambda _: _in_flight.pop(path, None))
+    # shield: one client disconnecting must not cancel the render the others wait for
+    await asyncio.shield(future)
+    return path
+
+
+async def _render(src: str, path: str, width: int, fmt: str):
+    size = await image_utils.render_variant_async(src, path, width, fmt)
+    # The first size count and eviction walk the whole cache: keep them off the event loop
+    await asyncio.to_thread(_cache.added, size, keep=path)
+
+
+def evict():
+    """Trim the cache to its size limit now (also happens automatically as variants are added)."""
+    _cache.evict()
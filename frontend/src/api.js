@@ -15,13 +15,44 @@ api.interceptors.request.use(
     },
     (error) => Promise.reject(error)
 );
+// Access tokens are short-lived: exchange the refresh token for a new pair.
+// Concurrent 401s share one refresh request (a refresh token is single-use).
+let refreshing = null;
+const refreshTokens = () => {
+    if (!refreshing) {
+        const refreshToken = localStorage.getItem('refresh_token');
+        refreshing = (refreshToken
+            ? axios.post(`${api.defaults.baseURL}/token/refresh`, { refresh_token: refreshToken }).then(({ data }) => {
+                localStorage.setItem('token', data.access_token);
+                localStorage.setItem('refresh_token', data.refresh_token);
+                localStorage.setItem('role', data.role);
+                return data.access_token;
+            })
+            : Promise.reject(new Error('No refresh token'))
+        ).finally(() => { refreshing = null; });
+    }
+    return refreshing;
+};
+
 // Add a response interceptor to handle 401 errors
 api.interceptors.response.use(
     (response) => response,
-    (error) => {
+    async (error) => {
+        const original = error.config;
+        if (error.response && error.response.status === 401 && original && !original._retried && !original.url.endsWith('/token')) {
+            original._retried = true;
+            try {
+                const token = await refreshTokens();
+                original.headers.Authorization = `Bearer ${token}`;
+                return api(original);
+            } catch (refreshError) {
+                // Refresh token expired or revoked: fall through to the login page
+            }
+        }
         if (error.response && error.response.status === 401) {
             // Token expired or invalid
             localStorage.removeItem('token');
+            localStorage.removeItem('refresh_token');
             localStorage.removeItem('user');
             // Only redirect if not already on login page to avoid loops
             if (!window.location.pathname.includes('/login')) {
@@ -39,9 +39,10 @@ export const AuthProvider = ({ children }) => {
                     'Content-Type': 'application/x-www-form-urlencoded'
                 }
             });
-            const { access_token, role, id, allowed_agencies } = response.data;
+            const { access_token, refresh_token, role, id, allowed_agencies } = response.data;
 
             localStorage.setItem('token', access_token);
+            localStorage.setItem('refresh_token', refresh_token);
             localStorage.setItem('role', role);
             if (id) localStorage.setItem('user_id', id);
             if (allowed_agencies) localStorage.setItem('allowed_agencies', allowed_agencies);
@@ -61,7 +62,12 @@ export const AuthProvider = ({ children }) => {
     };
 
     const logout = () => {
+        const refreshToken = localStorage.getItem('refresh_token');
+        if (refreshToken) {
+            api.post('/logout', { refresh_token: refreshToken }).catch(() => {});
+        }
         localStorage.removeItem('token');
+        localStorage.removeItem('refresh_token');
         localStorage.removeItem('role');
         localStorage.removeItem('user_id');
         localStorage.removeItem('allowed_agencies');
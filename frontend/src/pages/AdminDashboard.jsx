@@ -399,7 +399,14 @@ const AdminDashboard = () => {
             if (!useDefault && sheetUrl) formData.append('sheet_url', sheetUrl);
 
             const res = await api.post('/works/sync-sheet', formData);
-            alert(res.data.message);
+            // The sync runs as a background job: poll it until it finishes
+            let job = res.data.job;
+            while (job.status === 'queued' || job.status === 'running') {
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                job = (await api.get(`/jobs/${job.id}`)).data;
+            }
+            if (job.status !== 'done') throw new Error(job.error || `Sync ${job.status}`);
+            alert(job.result.message);
             setSyncModalOpen(false);
             setSheetUrl('');
             fetchWorks();